@@ -0,0 +1,137 @@
+"""
+Admission control benchmark
+
+Simulates the availability endpoint behind `ratelimit.AdmissionMiddleware` with a
+database that can only serve a few queries at a time, then measures the
+latency of well-behaved clients while one abusive client hammers the
+endpoint with high concurrency. Runs once with admission disabled and
+once enabled.
+
+Usage (from backend/):
+    python benchmarks/admission.py
+    python benchmarks/admission.py --duration 10 --abusive-rps 2000
+"""
+import argparse
+import asyncio
+import ipaddress
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from fastapi import FastAPI
+
+import ratelimit
+
+DB_CAPACITY = 8          # consultas simultâneas que o "banco" aguenta
+DB_QUERY_SECONDS = 0.005
+
+
+def build_app(enabled: bool) -> FastAPI:
+    ratelimit.ENABLED = enabled
+    # O cliente ASGI conecta de 127.0.0.1 e manda Fly-Client-IP como o proxy
+    ratelimit.TRUSTED_PROXIES = [ipaddress.ip_network("127.0.0.1")]
+    ratelimit.memory_store = ratelimit.MemoryBucketStore()
+    ratelimit.limiter = ratelimit.ConcurrencyLimiter(
+        ratelimit.MAX_CONCURRENT, ratelimit.MAX_QUEUE, ratelimit.QUEUE_TIMEOUT
+    )
+
+    app = FastAPI()
+    app.add_middleware(ratelimit.AdmissionMiddleware)
+    ratelimit.protect("GET", "/api/availability/", ratelimit.AVAILABILITY_IP)
+    database = asyncio.Semaphore(DB_CAPACITY)
+
+    @app.get("/api/availability/")
+    async def availability():
+        # blocked_dates + working_hours + appointments
+        for _ in range(3):
+            async with database:
+                await asyncio.sleep(DB_QUERY_SECONDS)
+        return {"available_times": []}
+
+    return app
+
+
+async def legit_client(client, ip: str, stop: float, latencies: list, rps: float):
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        response = await client.get(
+            "/api/availability/", headers={"fly-client-ip": ip}
+        )
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(max(0.0, 1 / rps - (time.perf_counter() - start)))
+
+
+async def abusive_worker(client, stop: float, counters: dict, interval: float):
+    # Taxa fixa por worker: cliente e servidor dividem o mesmo event loop
+    # aqui, então um loop fechado mediria só a CPU do próprio cliente
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        response = await client.get(
+            "/api/availability/", headers={"fly-client-ip": "203.0.113.66"}
+        )
+        counters[response.status_code] = counters.get(response.status_code, 0) + 1
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(enabled: bool, args):
+    app = build_app(enabled)
+    transport = httpx.ASGITransport(app=app)
+    latencies, counters = [], {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        stop = time.perf_counter() + args.duration
+        tasks = [
+            legit_client(client, f"198.51.100.{i}", stop, latencies, args.legit_rps)
+            for i in range(args.legit_clients)
+        ]
+        if args.abusive_concurrency:
+            tasks += [
+                abusive_worker(
+                    client, stop, counters,
+                    args.abusive_concurrency / args.abusive_rps
+                )
+                for _ in range(args.abusive_concurrency)
+            ]
+        await asyncio.gather(*tasks)
+
+    label = "admission on " if enabled else "admission off"
+    print(
+        f"{label}: legit n={len(latencies):5d} "
+        f"p50={statistics.median(latencies) * 1000:7.1f} ms "
+        f"p99={percentile(latencies, 0.99) * 1000:7.1f} ms | "
+        f"abusive responses {dict(sorted(counters.items()))}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Admission control benchmark")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--legit-clients", type=int, default=10)
+    parser.add_argument("--legit-rps", type=float, default=2.0)
+    parser.add_argument("--abusive-concurrency", type=int, default=100)
+    parser.add_argument("--abusive-rps", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    baseline = argparse.Namespace(**{**vars(args), "abusive_concurrency": 0})
+    print("baseline (no abusive client):")
+    asyncio.run(run(True, baseline))
+    print(
+        f"\nwith abusive client ({args.abusive_concurrency} concurrent, "
+        f"{args.abusive_rps:.0f} req/s):"
+    )
+    asyncio.run(run(False, args))
+    asyncio.run(run(True, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Archival benchmark
+
+Seeds a multi-year dataset (see benchmarks/reports.py), times the hot-path
+queries, archives everything older than ARCHIVE_HORIZON_DAYS and times the
+same queries again.
+
+Requires a MongoDB. Uses the BENCH_DB_NAME database, never production.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/archive.py
+    ARCHIVE_HORIZON_DAYS=180 python benchmarks/archive.py --appointments 500000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from benchmarks.reports import seed
+from routes import archive, clients, reports
+from storage import Repository, get_storage, init_storage
+from storage.mongo import MongoStorage
+from storage.scoped import ScopedDatabase
+
+
+async def measure(label: str, call, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - t0)
+    print(f"  {label:<45} median {statistics.median(samples) * 1000:7.2f} ms")
+
+
+async def hot_path(db, repeat: int):
+    today = date.today()
+    month_ago = (today - timedelta(days=30)).isoformat()
+
+    await measure(
+        "get_appointments (last 30 days)",
+        lambda: Repository(get_storage()).find_appointments(
+            date_from=month_ago, date_to=today.isoformat(), limit=100
+        ),
+        repeat
+    )
+    await measure(
+        "get_appointments status=pending (no range)",
+        lambda: Repository(get_storage()).find_appointments(status="pending", limit=100),
+        repeat
+    )
+    await measure(
+        "count_documents status=pending",
+        lambda: db.appointments.count_documents({"status": "pending"}),
+        repeat
+    )
+    await measure(
+        "slot conflict lookup (date, time)",
+        lambda: db.appointments.find_one({
+            "date": today.isoformat(), "time": "10:00",
+            "status": {"$ne": "cancelled"}
+        }),
+        repeat
+    )
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    # run_archival percorre as lojas: precisa da visão por loja
+    db = ScopedDatabase(client[os.environ.get("BENCH_DB_NAME", "primo_barber_bench")])
+
+    await db.appointments_archive.drop()
+    await seed(db, args.appointments, args.years)
+
+    init_storage(lambda shop_id: MongoStorage(db.for_shop(shop_id)), db.shops)
+    await MongoStorage(db).ensure_indexes()
+    for module in (archive, clients, reports):
+        await module.ensure_indexes(db)
+
+    print(f"\nbefore archiving ({await db.appointments.estimated_document_count()} hot):")
+    await hot_path(db, args.repeat)
+
+    t0 = time.perf_counter()
+    result = await archive.run_archival()
+    print(
+        f"\narchived {result['moved']} appointments older than "
+        f"{result['cutoff']} in {time.perf_counter() - t0:.1f}s"
+    )
+
+    print(f"\nafter archiving ({await db.appointments.estimated_document_count()} hot):")
+    await hot_path(db, args.repeat)
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archival benchmark")
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
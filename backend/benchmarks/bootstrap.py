@@ -0,0 +1,121 @@
+"""
+Booking page first render: separate requests vs /api/public/bootstrap
+
+Seeds a catalog (services with long descriptions and image URLs, settings,
+working hours, blocked dates) in the in-memory storage and compares, for
+the requests the booking page makes before its first render:
+  - before: services + settings + working hours + availability, uncompressed
+  - gzip:   the same requests with Accept-Encoding (GZipMiddleware)
+  - bundle: one /api/public/bootstrap (+ availability), pre-compressed
+  - 304:    bundle revalidated with If-None-Match
+
+Bytes are what goes over the wire; time is per page load with all of the
+page's requests issued concurrently, as a browser would.
+
+Usage (from backend/):
+    python benchmarks/bootstrap.py
+    python benchmarks/bootstrap.py --services 40 --loads 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("TELEGRAM_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import server
+from storage import get_storage
+
+LOREM = (
+    "Corte na tesoura e máquina, lavagem com shampoo especial, finalização "
+    "com pomada e toalha quente. Inclui consultoria de visagismo. "
+)
+
+
+async def seed(storage, services: int):
+    for i in range(services):
+        await storage.insert_service({
+            "id": f"svc-{i}", "name": f"Serviço {i}", "description": LOREM * 4,
+            "price": 40.0 + i, "duration": "45 min",
+            "image": f"https://images.example.com/primo-barber/services/{i}/cover-1200x800.jpg",
+            "active": True, "created_at": i, "updated_at": i
+        })
+    for key in ("shop_name", "address", "phone", "instagram", "booking_notice"):
+        await storage.insert_setting({
+            "id": key, "key": key, "value": f"{key} " + LOREM, "type": "string"
+        })
+    for d in range(7):
+        await storage.insert_working_hours({
+            "id": str(d), "day_of_week": d, "start_time": "09:00",
+            "end_time": "20:00", "interval_minutes": 30, "active": d != 6
+        })
+    for i in range(1, 15, 3):
+        await storage.insert_blocked_date({
+            "date": (date.today() + timedelta(days=i)).isoformat(), "reason": "Feriado"
+        })
+
+
+async def page_load(client, paths, headers) -> tuple:
+    t0 = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(p, headers=headers) for p in paths))
+    elapsed = time.perf_counter() - t0
+    wire = 0
+    for r in responses:
+        assert r.status_code in (200, 304), (r.url, r.status_code)
+        # httpx já descomprimiu: conta o que veio na rede
+        wire += int(r.headers.get("content-length") or len(r.content))
+    return elapsed, wire, responses
+
+
+async def main(args):
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    availability = f"/api/availability/?date={tomorrow}"
+    separate = ["/api/services?active=true", "/api/settings", "/api/working-hours/", availability]
+    bundled = ["/api/public/bootstrap", availability]
+
+    async with server.lifespan(server.app):
+        await seed(get_storage(), args.services)
+        transport = httpx.ASGITransport(app=server.app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            _, _, first = await page_load(client, ["/api/public/bootstrap"], {"Accept-Encoding": "gzip"})
+            etag = first[0].headers["etag"]
+
+            scenarios = [
+                ("before (4 requests)", separate, {"Accept-Encoding": "identity"}),
+                ("gzip (4 requests)", separate, {"Accept-Encoding": "gzip"}),
+                ("bundle gzip", bundled, {"Accept-Encoding": "gzip"}),
+                ("bundle br", bundled, {"Accept-Encoding": "br, gzip"}),
+                ("bundle 304", bundled, {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+            ]
+
+            print(f"{args.services} services, {args.loads} page loads\n")
+            for label, paths, headers in scenarios:
+                timings, wire = [], 0
+                for _ in range(args.loads):
+                    elapsed, wire, responses = await page_load(client, paths, headers)
+                    timings.append(elapsed)
+                encoding = responses[0].headers.get("content-encoding", "identity")
+                timings.sort()
+                print(
+                    f"{label:<20} {wire:>8} bytes  ({encoding:<8})  "
+                    f"p50 {statistics.median(timings) * 1000:6.2f} ms  "
+                    f"p99 {timings[int(len(timings) * 0.99)] * 1000:6.2f} ms"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap bundle benchmark")
+    parser.add_argument("--services", type=int, default=20)
+    parser.add_argument("--loads", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,168 @@
+"""
+Demand forecast: vectorized folding vs a per-appointment Python loop
+
+Part 1 feeds N synthetic appointments (as the storage yields them, one
+batch at a time, cycling over a pool of 200k) to forecasting.History and
+to the equivalent Python loop (parse each date/time, Counter per
+outcome/week/weekday/slot), printing throughput and peak memory.
+Part 2 runs GET /api/forecast/demand end to end on the in-memory
+storage, cold and cached.
+
+Usage (from backend/):
+    python benchmarks/forecast.py
+    python benchmarks/forecast.py --appointments 5000000 --storage-appointments 500000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("TELEGRAM_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import forecasting
+import server
+from storage import get_storage
+
+DAYS = 730
+STATUSES = ["completed"] * 7 + ["cancelled", "pending", "confirmed"]
+TIMES = [f"{h:02d}:{m:02d}" for h in range(9, 19) for m in (0, 30)]
+
+
+def appointments(n: int, today: date):
+    """Appointments on random days of the last DAYS days"""
+    rng = random.Random(42)
+    first = today - timedelta(days=DAYS - 1)
+    for i in range(n):
+        yield {
+            "id": f"a{i}",
+            "client_name": "Cliente",
+            "client_phone": "11999990000",
+            "service_id": "svc",
+            "date": (first + timedelta(days=rng.randrange(DAYS))).isoformat(),
+            "time": rng.choice(TIMES),
+            "status": rng.choice(STATUSES),
+        }
+
+
+def batches(n: int, pool: list):
+    """n appointments as storage batches, cycling over a pre-built pool"""
+    sent = 0
+    while sent < n:
+        for batch in pool:
+            batch = batch[:n - sent]
+            yield batch
+            sent += len(batch)
+            if sent >= n:
+                return
+
+
+def python_loop(history: forecasting.History, batch: list, counts: Counter):
+    """What a loop over documents does per appointment"""
+    today = history.today.isoformat()
+    for a in batch:
+        day = date.fromisoformat(a["date"])
+        offset = (day - history.origin).days
+        hour, minute = a["time"].split(":")
+        status = a["status"]
+        if status in forecasting.OPEN_STATUSES:
+            outcome = "no_show" if a["date"] < today else "upcoming"
+        else:
+            outcome = status
+        slot = (int(hour) * 60 + int(minute)) // history.slot_minutes
+        counts[(outcome, offset // 7, offset % 7, slot)] += 1
+
+
+def folding(args, today: date):
+    start = today - timedelta(days=DAYS - 1)
+    size = forecasting.FORECAST_BATCH_SIZE
+    projected = [
+        {field: a[field] for field in forecasting.FIELDS}
+        for a in appointments(min(args.appointments, 200_000), today)
+    ]
+    pool = [projected[i:i + size] for i in range(0, len(projected), size)]
+    print(f"Folding {args.appointments} appointments ({DAYS} days, batches of {size})")
+
+    def vectorized():
+        history = forecasting.History(start, today, today, 30)
+        for batch in batches(args.appointments, pool):
+            history.add(batch)
+        return history
+
+    def loop():
+        history = forecasting.History(start, today, today, 30)
+        counts = Counter()
+        for batch in batches(args.appointments, pool):
+            python_loop(history, batch, counts)
+
+    timings = {}
+    for label, fold in (("numpy History.add", vectorized), ("python loop", loop)):
+        t0 = time.perf_counter()
+        fold()
+        timings[label] = time.perf_counter() - t0
+        print(
+            f"  {label:<18} {timings[label]:6.2f} s  "
+            f"{args.appointments / timings[label] / 1e6:5.2f} M appointments/s"
+        )
+    print(f"  speedup {timings['python loop'] / timings['numpy History.add']:.1f}x")
+
+    # Memória numa passada separada (tracemalloc distorce os tempos)
+    tracemalloc.start()
+    history = vectorized()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"  numpy peak {peak / 2**20:.1f} MiB beyond the batch pool "
+        f"(counts array {history.counts.nbytes / 2**20:.1f} MiB)"
+    )
+
+
+async def end_to_end(args, today: date):
+    async with server.lifespan(server.app):
+        storage = get_storage()
+        for day in range(7):
+            await storage.insert_working_hours({
+                "id": str(day), "day_of_week": day, "start_time": "09:00",
+                "end_time": "19:00", "interval_minutes": 30, "active": True
+            })
+        # Em ordem de (data, hora) o índice em memória só cresce no fim
+        seeded = sorted(
+            appointments(args.storage_appointments, today),
+            key=lambda a: (a["date"], a["time"])
+        )
+        await storage.insert_appointments(seeded)
+        del seeded
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"\nGET /api/forecast/demand over {args.storage_appointments} appointments (memory storage)")
+            for label in ("cold", "cached"):
+                t0 = time.perf_counter()
+                response = await client.get("/api/forecast/demand", params={"weeks": 8})
+                elapsed = time.perf_counter() - t0
+                assert response.status_code == 200, response.text
+                print(f"  {label:<7} {elapsed * 1000:8.1f} ms  {len(response.content) / 1024:.0f} KiB")
+
+
+async def main(args):
+    today = date.today()
+    folding(args, today)
+    await end_to_end(args, today)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demand forecast benchmark")
+    parser.add_argument("--appointments", type=int, default=2_000_000)
+    parser.add_argument("--storage-appointments", type=int, default=200_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,135 @@
+"""
+Profiling mode overhead: disabled vs enabled vs sampled
+
+Part 1 times, per call, the hooks that stay installed while profiling is
+off (middleware, task factory, MongoDB command listener) against the
+same call without them. Part 2 runs requests end to end on the in-memory
+storage with profiling off, on (timings only) and on with every request
+sampled.
+
+Usage (from backend/):
+    python benchmarks/profiling.py
+    python benchmarks/profiling.py --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["PROFILE_DIR"] = tempfile.mkdtemp(prefix="profiles-")
+os.environ.setdefault("TELEGRAM_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import profiling
+import server
+from storage import get_storage
+
+N_MICRO = 200_000
+
+
+def per_call(fn, n=N_MICRO) -> float:
+    t0 = time.perf_counter()
+    fn(n)
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+async def app(scope, receive, send):
+    pass
+
+
+class Event:
+    connection_id = ("localhost", 27017)
+    request_id = 1
+    command_name = "find"
+    command = {"find": "appointments", "filter": {"date": "2026-01-01"}}
+    duration_micros = 500
+
+
+async def hooks():
+    profiling.configure(ENABLED=False)
+    scope = {"type": "http", "method": "GET", "path": "/"}
+    wrapped = profiling.ProfilingMiddleware(app)
+    loop = asyncio.get_running_loop()
+
+    def run_app(asgi):
+        def run(n):
+            for _ in range(n):
+                coro = asgi(scope, None, None)
+                try:
+                    coro.send(None)
+                except StopIteration:
+                    pass
+        return run
+
+    def create_tasks(n):
+        for _ in range(n):
+            loop.create_task(app(None, None, None)).cancel()
+
+    def listener(n):
+        for _ in range(n):
+            profiling.command_listener.started(Event)
+            profiling.command_listener.succeeded(Event)
+
+    print("Hooks with profiling disabled (ns per call)")
+    print(f"  ASGI call          bare {per_call(run_app(app)):7.0f}  with middleware {per_call(run_app(wrapped)):7.0f}")
+
+    bare = per_call(create_tasks, 20_000)
+    profiling.install_task_factory(loop)
+    with_factory = per_call(create_tasks, 20_000)
+    loop.set_task_factory(None)
+    print(f"  create_task        bare {bare:7.0f}  with factory    {with_factory:7.0f}")
+    print(f"  command listener   started+succeeded {per_call(listener):7.0f}")
+    await asyncio.sleep(0)
+
+
+async def end_to_end(args):
+    async with server.lifespan(server.app):
+        storage = get_storage()
+        for i in range(20):
+            await storage.insert_service({
+                "id": f"svc{i}", "name": f"Serviço {i}", "description": "",
+                "price": 50.0, "duration": "30 min", "image": "", "active": True
+            })
+        transport = httpx.ASGITransport(app=server.app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"\nGET /api/services x {args.requests} (memory storage)")
+            modes = (
+                ("disabled", {"ENABLED": False}),
+                ("enabled", {"ENABLED": True, "SAMPLE_RATE": 0.0}),
+                ("sampled 100%", {"ENABLED": True, "SAMPLE_RATE": 1.0}),
+            )
+            for label, settings in modes:
+                profiling.configure(**settings)
+                timings = []
+                for _ in range(args.requests):
+                    t0 = time.perf_counter()
+                    response = await client.get("/api/services")
+                    timings.append(time.perf_counter() - t0)
+                    assert response.status_code == 200
+                timings.sort()
+                print(
+                    f"  {label:<13} p50 {statistics.median(timings) * 1000:6.3f} ms  "
+                    f"p99 {timings[int(len(timings) * 0.99)] * 1000:6.3f} ms"
+                )
+            profiling.configure(ENABLED=False)
+
+
+async def main(args):
+    await hooks()
+    await end_to_end(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profiling overhead benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Recurring appointments: one POST per week vs POST /api/appointments/series
+
+Books the same weekly slot for a client with N separate
+POST /api/appointments calls and then with one series request, on the
+in-memory storage. Reports storage round-trips (X-DB-Queries) and time.
+A few occurrences are blocked/booked beforehand to show the conflict
+report.
+
+Usage (from backend/):
+    python benchmarks/recurring.py
+    python benchmarks/recurring.py --occurrences 52 --repeat 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("TELEGRAM_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import server
+from storage import get_storage
+
+
+async def seed(storage):
+    await storage.insert_service({
+        "id": "svc", "name": "Corte", "description": "", "price": 50.0,
+        "duration": "30 min", "image": "", "active": True
+    })
+    for d in range(7):
+        await storage.insert_working_hours({
+            "id": str(d), "day_of_week": d, "start_time": "09:00",
+            "end_time": "20:00", "interval_minutes": 30, "active": True
+        })
+
+
+async def main(args):
+    async with server.lifespan(server.app):
+        storage = get_storage()
+        await seed(storage)
+        transport = httpx.ASGITransport(app=server.app)
+        start = date.today() + timedelta(days=1)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            single, series = [], []
+            queries = {"single": 0, "series": 0}
+
+            for i in range(args.repeat):
+                # Dia/horário diferentes por rodada: nenhuma variante conflita
+                hour = 9 + i % 10
+                first = start + timedelta(days=i // 10)
+                body = {
+                    "client_name": "Cliente", "client_phone": f"1190000{i:04d}",
+                    "service_id": "svc", "date": first.isoformat()
+                }
+
+                t0 = time.perf_counter()
+                for week in range(args.occurrences):
+                    day = first + timedelta(weeks=week)
+                    response = await client.post("/api/appointments", json={
+                        **body, "date": day.isoformat(), "time": f"{hour:02d}:00"
+                    })
+                    queries["single"] += int(response.headers["x-db-queries"])
+                single.append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                response = await client.post("/api/appointments/series", json={
+                    **body, "time": f"{hour:02d}:30",
+                    "recurrence": {"freq": "weekly", "count": args.occurrences}
+                })
+                series.append(time.perf_counter() - t0)
+                assert response.status_code == 201, response.text
+                queries["series"] += int(response.headers["x-db-queries"])
+
+            print(f"{args.occurrences} weekly occurrences, {args.repeat} rounds\n")
+            for label, timings in (("one POST per week", single), ("series", series)):
+                key = "single" if label.startswith("one") else "series"
+                print(
+                    f"{label:<18} {queries[key] / args.repeat:6.0f} queries/series  "
+                    f"p50 {statistics.median(timings) * 1000:7.2f} ms"
+                )
+
+            # Conflitos: um dia bloqueado e um horário já ocupado no meio da série
+            await storage.insert_blocked_date({"date": (start + timedelta(weeks=2)).isoformat()})
+            await client.post("/api/appointments", json={
+                "client_name": "Outro", "client_phone": "11888888888", "service_id": "svc",
+                "date": (start + timedelta(weeks=5)).isoformat(), "time": "19:45"
+            })
+            response = await client.post("/api/appointments/series", json={
+                "client_name": "Cliente", "client_phone": "11999999999", "service_id": "svc",
+                "date": start.isoformat(), "time": "19:45",
+                "recurrence": {"freq": "weekly", "count": 8}
+            })
+            result = response.json()
+            print(
+                f"\nseries with conflicts: {response.status_code}, "
+                f"{len(result['created'])} created, conflicts {result['conflicts']}, "
+                f"{response.headers['x-db-queries']} queries"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recurring appointments benchmark")
+    parser.add_argument("--occurrences", type=int, default=26)
+    parser.add_argument("--repeat", type=int, default=20, help="at most 70")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""
+Reports benchmark
+
+Seeds a benchmark database with N synthetic appointments spread over
+several years (once), then times the report endpoints cold (aggregation)
+and warm (cache).
+
+Requires a MongoDB (5.0+ for $dateTrunc). Never point it at production:
+the database named by BENCH_DB_NAME is filled with fake data.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/reports.py
+    python benchmarks/reports.py --appointments 1000000 --years 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from routes import reports
+from storage import Repository
+from storage.mongo import MongoStorage
+
+SERVICES = [("svc-corte", 60.0), ("svc-barba", 50.0), ("svc-combo", 95.0)]
+STATUSES = ["pending", "confirmed", "completed", "completed", "cancelled"]
+TIMES = [f"{h:02d}:00" for h in range(9, 20)]
+
+
+async def seed(db, total: int, years: int):
+    existing = await db.appointments.estimated_document_count()
+    if existing >= total:
+        print(f"using {existing} existing appointments")
+        return
+
+    await db.appointments.drop()
+    await db.services.drop()
+    await db.working_hours.drop()
+    await db.services.insert_many([
+        {"id": sid, "name": sid, "price": price, "active": True}
+        for sid, price in SERVICES
+    ])
+    await db.working_hours.insert_many([
+        {"day_of_week": d, "start_time": "09:00", "end_time": "20:00",
+         "interval_minutes": 60, "active": True}
+        for d in range(6)
+    ])
+
+    start = date.today() - timedelta(days=365 * years)
+    days = 365 * years
+    batch = []
+    t0 = time.perf_counter()
+    for i in range(total):
+        service_id, price = random.choice(SERVICES)
+        batch.append({
+            "id": f"a{i}",
+            "client_name": "Bench",
+            "client_phone": f"11{random.randint(10**8, 10**9 - 1)}",
+            "service_id": service_id,
+            "price": price,
+            "date": (start + timedelta(days=random.randrange(days))).isoformat(),
+            "time": random.choice(TIMES),
+            "status": random.choice(STATUSES),
+            "source": random.choice(["web", "telegram"]),
+        })
+        if len(batch) == 10_000:
+            await db.appointments.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.appointments.insert_many(batch, ordered=False)
+    print(f"seeded {total} appointments in {time.perf_counter() - t0:.1f}s")
+
+
+async def timed(label: str, call):
+    t0 = time.perf_counter()
+    result = await call()
+    print(f"  {label:<40} {(time.perf_counter() - t0) * 1000:8.1f} ms")
+    return result
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.environ.get("BENCH_DB_NAME", "primo_barber_bench")]
+
+    await seed(db, args.appointments, args.years)
+    await reports.ensure_indexes(db)
+    storage = MongoStorage(db)
+
+    date_to = date.today().isoformat()
+    date_from = (date.today() - timedelta(days=365 * args.years)).isoformat()
+    print(f"range {date_from} .. {date_to}")
+
+    for bucket in ("day", "week", "month"):
+        for group_by in ("none", "service", "source"):
+            reports.invalidate()
+            await timed(
+                f"bookings bucket={bucket} group_by={group_by}",
+                lambda: reports.bookings_report(date_from, date_to, bucket, group_by, Repository(storage))
+            )
+        reports.invalidate()
+        await timed(
+            f"occupancy bucket={bucket}",
+            lambda: reports.occupancy_report(date_from, date_to, bucket, Repository(storage))
+        )
+
+    await reports.bookings_report(date_from, date_to, "month", "none", Repository(storage))
+    await timed(
+        "bookings bucket=month (cached)",
+        lambda: reports.bookings_report(date_from, date_to, "month", "none", Repository(storage))
+    )
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports benchmark")
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--years", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""
+Cold start benchmark for the Primo Barber API
+
+Reports:
+  - import time of `server` measured with `python -X importtime`
+    (total + slowest modules by cumulative time)
+  - time from process spawn to the first successful `/api/health`
+    response served by uvicorn
+
+Usage (from backend/):
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 5 --top 15
+    TELEGRAM_ENABLED=true TELEGRAM_BOT_TOKEN=x python benchmarks/startup.py
+
+MONGO_URL / DB_NAME default to dummy values: the Motor client does not
+connect until the first query, so no database is needed.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _env():
+    env = os.environ.copy()
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "primo_barber_bench")
+    # Sem bytecode em cache cada execução paga a compilação, como uma
+    # máquina nova do Fly sem `compileall` na imagem
+    if env.get("BENCH_NO_PYC"):
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def measure_imports(top: int):
+    """Run `import server` under -X importtime and parse the report"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR,
+        env=_env(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us = int(parts[0])
+            cumulative_us = int(parts[1])
+        except ValueError:
+            continue  # header
+        rows.append((cumulative_us, self_us, parts[2].strip()))
+
+    total = next((r for r in rows if r[2] == "server"), None)
+    rows.sort(reverse=True)
+    return total, rows[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_health(timeout: float = 30.0) -> float:
+    """Seconds from spawning uvicorn to the first 200 on /api/health"""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "server:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=_env(),
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving /api/health")
+            try:
+                with urllib.request.urlopen(url, timeout=0.5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError("/api/health did not answer in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, slowest = measure_imports(args.top)
+    if total:
+        print(f"import server: {total[0] / 1000:.1f} ms (cumulative)")
+    print(f"\nTop {args.top} imports by cumulative time:")
+    for cumulative_us, self_us, name in slowest:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {name}")
+
+    samples = [measure_first_health() for _ in range(args.runs)]
+    print(
+        f"\nSpawn -> first /api/health: "
+        f"median {statistics.median(samples) * 1000:.0f} ms, "
+        f"min {min(samples) * 1000:.0f} ms, max {max(samples) * 1000:.0f} ms "
+        f"({args.runs} runs)"
+    )
+
+
+if __name__ == "__main__":
+    main()
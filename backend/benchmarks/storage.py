@@ -0,0 +1,109 @@
+"""
+Storage query cost vs. collection size
+
+Seeds the in-memory backend (storage/memory.py) with growing numbers of
+appointments and times the lookups the routers make. Its indexes mirror
+the Mongo ones, so the growth here is the reference for what each query
+should cost against MongoDB: flat for slot/conflict lookups, linear only
+in the number of matches for ranges. Pass --mongo to run the same
+queries against BENCH_DB_NAME for comparison.
+
+Usage (from backend/):
+    python benchmarks/storage.py
+    python benchmarks/storage.py --sizes 1000 100000 1000000 --mongo
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage.memory import MemoryStorage
+
+SLOTS = [f"{h:02d}:{m:02d}" for h in range(9, 20) for m in (0, 30)]
+STATUSES = ["pending", "confirmed", "completed", "cancelled"]
+
+
+def appointments(n: int, today: date):
+    for _ in range(n):
+        day = today - timedelta(days=random.randrange(4 * 365))
+        yield {
+            "id": str(uuid.uuid4()),
+            "client_name": "Cliente",
+            "client_phone": f"11{random.randrange(10 ** 8):08d}",
+            "service_id": "svc",
+            "date": day.isoformat(),
+            "time": random.choice(SLOTS),
+            "status": random.choice(STATUSES),
+        }
+
+
+async def measure(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings) * 1_000_000
+
+
+async def run(storage, label: str, n: int, repeat: int):
+    today = date.today()
+    day = (today - timedelta(days=10)).isoformat()
+    month = (today - timedelta(days=30)).isoformat()
+
+    queries = {
+        "find_conflict": lambda: storage.find_conflict(day, "10:00"),
+        "booked_times": lambda: storage.booked_times(day),
+        "count status": lambda: storage.count_appointments(status="pending"),
+        "last 30 days": lambda: storage.find_appointments(date_from=month, limit=100),
+        "status+range": lambda: storage.find_appointments(
+            status="completed", date_from=month, limit=1000
+        ),
+    }
+
+    results = [f"{label:>6} n={n:<9}"]
+    for name, fn in queries.items():
+        results.append(f"{name} {await measure(fn, repeat):8.1f}µs")
+    print("  ".join(results))
+
+
+async def main(args):
+    today = date.today()
+
+    for n in args.sizes:
+        memory = MemoryStorage()
+        t0 = time.perf_counter()
+        for doc in appointments(n, today):
+            await memory.insert_appointment(doc)
+        seeded = time.perf_counter() - t0
+        await run(memory, "memory", n, args.repeat)
+        print(f"{'':>6} seeded in {seeded:.2f}s")
+
+        if args.mongo:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            from storage.mongo import MongoStorage
+
+            client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+            db = client[os.environ.get("BENCH_DB_NAME", "primo_barber_bench")]
+            await db.appointments.drop()
+            await db.appointments.insert_many(list(memory.appointments.docs.values()))
+            mongo = MongoStorage(db)
+            await mongo.ensure_indexes()
+            await run(mongo, "mongo", n, args.repeat)
+            client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storage query cost")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--mongo", action="store_true")
+    asyncio.run(main(parser.parse_args()))
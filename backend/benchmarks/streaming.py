@@ -0,0 +1,83 @@
+"""
+Peak memory of a list response: materialized vs streamed
+
+Encodes every appointment of the in-memory storage as a JSON array twice:
+the old way (fetch the whole list, validate, serialize in one go) and with
+streaming.json_array over iter_appointments. Reports tracemalloc peaks for
+growing sizes: the materialized peak grows with n, the streamed one stays
+around one chunk (streaming.CHUNK_SIZE).
+
+Usage (from backend/):
+    python benchmarks/streaming.py
+    python benchmarks/streaming.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+
+from models import Appointment
+from storage.memory import MemoryStorage
+from streaming import json_array
+
+
+def appointments(n: int):
+    start = date.today() - timedelta(days=365)
+    for i in range(n):
+        yield {
+            "id": f"{i:08d}", "client_name": f"Cliente {i}",
+            "client_phone": f"11{i:08d}", "service_id": "svc",
+            "date": (start + timedelta(days=i % 365)).isoformat(),
+            "time": f"{9 + i % 10:02d}:00", "status": "confirmed"
+        }
+
+
+async def materialized(storage) -> int:
+    found = await storage.find_appointments(limit=0)
+    body = json.dumps(jsonable_encoder([Appointment(**a) for a in found])).encode()
+    return len(body)
+
+
+async def streamed(storage) -> int:
+    size = 0
+    async for chunk in json_array(storage.iter_appointments(), Appointment):
+        size += len(chunk)  # Chunk enviado e descartado, como no socket
+    return size
+
+
+async def measure(fn, storage):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = await fn(storage)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+async def main(args):
+    for n in args.sizes:
+        storage = MemoryStorage()
+        await storage.insert_appointments(list(appointments(n)))
+
+        print(f"n={n}")
+        for label, fn in (("materialized", materialized), ("streamed", streamed)):
+            size, peak, elapsed = await measure(fn, storage)
+            print(
+                f"  {label:<13} body {size / 1e6:7.2f} MB  "
+                f"peak {peak / 1e6:8.2f} MB  {elapsed:6.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List streaming memory benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,163 @@
+"""
+Telegram webhook replay
+
+Replays the recorded booking conversation in benchmarks/data/
+telegram_updates.json for many chats at once against the real app, with a
+stub Telegram Bot API (httpx.MockTransport) and a share of duplicated
+deliveries. Reports webhook ack latency, time to drain the queues and how
+many appointments were booked.
+
+Uses the BENCH_DB_NAME MongoDB database (dropped/seeded here), or no
+database at all with STORAGE_BACKEND=memory.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/telegram_replay.py
+    STORAGE_BACKEND=memory python benchmarks/telegram_replay.py --chats 500 --duplicates 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "primo_barber_bench")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "stub")
+os.environ.setdefault("ARCHIVE_ENABLED", "false")
+os.environ["TELEGRAM_WEBHOOK_SECRET"] = "replay-secret"
+
+import httpx
+
+import server
+import telegram_client
+from routes import telegram
+from storage import get_storage
+
+RECORDED = BACKEND_DIR / "benchmarks" / "data" / "telegram_updates.json"
+SERVICE_ID = "svc-replay"
+SLOTS = [f"{h:02d}:00" for h in range(9, 20)]
+
+
+def render(template, values):
+    if isinstance(template, dict):
+        return {k: render(v, values) for k, v in template.items()}
+    if isinstance(template, list):
+        return [render(v, values) for v in template]
+    if template == "{chat_id}":
+        return values["chat_id"]
+    if isinstance(template, str):
+        return template.format_map(values)
+    return template
+
+
+async def seed(db, storage):
+    if db is not None:
+        for name in ("appointments", "services", "working_hours", "blocked_dates",
+                     "clients", "telegram_updates", "telegram_sessions"):
+            await db[name].drop()
+    await storage.insert_service({
+        "id": SERVICE_ID, "name": "Corte", "description": "", "price": 60.0,
+        "duration": "45 min", "image": "", "active": True
+    })
+    for d in range(7):
+        await storage.insert_working_hours({
+            "id": str(d), "day_of_week": d, "start_time": "09:00",
+            "end_time": "20:00", "interval_minutes": 60, "active": True
+        })
+
+
+def stub_telegram() -> dict:
+    calls = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        method = request.url.path.rsplit("/", 1)[-1]
+        calls[method] = calls.get(method, 0) + 1
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+    telegram_client.set_client(
+        httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    return calls
+
+
+async def main(args):
+    recorded = json.loads(RECORDED.read_text())
+    today = date.today()
+
+    async with server.lifespan(server.app):
+        storage = get_storage()
+        await seed(server.app.state.db, storage)
+        calls = stub_telegram()
+
+        transport = httpx.ASGITransport(app=server.app)
+        latencies = []
+        update_id = 0
+
+        async def post(update):
+            t0 = time.perf_counter()
+            response = await client.post("/api/telegram/webhook", json=update)
+            latencies.append(time.perf_counter() - t0)
+            response.raise_for_status()
+
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://replay",
+            headers={"X-Telegram-Bot-Api-Secret-Token": os.environ["TELEGRAM_WEBHOOK_SECRET"]}
+        ) as client:
+            started = time.perf_counter()
+
+            # Um passo da conversa por vez para todos os chats: preserva a
+            # ordem dentro de cada chat, como o Telegram faria
+            for step in recorded:
+                batch = []
+                for i in range(args.chats):
+                    update_id += 1
+                    chat_id = 100_000 + i
+                    update = {"update_id": update_id, **render(step, {
+                        "chat_id": chat_id,
+                        "callback_id": f"cb{update_id}",
+                        "service_id": SERVICE_ID,
+                        "date": (today + timedelta(days=i % 7)).isoformat(),
+                        "time": SLOTS[(i // 7) % len(SLOTS)],
+                    })}
+                    batch.append(update)
+                    if random.random() < args.duplicates:
+                        batch.append(update)
+                await asyncio.gather(*(post(u) for u in batch))
+
+            acked = time.perf_counter()
+            await telegram.drain()
+            drained = time.perf_counter()
+            pipeline = telegram.queue_stats()
+
+        booked = sum(
+            1 for a in await storage.find_appointments(limit=0)
+            if a.get("source") == "telegram"
+        )
+
+    latencies.sort()
+    print(f"updates posted:   {len(latencies)} ({args.chats} chats, "
+          f"{args.duplicates:.0%} duplicated)")
+    print(f"ack latency:      p50 {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"all acked in:     {acked - started:.2f}s "
+          f"({len(latencies) / (acked - started):.0f} updates/s)")
+    print(f"queues drained:   {drained - started:.2f}s")
+    print(f"pipeline stats:   {pipeline}")
+    print(f"stub API calls:   {calls}")
+    print(f"booked:           {booked} (capacity {7 * len(SLOTS)} slots)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telegram webhook replay")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    asyncio.run(main(parser.parse_args()))
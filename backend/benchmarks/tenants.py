@@ -0,0 +1,119 @@
+"""
+Multi-tenant mode: 1 shop vs 100 shops on one deployment
+
+Seeds every shop with services, working hours and a few appointments,
+then sends the same availability requests either all to one shop or
+round-robin over every shop (X-Shop-Id header). Prints p50/p99 latency,
+storage queries per request and the per-shop catalog cache stats: with
+TENANT_CACHE_SIZE >= shops the catalog cache keeps every shop warm.
+
+Usage (from backend/):
+    python benchmarks/tenants.py
+    TENANT_CACHE_SIZE=50 python benchmarks/tenants.py --shops 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("TELEGRAM_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import server
+import tenancy
+from storage import get_storage
+from storage.repository import _catalogs
+
+DAYS = 14
+
+
+def shop_ids(n: int) -> list:
+    return [f"shop-{i:03d}" for i in range(n)]
+
+
+async def seed(shop_id: str, today: date):
+    storage = get_storage(shop_id)
+    for i in range(20):
+        await storage.insert_service({
+            "id": f"svc{i}", "name": f"Serviço {i}", "description": "",
+            "price": 50.0, "duration": "30 min", "image": "", "active": True
+        })
+    for day in range(7):
+        await storage.insert_working_hours({
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "19:00", "interval_minutes": 30, "active": True
+        })
+    for d in range(DAYS):
+        for hour in range(9, 19, 2):
+            await storage.insert_appointment({
+                "id": f"{shop_id}-{d}-{hour}", "client_name": "Cliente",
+                "client_phone": "11999990000", "service_id": "svc0",
+                "date": (today + timedelta(days=d)).isoformat(),
+                "time": f"{hour:02d}:00", "status": "confirmed"
+            })
+
+
+async def run(client, shops: list, requests: int, today: date) -> dict:
+    _catalogs.hits = _catalogs.misses = 0
+    timings, queries = [], 0
+    for i in range(requests):
+        day = (today + timedelta(days=i % DAYS)).isoformat()
+        t0 = time.perf_counter()
+        response = await client.get(
+            "/api/availability/",
+            params={"date": day},
+            headers={"X-Shop-Id": shops[i % len(shops)]}
+        )
+        timings.append(time.perf_counter() - t0)
+        assert response.status_code == 200, response.text
+        queries += int(response.headers.get("x-db-queries", 0))
+    timings.sort()
+    return {
+        "p50": statistics.median(timings) * 1000,
+        "p99": timings[int(len(timings) * 0.99)] * 1000,
+        "queries": queries / requests,
+        "cache": _catalogs.stats(),
+    }
+
+
+async def main(args):
+    today = date.today() + timedelta(days=1)
+    async with server.lifespan(server.app):
+        shops = shop_ids(args.shops)
+        # Equivale a SHOP_IDS=shop-000,shop-001,...
+        tenancy.SHOP_IDS.update(shops)
+        for shop_id in shops:
+            await seed(shop_id, today)
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(
+                f"GET /api/availability x {args.requests} (memory storage, "
+                f"catalog cache {_catalogs.size} shops)"
+            )
+            for label, targets in (("1 shop", shops[:1]), (f"{args.shops} shops", shops)):
+                # Aquecimento: cada (loja, dia) uma vez
+                await run(client, targets, len(targets) * DAYS, today)
+                result = await run(client, targets, args.requests, today)
+                cache = result["cache"]
+                print(
+                    f"  {label:<10} p50 {result['p50']:6.3f} ms  p99 {result['p99']:6.3f} ms  "
+                    f"queries/req {result['queries']:4.2f}  "
+                    f"catalog hits {cache['hits']} misses {cache['misses']} shops {cache['size']}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-tenant benchmark")
+    parser.add_argument("--shops", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
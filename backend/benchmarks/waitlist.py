@@ -0,0 +1,105 @@
+"""
+Waitlist matcher cost vs. waitlist size
+
+Seeds BENCH_DB_NAME.waitlist with growing numbers of waiting entries
+spread over 60 days and measures the matcher's claim query (the one run
+per cancellation): latency and the executionStats of its plan. Keys and
+documents examined stay constant as the waitlist grows: the query is an
+equality prefix on the "match" index plus its created_at order.
+
+Requires a MongoDB.
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/waitlist.py
+    python benchmarks/waitlist.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+SLOTS = [f"{h:02d}:00" for h in range(9, 20)]
+
+
+def entries(n: int, today: date):
+    created = datetime.utcnow()
+    for i in range(n):
+        start = random.randrange(len(SLOTS))
+        yield {
+            "id": str(uuid.uuid4()),
+            "client_name": f"Cliente {i}",
+            "client_phone": f"11{i:08d}",
+            "telegram_chat_id": i,
+            "service_id": "svc",
+            "date": (today + timedelta(days=random.randrange(60))).isoformat(),
+            "slots": SLOTS[start:start + random.randint(1, 4)],
+            "status": "waiting",
+            "created_at": created + timedelta(milliseconds=i),
+        }
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.environ.get("BENCH_DB_NAME", "primo_barber_bench")]
+    today = date.today()
+
+    from routes import waitlist
+    from storage import Repository
+    from storage.mongo import MongoStorage
+    repo = Repository(MongoStorage(db))
+
+    for n in args.sizes:
+        await db.waitlist.drop()
+        await waitlist.ensure_indexes(db)
+        batch = list(entries(n, today))
+        for i in range(0, n, 10_000):
+            await db.waitlist.insert_many(batch[i:i + 10_000])
+
+        timings = []
+        for _ in range(args.repeat):
+            day = (today + timedelta(days=random.randrange(60))).isoformat()
+            slot = random.choice(SLOTS)
+            t0 = time.perf_counter()
+            # Mesma consulta do matcher; status volta a waiting para não esvaziar a fila
+            entry = await waitlist._claim(repo, day, slot)
+            timings.append(time.perf_counter() - t0)
+            if entry:
+                await db.waitlist.update_one({"id": entry["id"]}, {"$set": {"status": "waiting"}})
+
+        explain = await db.command({
+            "explain": {
+                "find": "waitlist",
+                "filter": {"status": "waiting", "date": today.isoformat(), "slots": "10:00"},
+                "sort": {"created_at": 1},
+                "limit": 1
+            },
+            "verbosity": "executionStats"
+        })
+        stats = explain["executionStats"]
+        timings.sort()
+        print(
+            f"n={n:<8} claim p50 {statistics.median(timings) * 1000:6.2f} ms  "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1000:6.2f} ms  "
+            f"keys examined {stats['totalKeysExamined']}  "
+            f"docs examined {stats['totalDocsExamined']}"
+        )
+
+    await db.waitlist.drop()
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Waitlist matcher benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
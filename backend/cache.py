@@ -0,0 +1,73 @@
+"""
+Small in-process LRU cache with per-entry TTL, shared by the modules that
+keep derived data in memory (reports, idempotency, ...).
+"""
+from collections import OrderedDict
+import asyncio
+import time
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key: Hashable, value: Any):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._items.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]):
+        """Drop every key matching `predicate` (e.g. one shop's entries)"""
+        for key in [k for k in self._items if predicate(k)]:
+            del self._items[key]
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+class LockPool:
+    """asyncio.Lock per key, LRU over `size` keys (locks in use are kept)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._locks: "OrderedDict[Hashable, asyncio.Lock]" = OrderedDict()
+
+    def __getitem__(self, key: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._locks.move_to_end(key)
+        if len(self._locks) > self.size:
+            for idle in [k for k, l in self._locks.items() if not l.locked() and k != key]:
+                del self._locks[idle]
+                if len(self._locks) <= self.size:
+                    break
+        return lock
+
+    def __len__(self) -> int:
+        return len(self._locks)
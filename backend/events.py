@@ -0,0 +1,31 @@
+"""
+Eventos de escrita emitidos pela camada de dados (storage.Repository).
+
+Projeções e caches (clients, reports, ...) se inscrevem aqui em vez de
+serem chamados diretamente pelos routers. Falha de um assinante é logada
+e nunca derruba a escrita que a originou.
+"""
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+import logging
+
+logger = logging.getLogger("primo-barber.events")
+
+# (old, new): documento antes/depois da escrita, None quando não existe
+APPOINTMENT_CHANGED = "appointment_changed"
+# (collection): services, settings, working_hours ou blocked_dates
+CATALOG_CHANGED = "catalog_changed"
+
+_handlers: Dict[str, List[Callable[..., Awaitable[None]]]] = defaultdict(list)
+
+
+def subscribe(event: str, handler: Callable[..., Awaitable[None]]):
+    _handlers[event].append(handler)
+
+
+async def emit(event: str, *args):
+    for handler in _handlers[event]:
+        try:
+            await handler(*args)
+        except Exception:
+            logger.exception("Handler %s failed for %s", handler.__qualname__, event)
@@ -0,0 +1,319 @@
+"""
+Occupancy and demand forecast over the appointment history (NumPy).
+
+The history is streamed from the storage in batches of FORECAST_BATCH_SIZE
+appointments projected to date/time/status, and each batch is folded into
+one counts array
+
+    counts[outcome, week, weekday, slot]
+
+with whole-batch NumPy operations (no per-appointment Python besides
+reading the three fields). Memory depends on the range and the slot size,
+never on the number of appointments.
+
+Outcomes: completed, cancelled, no-show (dated before today and still
+pending/confirmed) and upcoming (pending/confirmed from today on).
+Capacity uses the *current* working hours and the blocked dates.
+
+The forecast is seasonal naive per (weekday, slot): an exponentially
+weighted level over past weeks (FORECAST_ALPHA), scaled by how the same
+week of last year compared to the weeks behind the level. Without a year
+of history the scale is the linear trend of the last TREND_WEEKS weeks.
+"""
+from datetime import date, timedelta
+from operator import itemgetter
+from typing import List, Optional
+import os
+
+import numpy as np
+
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "5000"))
+# Peso da semana mais recente no nível (o resto decai geometricamente)
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.3"))
+TREND_WEEKS = 12
+SEASON_WEEKS = 52
+
+FIELDS = ["date", "time", "status"]
+
+OUTCOMES = ("completed", "cancelled", "no_show", "upcoming")
+COMPLETED, CANCELLED, NO_SHOW, UPCOMING = range(len(OUTCOMES))
+OPEN_STATUSES = ["pending", "confirmed"]
+# Status -> desfecho; pendentes/confirmados no passado viram NO_SHOW em add()
+# (held e desconhecidos ficam de fora)
+STATUS_OUTCOMES = {
+    "completed": COMPLETED,
+    "cancelled": CANCELLED,
+    **{status: UPCOMING for status in OPEN_STATUSES},
+}
+
+_date, _time = itemgetter("date"), itemgetter("time")
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _dates(values) -> np.ndarray:
+    """ISO dates -> datetime64[D] (NaT when malformed)"""
+    try:
+        return np.array(values, dtype="datetime64[D]")
+    except ValueError:
+        # Lote com alguma data inválida: só ele paga a conversão um a um
+        return np.array([_date_or_nat(v) for v in values], dtype="datetime64[D]")
+
+
+def _date_or_nat(value) -> np.datetime64:
+    try:
+        return np.datetime64(value, "D")
+    except (ValueError, TypeError):
+        return np.datetime64("NaT")
+
+
+def _minutes(times) -> np.ndarray:
+    """"HH:MM" strings -> minutes since midnight (-1 when malformed)"""
+    try:
+        encoded = np.array(times, dtype="S5")
+    except UnicodeEncodeError:
+        encoded = np.array(
+            [t if isinstance(t, str) and t.isascii() else "" for t in times],
+            dtype="S5"
+        )
+    chars = encoded.view(np.uint8).reshape(-1, 5)
+    digits = chars[:, [0, 1, 3, 4]].astype(np.int32) - ord("0")
+    minutes = (digits[:, 0] * 10 + digits[:, 1]) * 60 + digits[:, 2] * 10 + digits[:, 3]
+    valid = (chars[:, 2] == ord(":")) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    return np.where(valid, minutes, -1)
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return np.divide(num, den, out=np.full(np.broadcast(num, den).shape, np.nan), where=den > 0)
+
+
+def _grid(values: np.ndarray, digits: int = 4) -> list:
+    """2-D array -> nested lists, NaN as None"""
+    return np.where(np.isnan(values), None, np.round(values, digits)).tolist()
+
+
+class History:
+    """Appointment counts per outcome × week × weekday × slot"""
+
+    def __init__(self, start: date, end: date, today: date, slot_minutes: int):
+        self.start = start
+        self.end = end
+        self.today = today
+        self.slot_minutes = slot_minutes
+        self.slots = MINUTES_PER_DAY // slot_minutes
+        # Semanas começam na segunda: offset % 7 é o dia da semana
+        self.origin = start - timedelta(days=start.weekday())
+        self.weeks = (end - self.origin).days // 7 + 1
+        self.counts = np.zeros((len(OUTCOMES), self.weeks, 7, self.slots), dtype=np.int64)
+        self.rows = 0
+        self._flat = self.counts.reshape(-1)
+        self._origin = np.datetime64(self.origin, "D")
+        self._today = np.datetime64(today, "D")
+
+    def add(self, batch: List[dict]):
+        """Fold one storage batch into the counts"""
+        # O único trabalho por agendamento em Python: ler as três colunas
+        days = _dates(list(map(_date, batch)))
+        minutes = _minutes(list(map(_time, batch)))
+        outcome = np.array(
+            [STATUS_OUTCOMES.get(a.get("status"), -1) for a in batch],
+            dtype=np.int64
+        )
+        outcome[(outcome == UPCOMING) & (days < self._today)] = NO_SHOW
+
+        # Datas inválidas (NaT) viram um offset negativo e ficam de fora
+        offset = (days - self._origin).astype(np.int64)
+        valid = (outcome >= 0) & (minutes >= 0) & (minutes < MINUTES_PER_DAY) \
+            & (offset >= 0) & (offset < self.weeks * 7)
+
+        index = ((outcome * self.weeks + offset // 7) * 7 + offset % 7) * self.slots \
+            + minutes // self.slot_minutes
+        np.add.at(self._flat, index[valid], 1)
+        self.rows += len(batch)
+
+    # =========================
+    # Capacidade
+    # =========================
+
+    def slots_per_day(self, working_hours: List[dict]) -> np.ndarray:
+        """Bookable start times per (weekday, slot) with the current working hours"""
+        per_day = np.zeros((7, self.slots))
+        for wh in working_hours:
+            if not wh.get("active", True):
+                continue
+            # Expedientes inválidos (dia, horários ou intervalo) não têm capacidade
+            day, interval = wh.get("day_of_week"), wh.get("interval_minutes", 30)
+            if day not in range(7) or not isinstance(interval, int) or interval <= 0:
+                continue
+            start, end = _minutes([wh.get("start_time"), wh.get("end_time")])
+            if start < 0 or end < 0:
+                continue
+            starts = np.arange(start, min(end, MINUTES_PER_DAY), interval)
+            np.add.at(per_day[day], starts // self.slot_minutes, 1)
+        return per_day
+
+    def _days(self, first_week: int, weeks: int) -> np.ndarray:
+        return self._origin + 7 * first_week + np.arange(weeks * 7)
+
+    def open_days(self, blocked_dates: List[str], first_week: int = 0,
+                  weeks: Optional[int] = None) -> np.ndarray:
+        """(week, weekday) -> day not blocked"""
+        weeks = self.weeks if weeks is None else weeks
+        days = self._days(first_week, weeks)
+        return ~np.isin(days, np.array(blocked_dates, dtype="datetime64[D]")).reshape(weeks, 7)
+
+    def in_range(self) -> np.ndarray:
+        """(week, weekday) -> day inside [start, end]"""
+        days = self._days(0, self.weeks)
+        return ((days >= np.datetime64(self.start, "D"))
+                & (days <= np.datetime64(self.end, "D"))).reshape(self.weeks, 7)
+
+    # =========================
+    # Resultado
+    # =========================
+
+    def report(self, working_hours: List[dict], blocked_dates: List[str],
+               horizon: int, min_demand: float) -> dict:
+        counts = self.counts
+        booked = counts[[COMPLETED, NO_SHOW, UPCOMING]].sum(axis=0)
+        past = counts[[COMPLETED, NO_SHOW]].sum(axis=0)
+        per_day = self.slots_per_day(working_hours)
+        is_open = self.open_days(blocked_dates) & self.in_range()
+        open_per_weekday = is_open.sum(axis=0)[:, None]
+
+        heatmaps = {
+            "bookings_per_day": _ratio(booked.sum(axis=0), open_per_weekday),
+            "occupancy": _ratio(booked.sum(axis=0), open_per_weekday * per_day),
+            "cancel_rate": _ratio(counts[CANCELLED].sum(axis=0), (booked + counts[CANCELLED]).sum(axis=0)),
+            "no_show_rate": _ratio(counts[NO_SHOW].sum(axis=0), past.sum(axis=0)),
+        }
+        forecast, expected = self._forecast(booked, is_open, blocked_dates, horizon)
+
+        # Só a faixa de horários com agendamentos ou expediente
+        used = np.flatnonzero(counts.sum(axis=(0, 1, 2)) + per_day.sum(axis=0))
+        lo, hi = (used[0], used[-1] + 1) if len(used) else (0, 0)
+        labels = [
+            f"{m // 60:02d}:{m % 60:02d}"
+            for m in range(lo * self.slot_minutes, hi * self.slot_minutes, self.slot_minutes)
+        ]
+
+        return {
+            "date_from": self.start.isoformat(),
+            "date_to": self.end.isoformat(),
+            "slot_minutes": self.slot_minutes,
+            "appointments": int(self.rows),
+            "slots": labels,
+            "totals": {name: int(counts[i].sum()) for i, name in enumerate(OUTCOMES)},
+            "heatmaps": {name: _grid(values[:, lo:hi]) for name, values in heatmaps.items()},
+            "forecast": {
+                "weeks": forecast,
+                "expected_per_day": _grid(expected[:, lo:hi], 3),
+                "suggested_hours": self._suggest(expected, min_demand),
+            },
+        }
+
+    def _forecast(self, booked: np.ndarray, is_open: np.ndarray,
+                  blocked_dates: List[str], horizon: int):
+        """Expected bookings per day for the `horizon` weeks after today's"""
+        past = (self._days(0, self.weeks) < self._today).reshape(self.weeks, 7)
+        seen = (is_open & past).astype(float)
+
+        # Nível: média exponencial por (dia da semana, slot) sobre os dias vistos
+        current = (self.today - self.origin).days // 7
+        age = np.maximum(current - np.arange(self.weeks), 0)
+        seen_weights = ((1 - FORECAST_ALPHA) ** age)[:, None] * seen
+        level = _ratio(
+            np.einsum("wd,wds->ds", seen_weights, booked),
+            seen_weights.sum(axis=0)[:, None]
+        )
+
+        # Demanda média por dia aberto em cada semana (NaN sem dias vistos)
+        weekly = _ratio(np.einsum("wd,wds->w", seen, booked), seen.sum(axis=1))
+        week_weights = seen_weights.sum(axis=1)
+        targets = current + 1 + np.arange(horizon)
+        scale = self._seasonal(weekly, week_weights, targets)
+        if scale is None:
+            scale = self._trend(weekly, week_weights, targets)
+
+        open_ahead = self.open_days(blocked_dates, first_week=current + 1, weeks=horizon)
+        level = np.nan_to_num(level)
+        expected = level[None] * scale[:, None, None] * open_ahead[:, :, None]
+
+        weeks = [
+            {
+                "week_start": (self.origin + timedelta(weeks=int(t))).isoformat(),
+                "expected_bookings": round(float(expected[h].sum()), 1),
+                "scale": round(float(scale[h]), 4),
+            }
+            for h, t in enumerate(targets)
+        ]
+        return weeks, level * scale.mean()
+
+    @staticmethod
+    def _seasonal(weekly: np.ndarray, weights: np.ndarray, targets: np.ndarray):
+        """Last year's target week over last year's level weeks (None without a year)"""
+        if len(weekly) <= SEASON_WEEKS + 1:
+            return None
+        # Média móvel de 3 semanas: feriados isolados não viram sazonalidade
+        padded = np.pad(weekly, 1, constant_values=np.nan)
+        window = np.stack([padded[:-2], padded[1:-1], padded[2:]])
+        known = ~np.isnan(window)
+        smooth = _ratio(np.where(known, window, 0).sum(axis=0), known.sum(axis=0))
+
+        # Semanas do nível, um ano antes, com os mesmos pesos
+        last_year = smooth[:-SEASON_WEEKS]
+        lag_weights = np.where(np.isnan(last_year), 0, weights[SEASON_WEEKS:])
+        if not lag_weights.any():
+            return None
+        reference = np.nansum(last_year * lag_weights) / lag_weights.sum()
+
+        lagged = targets - SEASON_WEEKS
+        inside = (lagged >= 0) & (lagged < len(smooth))
+        values = np.full(len(targets), np.nan)
+        values[inside] = smooth[lagged[inside]]
+        if reference <= 0 or np.isnan(values).any():
+            return None
+        return values / reference
+
+    @staticmethod
+    def _trend(weekly: np.ndarray, weights: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """Linear trend of the last TREND_WEEKS weeks, relative to the level's center of mass"""
+        x = np.flatnonzero(~np.isnan(weekly))[-TREND_WEEKS:]
+        if len(x) < 4:
+            return np.ones(len(targets))
+        slope, intercept = np.polyfit(x, weekly[x], 1)
+        center = np.average(np.arange(len(weekly)), weights=weights)
+        base = intercept + slope * center
+        if base <= 0:
+            return np.ones(len(targets))
+        return np.maximum(0.0, (intercept + slope * targets) / base)
+
+    def _suggest(self, expected: np.ndarray, min_demand: float) -> list:
+        """Per weekday, first/last slot with expected demand >= min_demand"""
+        suggestions = []
+        for day, row in enumerate(expected):
+            busy = np.flatnonzero(row >= min_demand)
+            if not len(busy):
+                suggestions.append({"day_of_week": day, "start_time": None, "end_time": None})
+                continue
+            start, end = busy[0] * self.slot_minutes, (busy[-1] + 1) * self.slot_minutes
+            suggestions.append({
+                "day_of_week": day,
+                "start_time": f"{start // 60:02d}:{start % 60:02d}",
+                "end_time": f"{end // 60:02d}:{end % 60:02d}",
+            })
+        return suggestions
+
+
+async def build(repo, start: date, end: date, today: date, slot_minutes: int,
+                horizon: int, min_demand: float) -> dict:
+    """Stream the history of [start, end] and compute heatmaps + forecast"""
+    history = History(start, end, today, slot_minutes)
+    async for batch in repo.iter_appointment_batches(
+        FIELDS, start.isoformat(), end.isoformat(), FORECAST_BATCH_SIZE
+    ):
+        history.add(batch)
+
+    working_hours = await repo.list_working_hours()
+    blocked_dates = [b["date"] for b in await repo.list_blocked_dates()]
+    return history.report(working_hours, blocked_dates, horizon, min_demand)
@@ -0,0 +1,249 @@
+"""
+Idempotency-Key support for endpoints with side effects.
+
+A request carrying an `Idempotency-Key` header runs at most once per key:
+  - replays get the stored response back (`Idempotent-Replayed: true`)
+  - concurrent duplicates wait for the first request instead of racing
+    (in-process through a shared future, across workers by polling the
+    pending record in the storage)
+  - a pending record is leased to its owner for LEASE_SECONDS: if the
+    owner dies without finishing, a waiter takes the key over once the
+    lease expires
+  - responses that are not stored (409, 429, 5xx) are not shared either:
+    duplicates waiting on them run the request themselves
+  - reusing a key with a different payload is rejected with 422
+
+Responses live in the TTL-indexed `idempotency_keys` collection (through
+storage.Repository), with an in-memory LRU in front of it.
+"""
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from cache import TTLCache
+from storage import Repository, get_storage
+import monitoring
+import tenancy
+
+logger = logging.getLogger("primo-barber.idempotency")
+
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")) * 3600
+LRU_SIZE = int(os.getenv("IDEMPOTENCY_LRU_SIZE", "10000"))
+WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT_MS", "10000")) / 1000
+# Tempo máximo de uma execução antes que outro worker possa assumir a chave
+LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+# Erros transitórios não são gravados: o cliente deve poder tentar de novo
+_NOT_STORED = {409, 429}
+
+StoredResponse = Tuple[int, Any]
+
+
+# Guarda (fingerprint, resposta) por chave
+_cache = TTLCache(LRU_SIZE, TTL_SECONDS)
+_in_flight: Dict[str, asyncio.Future] = {}
+
+monitoring.register_cache("idempotency", _cache.stats)
+
+
+async def ensure_indexes(db):
+    await db.idempotency_keys.create_index(
+        "created_at",
+        expireAfterSeconds=TTL_SECONDS
+    )
+
+
+def fingerprint(payload: Any) -> str:
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _storable(status_code: int) -> bool:
+    return status_code < 500 and status_code not in _NOT_STORED
+
+
+def _response(stored: StoredResponse, replayed: bool) -> JSONResponse:
+    status_code, body = stored
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONResponse(status_code=status_code, content=body, headers=headers)
+
+
+def _check_fingerprint(expected: str, actual: str):
+    if expected != actual:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key already used with a different payload"
+        )
+
+
+def _lease_until() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+
+
+def _keys() -> Repository:
+    # Loja da requisição em andamento (tenancy)
+    return Repository(get_storage())
+
+
+async def _claim(key: str, fp: str, owner: str) -> Optional[StoredResponse]:
+    """
+    Reserve `key` in the storage for `owner`. Returns the stored response
+    when another request already completed it, waiting while it is still
+    pending and taking it over when the pending owner's lease expired.
+    """
+    keys = _keys()
+    if await keys.insert_idempotency_key(key, fp, owner, _lease_until()):
+        return None
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while True:
+        record = await keys.get_idempotency_key(key)
+
+        if record is None:
+            # O dono desistiu (erro 5xx); tentamos de novo
+            return await _claim(key, fp, owner)
+
+        _check_fingerprint(record["fingerprint"], fp)
+
+        if record["state"] == "completed":
+            stored = (record["status_code"], record["body"])
+            _cache.put(key, (fp, stored))
+            return stored
+
+        # Registros sem lease (anteriores a ele) vencem a partir de created_at
+        lease_until = record.get("lease_until") or \
+            record["created_at"] + timedelta(seconds=LEASE_SECONDS)
+        if lease_until <= datetime.utcnow():
+            # Dono morto: só um dos que esperam consegue trocar o dono
+            if await keys.take_over_idempotency_key(
+                key, record.get("owner"), owner, _lease_until()
+            ):
+                logger.warning("Took over expired idempotency key %s", key)
+                return None
+            continue
+
+        if time.monotonic() > deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is in progress"
+            )
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def _store(key: str, fp: str, owner: str, stored: StoredResponse):
+    _cache.put(key, (fp, stored))
+    try:
+        # Se o lease venceu e outro assumiu, a resposta dele é a que vale
+        await _keys().complete_idempotency_key(key, owner, *stored)
+    except Exception:
+        # O trabalho já foi feito; não falhamos a resposta por isso
+        logger.exception("Failed to persist idempotent response %s", key)
+
+
+async def _release(key: str, owner: str):
+    try:
+        await _keys().release_idempotency_key(key, owner)
+    except Exception:
+        logger.exception("Failed to release idempotency key %s", key)
+
+
+async def _execute(
+    key: str,
+    fp: str,
+    handler: Callable[[], Awaitable[Any]],
+    status_code: int
+) -> Tuple[StoredResponse, Optional[HTTPException], bool]:
+    """Returns (response, error to raise, replayed)"""
+    owner = uuid.uuid4().hex
+    try:
+        stored = await _claim(key, fp, owner)
+    except HTTPException:
+        raise
+    except Exception:
+        # Banco fora: seguimos só com a proteção em memória
+        logger.exception("Idempotency store unavailable")
+        stored = None
+
+    if stored is not None:
+        return stored, None, True
+
+    try:
+        result = await handler()
+    except HTTPException as exc:
+        stored = (exc.status_code, {"detail": exc.detail})
+        if _storable(exc.status_code):
+            await _store(key, fp, owner, stored)
+        else:
+            await _release(key, owner)
+        return stored, exc, False
+    except BaseException:
+        await _release(key, owner)
+        raise
+
+    stored = (status_code, jsonable_encoder(result))
+    await _store(key, fp, owner, stored)
+    return stored, None, False
+
+
+async def run(
+    scope: str,
+    key: str,
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]],
+    status_code: int = 200
+) -> JSONResponse:
+    """
+    Run `handler` once for (`scope`, `key`) and return its response,
+    or the stored response of the first execution.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+
+    # _id é global na coleção: a loja faz parte da chave
+    full_key = tenancy.shop_key(scope, key)
+    fp = fingerprint(payload)
+
+    cached = _cache.get(full_key)
+    if cached is not None:
+        _check_fingerprint(cached[0], fp)
+        return _response(cached[1], replayed=True)
+
+    pending = _in_flight.get(full_key)
+    if pending is not None:
+        outcome = await asyncio.shield(pending)
+        if outcome is None:
+            # A primeira execução não gravou resposta: esta executa de novo
+            return await run(scope, key, payload, handler, status_code)
+        expected_fp, stored = outcome
+        _check_fingerprint(expected_fp, fp)
+        return _response(stored, replayed=True)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[full_key] = future
+    # Só respostas gravadas são compartilhadas (None = quem espera executa)
+    outcome = None
+    try:
+        stored, error, replayed = await _execute(
+            full_key, fp, handler, status_code
+        )
+        if _storable(stored[0]):
+            outcome = (fp, stored)
+    finally:
+        _in_flight.pop(full_key, None)
+        future.set_result(outcome)
+
+    if error is not None:
+        raise error
+    return _response(stored, replayed=replayed)
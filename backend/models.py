@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 import uuid
 
@@ -66,8 +66,10 @@ class AppointmentUpdate(BaseModel):
 
 class Appointment(AppointmentBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    status: str = "pending"  # pending | confirmed | cancelled | completed
-    source: str = "web"      # web | telegram
+    status: str = "pending"  # pending | confirmed | cancelled | completed | held
+    source: str = "web"      # web | telegram | waitlist
+    series_id: Optional[str] = None  # agendamentos recorrentes
+    price: Optional[float] = None    # preço do serviço na hora do agendamento
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -116,6 +118,72 @@ class Setting(SettingBase):
         }
 
 
+class Client(BaseModel):
+    phone: str                      # só dígitos (chave normalizada)
+    name: str
+    telegram_username: Optional[str] = None
+    bookings: int = 0               # agendamentos não cancelados
+    visit_count: int = 0            # agendamentos concluídos
+    total_spend: float = 0.0
+    last_visit: Optional[str] = None
+    favorite_service_id: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        json_encoders = {
+            datetime: lambda v: v.isoformat()
+        }
+
+
+class RecurrenceRule(BaseModel):
+    # Subconjunto de RRULE: FREQ=WEEKLY;INTERVAL=1|2 com UNTIL ou COUNT
+    freq: Literal["weekly", "biweekly"]
+    until: Optional[str] = None     # "2026-06-30" (inclusive)
+    count: Optional[int] = Field(None, ge=1)
+
+
+class AppointmentSeriesCreate(AppointmentCreate):
+    recurrence: RecurrenceRule
+
+
+class SeriesConflict(BaseModel):
+    date: str
+    reason: str
+
+
+class AppointmentSeries(BaseModel):
+    series_id: str
+    recurrence: RecurrenceRule
+    created: List[Appointment]
+    conflicts: List[SeriesConflict]
+
+
+class WaitlistEntryCreate(BaseModel):
+    client_name: str
+    client_phone: str
+    telegram_chat_id: int           # oferta da vaga chega pelo bot
+    service_id: str
+    date: str                       # "2026-01-25"
+    time_from: Optional[str] = None # janela desejada; None = qualquer horário
+    time_to: Optional[str] = None
+
+
+class WaitlistEntry(WaitlistEntryCreate):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "waiting"         # waiting | offered | booked | declined | expired | cancelled
+    slots: List[str] = []           # horários da janela (chave do matcher)
+    offer_time: Optional[str] = None
+    offer_appointment_id: Optional[str] = None
+    offer_expires_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        json_encoders = {
+            datetime: lambda v: v.isoformat()
+        }
+
+
 class DashboardStats(BaseModel):
     total_appointments: int
     pending_appointments: int
@@ -123,3 +191,10 @@ class DashboardStats(BaseModel):
     total_services: int
     revenue_month: float
     appointments_today: int
+
+
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)  # fração com pilhas amostradas
+    slow_query_ms: Optional[float] = Field(None, ge=0)
+    slow_request_ms: Optional[float] = Field(None, ge=0)
@@ -0,0 +1,176 @@
+"""
+Runtime counters used by the health/readiness probes:
+  - MongoDB connection pool usage (pymongo pool listener)
+  - in-flight HTTP requests (ASGI middleware)
+  - DB round-trips per request (X-DB-Queries header)
+  - registry of pool/cache stats exposed by optional subsystems
+"""
+import threading
+import time
+from typing import Callable, Dict
+
+from pymongo import common, monitoring
+
+
+class MongoPoolStats(monitoring.ConnectionPoolListener):
+    """
+    Tracks Motor/pymongo connection pool usage per server.
+
+    Listener callbacks run on pymongo threads, so counters are guarded
+    by a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[str, dict] = {}
+
+    def _server(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        server = self._servers.get(key)
+        if server is None:
+            server = {
+                "max_pool_size": None,
+                "open": 0,
+                "checked_out": 0,
+                "waiting": 0,
+            }
+            self._servers[key] = server
+        return server
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            server = self._server(address)
+            for field, delta in deltas.items():
+                server[field] = max(0, server[field] + delta)
+
+    def pool_created(self, event):
+        with self._lock:
+            # options só traz o que difere do padrão
+            self._server(event.address)["max_pool_size"] = \
+                event.options.get("maxPoolSize", common.MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._servers.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            servers = {k: dict(v) for k, v in self._servers.items()}
+
+        for server in servers.values():
+            max_size = server["max_pool_size"]
+            server["saturation"] = (
+                round(server["checked_out"] / max_size, 3) if max_size else None
+            )
+
+        return {
+            "servers": servers,
+            "saturation": max(
+                (s["saturation"] or 0.0 for s in servers.values()),
+                default=0.0,
+            ),
+            "waiting": sum(s["waiting"] for s in servers.values()),
+        }
+
+
+class InFlightMiddleware:
+    """Counts HTTP requests currently being handled by this process"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global in_flight
+        in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight -= 1
+
+
+class QueryCountMiddleware:
+    """
+    Adds X-DB-Queries to responses: round-trips made through the request's
+    storage.Repository (request.state.repository), when one was used.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                repository = scope.get("state", {}).get("repository")
+                if repository is not None:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-db-queries", str(repository.queries).encode())
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_count)
+
+
+mongo_pool = MongoPoolStats()
+in_flight = 0
+started_at = time.monotonic()
+
+_pools: Dict[str, Callable[[], dict]] = {}
+_caches: Dict[str, Callable[[], dict]] = {}
+
+
+def register_pool(name: str, stats: Callable[[], dict]):
+    """Expose connection pool stats of an optional client in readiness"""
+    _pools[name] = stats
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Expose warmness of an in-process cache in readiness"""
+    _caches[name] = stats
+
+
+def pool_stats() -> dict:
+    return {name: stats() for name, stats in _pools.items()}
+
+
+def cache_stats() -> dict:
+    return {name: stats() for name, stats in _caches.items()}
+
+
+def uptime_seconds() -> float:
+    return round(time.monotonic() - started_at, 3)
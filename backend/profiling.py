@@ -0,0 +1,403 @@
+"""
+Profiling mode, toggled at runtime (PUT /api/profiling) or by
+PROFILING_ENABLED. While it is on:
+  - MongoDB commands slower than SLOW_QUERY_MS are logged as JSON with
+    their filter shape (values stripped) and the route that issued them
+  - each request records CPU time on the event loop vs time awaiting
+    (I/O, DB, other tasks), aggregated per route
+  - a PROFILE_SAMPLE_RATE fraction of requests is profiled by a stack
+    sampler; stacks are dumped to PROFILE_DIR in collapsed format
+    (`*.folded`, for flamegraph.pl / speedscope / inferno)
+
+When it is off the middleware, the task factory and the command listener
+return after a single check (see benchmarks/profiling.py).
+
+CPU time is measured per asyncio task step, so it only counts the work of
+the request's own tasks (including children, e.g. a streamed body). The
+stack sampler sees the whole event loop thread, so concurrent requests
+show up in a dump too: only one request is sampled at a time.
+State is per process.
+"""
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from pymongo import monitoring
+
+logger = logging.getLogger("primo-barber.profiling")
+
+
+ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Fração das requisições com pilhas amostradas (0 = só tempos e consultas lentas)
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", Path(__file__).parent / "profiles"))
+
+# Ajustáveis em runtime por configure()
+SETTINGS = ("ENABLED", "SAMPLE_RATE", "SLOW_QUERY_MS", "SLOW_REQUEST_MS")
+
+# Últimas consultas lentas e estatísticas por rota (GET /api/profiling)
+slow_queries: deque = deque(maxlen=100)
+route_stats: dict = {}
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("profiling_request", default=None)
+
+
+def configure(**fields):
+    """Update SETTINGS at runtime; turning profiling on clears the stats"""
+    if fields.get("ENABLED") and not ENABLED:
+        reset()
+    for name, value in fields.items():
+        if name not in SETTINGS:
+            raise ValueError(f"Unknown profiling setting: {name}")
+        globals()[name] = value
+    logger.info("Profiling settings %s", fields)
+
+
+def current_settings() -> dict:
+    return {name.lower(): globals()[name] for name in SETTINGS}
+
+
+def reset():
+    slow_queries.clear()
+    route_stats.clear()
+
+
+# =========================
+# Por requisição
+# =========================
+
+class RequestProfile:
+    __slots__ = ("scope", "cpu", "db", "queries", "started")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.cpu = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.started = time.perf_counter()
+
+    @property
+    def route(self) -> str:
+        """Route template ("GET /api/appointments/{appointment_id}")"""
+        scope = self.scope
+        if "endpoint" not in scope:
+            # Ainda não roteado, ou 404: não cria uma entrada por URL
+            return f"{scope['method']} (unmatched)"
+        path = scope["path"]
+        for name, value in scope.get("path_params", {}).items():
+            path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+        return f"{scope['method']} {path}"
+
+
+class _Timed:
+    """Await `coro` one step at a time, adding each step's CPU time to `profile`"""
+    __slots__ = ("coro", "profile")
+
+    def __init__(self, coro, profile: RequestProfile):
+        self.coro = coro
+        self.profile = profile
+
+    def __await__(self):
+        coro, profile = self.coro, self.profile
+        value, error = None, None
+        while True:
+            started = time.thread_time()
+            try:
+                if error is not None:
+                    yielded = coro.throw(error)
+                else:
+                    yielded = coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                profile.cpu += time.thread_time() - started
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as exc:
+                value, error = None, exc
+
+
+async def _timed(coro, profile: RequestProfile):
+    return await _Timed(coro, profile)
+
+
+def install_task_factory(loop: asyncio.AbstractEventLoop):
+    """
+    Tasks created while handling a profiled request (StreamingResponse
+    body, anyio task groups) are timed into the same RequestProfile.
+    """
+    previous = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        profile = _current.get()
+        if profile is not None:
+            coro = _timed(coro, profile)
+        if previous is not None:
+            return previous(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    loop.set_task_factory(factory)
+
+
+def _record(profile: RequestProfile, status: Optional[int]):
+    wall = time.perf_counter() - profile.started
+    route = profile.route
+    stats = route_stats.get(route)
+    if stats is None:
+        stats = route_stats[route] = {
+            "count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "db_ms": 0.0, "max_ms": 0.0
+        }
+    stats["count"] += 1
+    stats["wall_ms"] += wall * 1000
+    stats["cpu_ms"] += profile.cpu * 1000
+    stats["db_ms"] += profile.db * 1000
+    stats["max_ms"] = max(stats["max_ms"], wall * 1000)
+
+    if wall * 1000 >= SLOW_REQUEST_MS:
+        logger.warning("slow request %s", json.dumps({
+            "route": route,
+            "status": status,
+            "wall_ms": round(wall * 1000, 2),
+            "cpu_ms": round(profile.cpu * 1000, 2),
+            "await_ms": round((wall - profile.cpu) * 1000, 2),
+            "db_ms": round(profile.db * 1000, 2),
+            "queries": profile.queries,
+        }))
+    return wall
+
+
+def route_summary() -> dict:
+    summary = {}
+    for route, stats in route_stats.items():
+        count = stats["count"]
+        summary[route] = {
+            "count": count,
+            "avg_ms": round(stats["wall_ms"] / count, 2),
+            "avg_cpu_ms": round(stats["cpu_ms"] / count, 2),
+            "avg_await_ms": round((stats["wall_ms"] - stats["cpu_ms"]) / count, 2),
+            "avg_db_ms": round(stats["db_ms"] / count, 2),
+            "max_ms": round(stats["max_ms"], 2),
+        }
+    return summary
+
+
+# =========================
+# Amostragem de pilhas (flamegraph)
+# =========================
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread every `interval` seconds"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+# Um sampler por vez: a pilha do event loop é compartilhada
+_sampling = threading.Lock()
+
+
+def _dump(stacks: Counter, route: str, wall: float) -> Optional[Path]:
+    if not stacks:
+        return None
+    directory = PROFILE_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = "".join(c if c.isalnum() else "_" for c in route).strip("_")
+    path = directory / (
+        f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{slug}_{wall * 1000:.0f}ms.folded"
+    )
+    path.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.items()))
+
+    # Mantém só os PROFILE_MAX_FILES mais recentes
+    dumps = sorted(directory.glob("*.folded"))
+    for old in dumps[:max(len(dumps) - MAX_FILES, 0)]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def recent_dumps(limit: int = 20) -> list:
+    if not PROFILE_DIR.is_dir():
+        return []
+    return [p.name for p in sorted(PROFILE_DIR.glob("*.folded"), reverse=True)[:limit]]
+
+
+# =========================
+# Middleware
+# =========================
+
+class ProfilingMiddleware:
+    """Times requests (and samples some) while profiling is enabled"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sampler = None
+        if random.random() < SAMPLE_RATE and _sampling.acquire(blocking=False):
+            sampler = StackSampler(threading.get_ident(), INTERVAL_MS / 1000)
+            sampler.start()
+
+        token = _current.set(profile)
+        try:
+            await _Timed(self.app(scope, receive, send_with_status), profile)
+        finally:
+            _current.reset(token)
+            wall = _record(profile, status)
+            if sampler is not None:
+                try:
+                    stacks = sampler.stop()
+                    await asyncio.to_thread(_dump, stacks, profile.route, wall)
+                except Exception:
+                    logger.exception("Failed to write profile")
+                finally:
+                    _sampling.release()
+
+
+# =========================
+# Consultas lentas (pymongo)
+# =========================
+
+# Campos de cada comando que trazem o filtro
+_FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+}
+
+
+def shape(value):
+    """Query with values replaced by "?": keeps fields and operators only"""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        shapes = [shape(v) for v in value]
+        # $in com 1 ou 500 valores tem o mesmo formato
+        if all(s == "?" for s in shapes):
+            return ["?"] if shapes else []
+        return shapes
+    return "?"
+
+
+def _command_filter(name: str, command: dict):
+    field = _FILTER_FIELDS.get(name)
+    if field is not None:
+        return command.get(field)
+    if name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q") if statements else None
+    return None
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Logs commands slower than SLOW_QUERY_MS. Runs on Motor's
+    executor threads, which carry the request's context (Motor copies it),
+    so the route is known.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        if not ENABLED:
+            return
+        command = event.command
+        self._pending[(event.connection_id, event.request_id)] = (
+            _current.get(),
+            event.command_name,
+            command.get(event.command_name),
+            _command_filter(event.command_name, command),
+            command.get("sort"),
+        )
+
+    def _finished(self, event, failure=None):
+        if not self._pending:
+            return
+        started = self._pending.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        profile, name, collection, query, sort = started
+        elapsed_ms = event.duration_micros / 1000
+        if profile is not None:
+            profile.db += elapsed_ms / 1000
+            profile.queries += 1
+
+        if elapsed_ms < SLOW_QUERY_MS:
+            return
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "route": profile.route if profile is not None else None,
+            "command": name,
+            "collection": collection if isinstance(collection, str) else None,
+            "filter": shape(query) if query is not None else None,
+            "sort": dict(sort) if sort else None,
+            "duration_ms": round(elapsed_ms, 2),
+        }
+        if failure is not None:
+            entry["error"] = failure
+        slow_queries.append(entry)
+        logger.warning("slow query %s", json.dumps(entry))
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event, failure=str(event.failure.get("errmsg", event.failure)))
+
+
+command_listener = SlowQueryListener()
@@ -0,0 +1,397 @@
+"""
+Admission control for the public booking endpoints.
+
+  - token buckets per client IP / per phone and shop (in memory, or shared
+    through MongoDB when RATE_LIMIT_BACKEND=mongo for multi-worker
+    deployments); a booking refused with a 4xx gives its phone token back
+  - global concurrency limit with a bounded wait queue
+
+Routes opt in with `protect(method, path, policy)`; AdmissionMiddleware
+checks them before routing, so a rejected request never has its body read
+or parsed. Everything rejects fast with 429 + Retry-After instead of
+letting an abusive client queue up work in the process and the database.
+
+The client IP is the peer address. Forwarding headers (Fly-Client-IP,
+X-Forwarded-For) are only honored when the peer is one of TRUSTED_PROXIES.
+"""
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+import asyncio
+import ipaddress
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+import monitoring
+import tenancy
+
+logger = logging.getLogger("primo-barber.ratelimit")
+
+_db = None
+
+def set_db(db):
+    global _db
+    _db = db
+
+
+# --------------------------------------------------
+# Config
+# --------------------------------------------------
+@dataclass(frozen=True)
+class BucketPolicy:
+    name: str
+    rate: float      # tokens por segundo
+    burst: int       # capacidade do balde
+
+
+def _policy(name: str, rate: str, burst: str) -> BucketPolicy:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return BucketPolicy(
+        name=name,
+        rate=float(os.getenv(f"{prefix}_RATE", rate)),
+        burst=int(os.getenv(f"{prefix}_BURST", burst)),
+    )
+
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | mongo
+
+AVAILABILITY_IP = _policy("availability_ip", "5", "20")
+BOOKING_IP = _policy("booking_ip", "0.2", "10")
+BOOKING_PHONE = _policy("booking_phone", str(3 / 3600), "3")  # 3 por hora
+
+MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000")) / 1000
+
+# IPs/redes (CIDR) separados por vírgula, ex. "172.16.0.0/12,fdaa::/16".
+# Vazio: ninguém é proxy e os headers de encaminhamento são ignorados
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.getenv("TRUSTED_PROXIES", "").split(",")
+    if proxy.strip()
+]
+
+MEMORY_MAX_KEYS = 100_000
+MONGO_BUCKET_TTL_SECONDS = 3600
+
+
+def _too_many(retry_after: float, detail: str = "Too many requests"):
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+# --------------------------------------------------
+# Token bucket stores
+# --------------------------------------------------
+class MemoryBucketStore:
+    """
+    Buckets in a bounded LRU dict. Returns 0 when a token was taken,
+    otherwise the seconds until the next token.
+    """
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+
+    async def take(self, policy: BucketPolicy, key: str) -> float:
+        bucket_key = f"{policy.name}:{key}"
+        now = time.monotonic()
+
+        tokens, updated_at = self._buckets.get(bucket_key, (policy.burst, now))
+        tokens = min(policy.burst, tokens + (now - updated_at) * policy.rate)
+
+        if tokens >= 1:
+            retry_after = 0.0
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / policy.rate
+
+        self._buckets[bucket_key] = (tokens, now)
+        self._buckets.move_to_end(bucket_key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return retry_after
+
+    async def give(self, policy: BucketPolicy, key: str):
+        """Put back a token taken by `take`"""
+        bucket_key = f"{policy.name}:{key}"
+        if bucket_key in self._buckets:
+            tokens, updated_at = self._buckets[bucket_key]
+            self._buckets[bucket_key] = (min(policy.burst, tokens + 1), updated_at)
+
+
+class MongoBucketStore:
+    """
+    Buckets shared by every worker in the `rate_limits` collection.
+    Refill + take happen atomically in one pipeline update.
+    """
+
+    async def take(self, policy: BucketPolicy, key: str) -> float:
+        now = datetime.utcnow()
+        elapsed = {
+            "$divide": [
+                {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]},
+                1000
+            ]
+        }
+        refilled = {
+            "$min": [
+                policy.burst,
+                {"$add": [
+                    {"$ifNull": ["$tokens", policy.burst]},
+                    {"$multiply": [elapsed, policy.rate]}
+                ]}
+            ]
+        }
+
+        bucket = await _db.rate_limits.find_one_and_update(
+            {"_id": f"{policy.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {
+                    "$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]
+                }}},
+            ],
+            upsert=True,
+            return_document=True
+        )
+
+        if bucket["allowed"]:
+            return 0.0
+        return (1 - bucket["tokens"]) / policy.rate
+
+    async def give(self, policy: BucketPolicy, key: str):
+        await _db.rate_limits.update_one(
+            {"_id": f"{policy.name}:{key}"},
+            [{"$set": {"tokens": {"$min": [policy.burst, {"$add": ["$tokens", 1]}]}}}]
+        )
+
+
+memory_store = MemoryBucketStore()
+mongo_store = MongoBucketStore()
+
+
+async def ensure_indexes(db):
+    if BACKEND == "mongo":
+        await db.rate_limits.create_index(
+            "updated_at",
+            expireAfterSeconds=MONGO_BUCKET_TTL_SECONDS
+        )
+
+
+def _store():
+    return mongo_store if BACKEND == "mongo" and _db is not None else memory_store
+
+
+async def take_token(policy: BucketPolicy, key: str) -> float:
+    if _store() is mongo_store:
+        try:
+            return await mongo_store.take(policy, key)
+        except Exception:
+            # Sem o banco caímos para o balde local em vez de negar tudo
+            logger.exception("Shared rate limit unavailable, using memory")
+    return await memory_store.take(policy, key)
+
+
+async def give_token(policy: BucketPolicy, key: str):
+    try:
+        await _store().give(policy, key)
+    except Exception:
+        # No pior caso o token volta com o refill
+        logger.exception("Failed to give back rate limit token %s", key)
+
+
+async def check(policy: BucketPolicy, key: str):
+    """Raise 429 when `key` has no tokens left for `policy`"""
+    if not ENABLED:
+        return
+    retry_after = await take_token(policy, key)
+    if retry_after > 0:
+        raise _too_many(retry_after)
+
+
+@asynccontextmanager
+async def phone_quota(phone: str):
+    """
+    Take a booking token of `phone` in the current shop (429 when there is
+    none) for the block. A block that fails with a 4xx (invalid date, slot
+    taken, ...) gives it back: only bookings that went through count.
+    """
+    digits = "".join(c for c in phone if c.isdigit())
+    key = tenancy.shop_key(digits or phone)
+    await check(BOOKING_PHONE, key)
+    try:
+        yield
+    except HTTPException as exc:
+        if ENABLED and 400 <= exc.status_code < 500:
+            await give_token(BOOKING_PHONE, key)
+        raise
+
+
+def _trusted(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except (TypeError, ValueError):
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(scope) -> str:
+    """
+    Client IP of an ASGI request: the peer address, or behind a trusted
+    proxy the right-most forwarded hop that isn't a trusted proxy itself
+    (hops to the left of it can be forged by the client)
+    """
+    peer = scope["client"][0] if scope.get("client") else "unknown"
+    if not _trusted(peer):
+        return peer
+
+    fly_ip, hops = None, []
+    for name, value in scope["headers"]:
+        if name == b"fly-client-ip":
+            fly_ip = value.decode("latin-1").strip()
+        elif name == b"x-forwarded-for":
+            hops += [hop.strip() for hop in value.decode("latin-1").split(",")]
+
+    # O proxy do Fly sobrescreve Fly-Client-IP com o IP que ele viu
+    if fly_ip and not _trusted(fly_ip):
+        return fly_ip
+    hops = [hop for hop in hops if hop]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+# --------------------------------------------------
+# Global concurrency limit
+# --------------------------------------------------
+class ConcurrencyLimiter:
+    """
+    At most `max_concurrent` admitted requests; up to `max_queue` more wait
+    for a slot (for at most `timeout` seconds). Anything beyond that is
+    rejected immediately.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _sem(self) -> asyncio.Semaphore:
+        # Criado sob demanda para ficar no event loop do servidor
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def acquire(self):
+        semaphore = self._sem()
+
+        if semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise _too_many(self.timeout, "Server busy")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise _too_many(self.timeout, "Server busy")
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._sem().release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue
+        }
+
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT, MAX_QUEUE, QUEUE_TIMEOUT)
+
+monitoring.register_pool("admission", limiter.stats)
+
+
+# --------------------------------------------------
+# Middleware
+# --------------------------------------------------
+_protected: Dict[Tuple[str, str], BucketPolicy] = {}
+
+
+def protect(method: str, path: str, policy: BucketPolicy):
+    """Put a route (method + full path) behind AdmissionMiddleware"""
+    _protected[(method.upper(), path.rstrip("/"))] = policy
+
+
+async def _reject(send, exc: HTTPException):
+    body = json.dumps({"detail": exc.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": exc.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *((k.lower().encode(), v.encode()) for k, v in exc.headers.items())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    Protected routes: per-IP token bucket, then a slot in the global
+    concurrency limit held for the duration of the request. Runs before
+    routing, so rejections cost no body parsing, validation or queries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        policy = None
+        if scope["type"] == "http" and ENABLED:
+            policy = _protected.get((scope["method"], scope["path"].rstrip("/")))
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await check(policy, client_ip(scope))
+            await limiter.acquire()
+        except HTTPException as exc:
+            await _reject(send, exc)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
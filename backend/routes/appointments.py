@@ -1,76 +1,88 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from typing import Optional, List
 from datetime import datetime, timedelta
-from models import Appointment, AppointmentCreate, AppointmentUpdate
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from models import (
+    Appointment,
+    AppointmentCreate,
+    AppointmentSeries,
+    AppointmentSeriesCreate,
+    AppointmentUpdate,
+    RecurrenceRule,
+    SeriesConflict,
+)
+import uuid
+from storage import Repository, get_repository
+from streaming import stream_list
+import idempotency
+import ratelimit
 
 router = APIRouter(
     prefix="/api/appointments",
     tags=["Appointments"]
 )
 
-# Database injection
-db: Optional[AsyncIOMotorDatabase] = None
-
+# Limite de ocorrências por série (um ano de semanais)
+MAX_OCCURRENCES = 52
 
-def set_db(database: AsyncIOMotorDatabase):
-    global db
-    db = database
+ratelimit.protect("POST", "/api/appointments", ratelimit.BOOKING_IP)
+ratelimit.protect("POST", "/api/appointments/series", ratelimit.BOOKING_IP)
 
 
-@router.post("", response_model=Appointment, status_code=201)
-async def create_appointment(appointment: AppointmentCreate):
+@router.post(
+    "",
+    response_model=Appointment,
+    status_code=201
+)
+async def create_appointment(
+    appointment: AppointmentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    repo: Repository = Depends(get_repository)
+):
     """
     Create new appointment (web or telegram)
-    """
 
-    # 🔹 Normaliza data (zera horário)
-    selected_date = appointment.date.replace(
-        hour=0, minute=0, second=0, microsecond=0
-    )
-    day_of_week = selected_date.weekday()  # 0 = segunda
-
-    # 🔹 Verifica se a data está bloqueada
-    blocked = await db.blocked_dates.find_one({
-        "date": selected_date.strftime("%Y-%m-%d")
-    })
-
-    if blocked:
-        raise HTTPException(
-            status_code=400,
-            detail="This date is blocked"
+    Retries carrying the same `Idempotency-Key` header get the original
+    response back instead of booking twice.
+    """
+    async def book():
+        # Limite por telefone só no público; repetições idempotentes não contam
+        async with ratelimit.phone_quota(appointment.client_phone):
+            return await book_appointment(appointment, repo)
+
+    if idempotency_key:
+        return await idempotency.run(
+            "appointments",
+            idempotency_key,
+            appointment,
+            book,
+            status_code=201
         )
 
-    # 🔹 Verifica horário de trabalho
-    working_hours = await db.working_hours.find_one({
-        "day_of_week": day_of_week,
-        "active": True
-    })
+    return await book()
 
-    if not working_hours:
-        raise HTTPException(
-            status_code=400,
-            detail="No working hours for this day"
-        )
 
-    # 🔹 Verifica conflito de horário
-    conflict = await db.appointments.find_one({
-        "date": {
-            "$gte": selected_date,
-            "$lt": selected_date + timedelta(days=1)
-        },
-        "time": appointment.time,
-        "status": {"$ne": "cancelled"}
-    })
-
-    if conflict:
-        raise HTTPException(
-            status_code=400,
-            detail="Time slot already booked"
-        )
+async def book_appointment(
+    appointment: AppointmentCreate,
+    repo: Repository,
+    source: str = "web"
+) -> Appointment:
+    """
+    Validate and store a new appointment. Used by the endpoint and,
+    in-process, by the Telegram bot (source="telegram").
+    """
+    # 🔹 Data chega como "YYYY-MM-DD" e é gravada assim
+    try:
+        datetime.strptime(appointment.date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    # 🔹 Data bloqueada, horário de trabalho e conflito
+    problem = await repo.slot_problem(appointment.date, appointment.time)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
 
     # 🔹 Busca serviço
-    service = await db.services.find_one({"id": appointment.service_id})
+    service = await repo.get_service(appointment.service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
 
@@ -78,55 +90,198 @@ async def create_appointment(appointment: AppointmentCreate):
     appointment_obj = Appointment(
         **appointment.dict(),
         service_name=service["name"],
+        price=service["price"],
         status="pending",
-        source="web"  # o bot usará "telegram"
+        source=source
     )
 
-    await db.appointments.insert_one(
-        appointment_obj.dict(exclude_none=True)
-    )
+    await repo.create_appointment(appointment_obj.dict(exclude_none=True))
 
     return appointment_obj
 
 
-@router.get("", response_model=List[Appointment])
-async def get_appointments(
-    status: Optional[str] = Query(None),
-    date_from: Optional[str] = Query(None),
-    date_to: Optional[str] = Query(None),
-    limit: int = Query(100, le=500)
+# =========================
+# Recorrência
+# =========================
+
+def expand_recurrence(start: str, rule: RecurrenceRule) -> List[str]:
+    """Dates ("YYYY-MM-DD") of every occurrence, starting at `start`"""
+    if (rule.until is None) == (rule.count is None):
+        raise HTTPException(status_code=400, detail="Recurrence needs either until or count")
+
+    try:
+        current = datetime.strptime(start, "%Y-%m-%d").date()
+        until = datetime.strptime(rule.until, "%Y-%m-%d").date() if rule.until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    step = timedelta(weeks=1 if rule.freq == "weekly" else 2)
+    # Nunca passa de MAX_OCCURRENCES + 1 iterações, qualquer que seja o count
+    count = min(rule.count or MAX_OCCURRENCES + 1, MAX_OCCURRENCES + 1)
+
+    dates = []
+    try:
+        while len(dates) < count and (until is None or current <= until):
+            dates.append(current.isoformat())
+            current += step
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    if len(dates) > MAX_OCCURRENCES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A series can have at most {MAX_OCCURRENCES} occurrences"
+        )
+    if not dates:
+        raise HTTPException(status_code=400, detail="Recurrence has no occurrences")
+
+    return dates
+
+
+@router.post(
+    "/series",
+    response_model=AppointmentSeries,
+    status_code=201
+)
+async def create_appointment_series(
+    series: AppointmentSeriesCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    repo: Repository = Depends(get_repository)
 ):
     """
-    List appointments with filters
+    Create a recurring appointment (weekly or biweekly, until a date or
+    for a number of occurrences)
+
+    Occurrences that can't be booked are reported in `conflicts`; the
+    rest of the series is still created. 409 if none can be booked.
     """
-    query = {}
+    async def book():
+        async with ratelimit.phone_quota(series.client_phone):
+            return await book_series(series, repo)
+
+    if idempotency_key:
+        return await idempotency.run(
+            "appointment-series",
+            idempotency_key,
+            series,
+            book,
+            status_code=201
+        )
+
+    return await book()
 
-    if status:
-        query["status"] = status
 
-    if date_from:
-        query["date"] = {"$gte": datetime.fromisoformat(date_from)}
+async def book_series(
+    series: AppointmentSeriesCreate,
+    repo: Repository,
+    source: str = "web"
+) -> AppointmentSeries:
+    """
+    Expand the recurrence, check every occurrence with one bulk fetch per
+    check and insert the free ones in a single batched write.
+    """
+    dates = expand_recurrence(series.date, series.recurrence)
+
+    service = await repo.get_service(series.service_id)
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
 
-    if date_to:
-        if "date" in query:
-            query["date"]["$lte"] = datetime.fromisoformat(date_to)
-        else:
-            query["date"] = {"$lte": datetime.fromisoformat(date_to)}
+    problems = await repo.slot_problems(dates, series.time)
+    conflicts = [
+        SeriesConflict(date=d, reason=problems[d]) for d in dates if d in problems
+    ]
 
-    appointments = await db.appointments.find(query) \
-        .sort("date", -1) \
-        .limit(limit) \
-        .to_list(limit)
+    if len(conflicts) == len(dates):
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "No occurrence of the series can be booked",
+                "conflicts": [c.dict() for c in conflicts]
+            }
+        )
+
+    series_id = str(uuid.uuid4())
+    base = series.dict(exclude={"recurrence", "date"})
+    created = [
+        Appointment(
+            **base,
+            date=d,
+            price=service["price"],
+            status="pending",
+            source=source,
+            series_id=series_id
+        )
+        for d in dates if d not in problems
+    ]
+
+    await repo.create_appointments([a.dict(exclude_none=True) for a in created])
+
+    return AppointmentSeries(
+        series_id=series_id,
+        recurrence=series.recurrence,
+        created=created,
+        conflicts=conflicts
+    )
+
+
+@router.get("", response_model=List[Appointment])
+async def get_appointments(
+    request: Request,
+    status: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None),
+    date_to: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    include_archive: bool = Query(False),
+    count: bool = Query(False),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    List appointments with filters, streamed
 
-    return [Appointment(**a) for a in appointments]
+    Ranges reaching back past the archive horizon also read
+    appointments_archive; without date_from only with include_archive=true.
+    Pages are explicit: a Link header with rel="next" while there is more,
+    and X-Total-Count when asked for (count=true: a full count).
+    """
+    # Datas são gravadas como "YYYY-MM-DD": comparação lexicográfica
+    for value in (date_from, date_to):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid date format")
+
+    query = {
+        "status": status,
+        "date_from": date_from,
+        "date_to": date_to,
+        "include_archive": include_archive
+    }
+    total = has_more = None
+    if count:
+        total = await repo.count_appointments(**query)
+    else:
+        # Conta só até o primeiro depois da página: custo da página, não do total
+        has_more = await repo.count_appointments(**query, limit=offset + limit + 1) \
+            > offset + limit
+    appointments = repo.iter_appointments(**query, skip=offset, limit=limit)
+
+    return stream_list(
+        appointments, Appointment,
+        request=request, total=total, offset=offset, limit=limit, has_more=has_more
+    )
 
 
 @router.get("/{appointment_id}", response_model=Appointment)
-async def get_appointment(appointment_id: str):
+async def get_appointment(
+    appointment_id: str,
+    repo: Repository = Depends(get_repository)
+):
     """
     Get appointment by ID
     """
-    appointment = await db.appointments.find_one({"id": appointment_id})
+    appointment = await repo.get_appointment(appointment_id)
 
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -137,40 +292,45 @@ async def get_appointment(appointment_id: str):
 @router.patch("/{appointment_id}", response_model=Appointment)
 async def update_appointment(
     appointment_id: str,
-    update: AppointmentUpdate
+    update: AppointmentUpdate,
+    repo: Repository = Depends(get_repository)
 ):
     """
     Update appointment (status, date, time, notes)
     """
-    appointment = await db.appointments.find_one({"id": appointment_id})
-
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-
     update_data = {
         k: v for k, v in update.dict().items()
         if v is not None
     }
     update_data["updated_at"] = datetime.utcnow()
 
-    await db.appointments.update_one(
-        {"id": appointment_id},
-        {"$set": update_data}
-    )
+    # Agendamentos anteriores ao preço gravado recebem o preço atual ao concluir
+    if update_data.get("status") == "completed":
+        current = await repo.get_appointment(appointment_id)
+        if current and current.get("price") is None:
+            service = await repo.get_service(current["service_id"])
+            if service:
+                update_data["price"] = service["price"]
 
-    updated = await db.appointments.find_one({"id": appointment_id})
+    updated = await repo.update_appointment(appointment_id, update_data)
+
+    if not updated:
+        raise HTTPException(status_code=404, detail="Appointment not found")
 
     return Appointment(**updated)
 
 
 @router.delete("/{appointment_id}")
-async def delete_appointment(appointment_id: str):
+async def delete_appointment(
+    appointment_id: str,
+    repo: Repository = Depends(get_repository)
+):
     """
     Cancel appointment
     """
-    result = await db.appointments.delete_one({"id": appointment_id})
+    deleted = await repo.delete_appointment(appointment_id)
 
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(
             status_code=404,
             detail="Appointment not found"
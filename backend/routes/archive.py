@@ -0,0 +1,114 @@
+from fastapi import APIRouter
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+import os
+
+from storage import Repository, get_storage, list_shops
+from storage.archive import HORIZON_DAYS, cutoff_date
+import tenancy
+
+router = APIRouter(
+    prefix="/api/archive",
+    tags=["Archive"]
+)
+
+logger = logging.getLogger("primo-barber.archive")
+
+# Agendamentos com data anterior a hoje - ARCHIVE_HORIZON_DAYS saem da
+# coleção quente e vão para appointments_archive (storage/archive.py)
+ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+# Cancelados arquivados são apagados pelo TTL depois deste prazo
+CANCELLED_RETENTION_DAYS = int(os.getenv("ARCHIVE_CANCELLED_RETENTION_DAYS", "90"))
+# Não disputa recursos com o cold start
+STARTUP_DELAY_SECONDS = 60
+
+_lock = asyncio.Lock()
+_task: Optional[asyncio.Task] = None
+_last_run: dict = {}
+
+
+async def ensure_indexes(db):
+    await db.appointments_archive.create_index("id", unique=True)
+    await db.appointments_archive.create_index([("date", -1), ("time", -1), ("status", 1)])
+    await db.appointments_archive.create_index([("status", 1), ("date", -1), ("time", -1)])
+    await db.appointments_archive.create_index(
+        "archived_at",
+        name="purge_cancelled",
+        expireAfterSeconds=CANCELLED_RETENTION_DAYS * 86400,
+        partialFilterExpression={"status": "cancelled"}
+    )
+
+
+async def run_archival() -> dict:
+    """
+    Move every appointment older than the horizon, in batches, for every
+    shop (one shop at a time, so each batch uses the shop_id indexes)
+    """
+    async with _lock:
+        cutoff = cutoff_date()
+        started = datetime.utcnow()
+        moved = 0
+
+        for shop_id in await list_shops("appointments"):
+            with tenancy.using(shop_id):
+                repo = Repository(get_storage())
+                while True:
+                    # Cópia, conferência e remoção: storage.archive_batch
+                    read, count = await repo.archive_batch(cutoff, BATCH_SIZE)
+                    moved += count
+                    if read < BATCH_SIZE:
+                        break
+                    # Deixa o event loop atender requisições entre lotes
+                    await asyncio.sleep(0)
+
+        _last_run.update({
+            "cutoff": cutoff,
+            "moved": moved,
+            "started_at": started,
+            "finished_at": datetime.utcnow()
+        })
+        logger.info("Archived %s appointments older than %s", moved, cutoff)
+        return dict(_last_run)
+
+
+async def _schedule():
+    await asyncio.sleep(STARTUP_DELAY_SECONDS)
+    while True:
+        try:
+            await run_archival()
+        except Exception:
+            logger.exception("Archival run failed")
+        await asyncio.sleep(INTERVAL_HOURS * 3600)
+
+
+async def startup():
+    global _task
+    if ENABLED:
+        _task = asyncio.create_task(_schedule())
+
+
+async def shutdown():
+    if _task is not None:
+        _task.cancel()
+
+
+@router.post("/run")
+async def trigger_archival():
+    """Run the archival now, for every shop (Admin)"""
+    return await run_archival()
+
+
+@router.get("/status")
+async def archival_status():
+    """Archive horizon and last run"""
+    return {
+        "enabled": ENABLED,
+        "horizon_days": HORIZON_DAYS,
+        "cutoff": cutoff_date(),
+        "cancelled_retention_days": CANCELLED_RETENTION_DAYS,
+        "last_run": _last_run or None
+    }
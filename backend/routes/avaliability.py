@@ -1,32 +1,56 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException
 from datetime import datetime, timedelta
 
+import ratelimit
+from storage import Repository, get_repository
+
 router = APIRouter(
     prefix="/api/availability",
     tags=["Availability"]
 )
 
-_db = None
-
-def set_db(db):
-    global _db
-    _db = db
+ratelimit.protect("GET", "/api/availability/", ratelimit.AVAILABILITY_IP)
 
 
 @router.get("/")
 async def get_availability(
-    date: str = Query(..., example="2026-01-27")
+    date: str = Query(..., example="2026-01-27"),
+    repo: Repository = Depends(get_repository)
 ):
     """
     Retorna horários disponíveis para uma data
     """
+    return await compute_availability(date, repo)
+
+
+def day_slots(working_hours: dict) -> list:
+    """Every slot ("HH:MM") of a day with these working hours"""
+    start_time = datetime.strptime(working_hours["start_time"], "%H:%M")
+    end_time = datetime.strptime(working_hours["end_time"], "%H:%M")
+    interval = working_hours.get("interval_minutes", 30)
+
+    slots = []
+    current = start_time
+
+    while current < end_time:
+        slots.append(current.strftime("%H:%M"))
+        current += timedelta(minutes=interval)
+
+    return slots
+
+
+async def compute_availability(date: str, repo: Repository) -> dict:
+    """
+    Horários disponíveis para uma data. Usado pelo endpoint e, sem passar
+    por HTTP, pelo bot do Telegram.
+    """
     try:
-        selected_date = datetime.strptime(date, "%Y-%m-%d")
+        datetime.strptime(date, "%Y-%m-%d")
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
 
     # 🔴 AJUSTE: verificar se a data está bloqueada
-    blocked = await _db.blocked_dates.find_one({"date": date})
+    blocked = await repo.get_blocked_date(date)
     if blocked:
         return {
             "date": date,
@@ -35,12 +59,7 @@ async def get_availability(
             "reason": blocked.get("reason")
         }
 
-    day_of_week = selected_date.weekday()  # 0 = segunda
-
-    working_hours = await _db.working_hours.find_one({
-        "day_of_week": day_of_week,
-        "active": True
-    })
+    working_hours = await repo.working_hours_for(date)
 
     if not working_hours:
         return {
@@ -48,27 +67,10 @@ async def get_availability(
             "available_times": []
         }
 
-    start_time = datetime.strptime(working_hours["start_time"], "%H:%M")
-    end_time = datetime.strptime(working_hours["end_time"], "%H:%M")
-    interval = working_hours.get("interval_minutes", 30)
-
-    slots = []
-    current = start_time
-
-    while current < end_time:
-        slots.append(current.strftime("%H:%M"))
-        current += timedelta(minutes=interval)
+    slots = day_slots(working_hours)
 
     # Buscar agendamentos do dia
-    appointments = await _db.appointments.find({
-        "date": {
-            "$gte": selected_date,
-            "$lt": selected_date + timedelta(days=1)
-        },
-        "status": {"$ne": "cancelled"}
-    }).to_list(100)
-
-    booked_times = {a["time"] for a in appointments}
+    booked_times = set(await repo.booked_times(date))
 
     available_slots = [
         slot for slot in slots if slot not in booked_times
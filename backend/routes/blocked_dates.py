@@ -1,39 +1,36 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from models import BlockedDate
+from storage import Repository, get_repository
+from streaming import stream_list
 
 router = APIRouter(
     prefix="/api/blocked-dates",
     tags=["Blocked Dates"]
 )
 
-_db = None
-
-def set_db(db):
-    global _db
-    _db = db
-
 
 @router.get("/", response_model=List[BlockedDate])
-async def list_blocked_dates():
-    return await _db.blocked_dates.find({}, {"_id": 0}).to_list(100)
+async def list_blocked_dates(repo: Repository = Depends(get_repository)):
+    return stream_list(repo.iter_blocked_dates(), BlockedDate)
 
 
 @router.post("/", response_model=BlockedDate)
-async def create_blocked_date(payload: BlockedDate):
-    exists = await _db.blocked_dates.find_one({"date": payload.date})
+async def create_blocked_date(
+    payload: BlockedDate,
+    repo: Repository = Depends(get_repository)
+):
+    exists = await repo.get_blocked_date(payload.date)
     if exists:
         raise HTTPException(status_code=400, detail="Date already blocked")
 
-    await _db.blocked_dates.insert_one(payload.dict())
+    await repo.create_blocked_date(payload.dict())
     return payload
 
 
 @router.delete("/{date}")
-async def delete_blocked_date(date: str):
-    result = await _db.blocked_dates.delete_one({"date": date})
-
-    if result.deleted_count == 0:
+async def delete_blocked_date(date: str, repo: Repository = Depends(get_repository)):
+    if not await repo.delete_blocked_date(date):
         raise HTTPException(status_code=404, detail="Blocked date not found")
 
     return {"message": "Blocked date removed"}
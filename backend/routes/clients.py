@@ -0,0 +1,327 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Optional, List
+from datetime import datetime
+from collections import Counter
+import logging
+import re
+
+import events
+from models import Appointment, Client
+from storage import Repository, get_repository, get_storage
+from streaming import stream_list
+
+router = APIRouter(
+    prefix="/api/clients",
+    tags=["Clients"]
+)
+
+logger = logging.getLogger("primo-barber.clients")
+
+async def ensure_indexes(db):
+    await db.clients.create_index("phone", unique=True)
+    await db.clients.create_index("telegram_username", sparse=True)
+    await db.clients.create_index("name_lower")
+    await db.appointments.create_index([("client_phone", 1), ("date", -1), ("time", -1)])
+    await db.appointments_archive.create_index([("client_phone", 1), ("date", -1), ("time", -1)])
+
+
+# =========================
+# Normalização
+# =========================
+
+def normalize_phone(phone: str) -> str:
+    return "".join(c for c in phone if c.isdigit())
+
+
+def normalize_username(username: Optional[str]) -> Optional[str]:
+    if not username:
+        return None
+    return username.strip().lstrip("@").lower() or None
+
+
+# =========================
+# Projeção (mantida a cada escrita em appointments)
+# =========================
+
+# Reservas da lista de espera (held) ainda não são agendamentos do cliente
+NOT_BOOKED = ("cancelled", "held")
+
+
+def _unpriced(appointment: Optional[dict]) -> bool:
+    """Completed before appointments stored their price"""
+    return bool(appointment) and appointment.get("status") == "completed" \
+        and appointment.get("price") is None
+
+
+def _contribution(appointment: Optional[dict], fallback_price: float = 0.0) -> dict:
+    """
+    What a single appointment adds to its client's counters. Spend uses
+    the price stored on the appointment, so reversals take back exactly
+    what was added; `fallback_price` is for older appointments without one.
+    """
+    if not appointment:
+        return {"bookings": 0, "visit_count": 0, "total_spend": 0.0}
+
+    status = appointment.get("status")
+    completed = status == "completed"
+    price = appointment.get("price")
+    return {
+        "bookings": 0 if status in NOT_BOOKED else 1,
+        "visit_count": 1 if completed else 0,
+        "total_spend": float(fallback_price if price is None else price) if completed else 0.0,
+    }
+
+
+async def _service_price(repo: Repository, service_id: Optional[str]) -> float:
+    if not service_id:
+        return 0.0
+    service = await repo.get_service(service_id)
+    return float(service["price"]) if service else 0.0
+
+
+# Campos do agendamento que entram na projeção
+_PROJECTED_FIELDS = (
+    "client_phone", "client_name", "client_telegram_username",
+    "service_id", "status", "date", "price"
+)
+
+
+async def record_appointment_change(
+    old: Optional[dict],
+    new: Optional[dict],
+    price: Optional[float] = None
+):
+    """
+    Apply the difference between the previous and the current version of
+    an appointment (None = did not exist) to the client projection.
+    `price` replaces the service lookup for appointments without a stored
+    price. Never fails the caller: errors are logged.
+    """
+    repo = Repository(get_storage())
+    if old is not None and new is not None and \
+            all(old.get(f) == new.get(f) for f in _PROJECTED_FIELDS):
+        # Notas, horário, arquivamento...: nada muda para o cliente
+        return
+    try:
+        await _apply_change(repo, old, new, price)
+    except Exception:
+        logger.exception("Failed to update client projection")
+
+
+events.subscribe(events.APPOINTMENT_CHANGED, record_appointment_change)
+
+
+async def _apply_change(
+    repo: Repository,
+    old: Optional[dict],
+    new: Optional[dict],
+    price: Optional[float]
+):
+    current = new or old
+    phone = normalize_phone(current["client_phone"])
+    if not phone:
+        return
+
+    if price is None:
+        price = await _service_price(repo, current.get("service_id")) \
+            if _unpriced(old) or _unpriced(new) else 0.0
+
+    before = _contribution(old, price)
+    after = _contribution(new, price)
+    inc = {k: after[k] - before[k] for k in after if after[k] != before[k]}
+
+    service_id = current.get("service_id")
+    if service_id and "bookings" in inc:
+        inc[f"service_counts.{service_id}"] = inc["bookings"]
+
+    fields = {}
+    last_visit = None
+    if new:
+        fields["name"] = new["client_name"]
+        fields["name_lower"] = new["client_name"].strip().lower()
+        username = normalize_username(new.get("client_telegram_username"))
+        if username:
+            fields["telegram_username"] = username
+        if new.get("status") == "completed":
+            last_visit = new["date"]
+
+    # Remoção de um cliente que não está na projeção não cria nada
+    client = await repo.update_client_counters(
+        phone,
+        current["client_phone"],
+        inc,
+        fields,
+        last_visit=last_visit,
+        upsert=new is not None
+    )
+    if not client:
+        return
+
+    counts = {k: v for k, v in (client.get("service_counts") or {}).items() if v > 0}
+    favorite = max(counts, key=counts.get) if counts else None
+    if favorite != client.get("favorite_service_id"):
+        await repo.set_client_fields(phone, {"favorite_service_id": favorite})
+
+
+async def rebuild_projection(repo: Repository, batch_size: int = 1000) -> int:
+    """
+    Recompute every client from appointments (hot + archive), write them
+    in bulk and drop clients that no longer have any appointment.
+    The storage groups the appointments; normalization and what counts
+    as a booking stay here (same rules as _apply_change).
+    """
+    started = datetime.utcnow()
+    prices = {s["id"]: float(s["price"]) for s in await repo.list_services()}
+
+    clients = {}
+    async for row in repo.iter_client_history(batch_size):
+        phone = normalize_phone(row.get("phone") or "")
+        if not phone or not row["latest"]:
+            continue
+
+        client = clients.setdefault(phone, {
+            "phone_variants": set(),
+            "bookings": 0,
+            "visit_count": 0,
+            "total_spend": 0.0,
+            "last_visit": None,
+            "service_counts": Counter(),
+            "latest": "",
+            "username": ("", None),
+        })
+        client["phone_variants"].add(row["phone"])
+
+        status = row.get("status")
+        bookings = 0 if status in NOT_BOOKED else row["count"]
+        client["bookings"] += bookings
+        if bookings and row.get("service_id"):
+            client["service_counts"][row["service_id"]] += bookings
+        if status == "completed":
+            client["visit_count"] += row["count"]
+            # Concluídos sem preço gravado: preço atual do serviço
+            client["total_spend"] += row["spend"] \
+                + row["unpriced"] * prices.get(row.get("service_id"), 0.0)
+            client["last_visit"] = max(client["last_visit"] or "", row["last_date"])
+
+        client["latest"] = max(client["latest"], row["latest"])
+        username = normalize_username(row.get("username"))
+        if username:
+            client["username"] = max(client["username"], (row["latest"], username))
+
+    batch = []
+    for phone, client in clients.items():
+        _, _, name = client["latest"].split(" ", 2)
+        counts = client["service_counts"]
+        batch.append({
+            "phone": phone,
+            "name": name,
+            "name_lower": name.strip().lower(),
+            "telegram_username": client["username"][1],
+            "phone_variants": sorted(client["phone_variants"]),
+            "bookings": client["bookings"],
+            "visit_count": client["visit_count"],
+            "total_spend": client["total_spend"],
+            "last_visit": client["last_visit"],
+            "service_counts": dict(counts),
+            "favorite_service_id": counts.most_common(1)[0][0] if counts else None,
+            "updated_at": datetime.utcnow(),
+        })
+        if len(batch) == batch_size:
+            await repo.upsert_clients(batch)
+            batch = []
+    await repo.upsert_clients(batch)
+
+    # Quem não foi reescrito (nem atualizado por uma escrita durante a
+    # reconstrução) não tem mais agendamentos
+    await repo.delete_clients_updated_before(started)
+
+    return len(clients)
+
+
+# =========================
+# Endpoints
+# =========================
+
+_PHONE_QUERY = re.compile(r"^[\d\s()+-]+$")
+
+
+async def _get_client_or_404(phone: str, repo: Repository) -> dict:
+    client = await repo.get_client(normalize_phone(phone))
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return client
+
+
+@router.get("/search", response_model=List[Client])
+async def search_clients(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, le=100),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Prefix search: digits search by phone, "@..." by Telegram username,
+    anything else by name. Anchored prefixes use the indexes.
+    """
+    q = q.strip()
+
+    if q.startswith("@"):
+        field, prefix = "telegram_username", normalize_username(q) or ""
+    elif _PHONE_QUERY.match(q):
+        field, prefix = "phone", normalize_phone(q)
+    else:
+        field, prefix = "name_lower", q.lower()
+
+    clients = await repo.search_clients(field, prefix, limit)
+
+    return [Client(**c) for c in clients]
+
+
+@router.get("/telegram/{username}", response_model=Client)
+async def get_client_by_telegram(
+    username: str,
+    repo: Repository = Depends(get_repository)
+):
+    """Get client by Telegram username"""
+    client = await repo.get_client_by_telegram(normalize_username(username))
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return Client(**client)
+
+
+@router.get("/{phone}", response_model=Client)
+async def get_client(
+    phone: str,
+    repo: Repository = Depends(get_repository)
+):
+    """Get client by phone (any format)"""
+    return Client(**await _get_client_or_404(phone, repo))
+
+
+@router.get("/{phone}/appointments", response_model=List[Appointment])
+async def get_client_appointments(
+    request: Request,
+    phone: str,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    repo: Repository = Depends(get_repository)
+):
+    """Client history (archive included), most recent first, streamed and paginated"""
+    client = await _get_client_or_404(phone, repo)
+    phones = client.get("phone_variants", [])
+
+    total = await repo.count_appointments(client_phones=phones, include_archive=True)
+    appointments = repo.iter_appointments(
+        client_phones=phones, skip=offset, limit=limit, include_archive=True
+    )
+
+    return stream_list(
+        appointments, Appointment,
+        request=request, total=total, offset=offset, limit=limit
+    )
+
+
+@router.post("/rebuild")
+async def rebuild_clients(repo: Repository = Depends(get_repository)):
+    """Rebuild the clients projection from all appointments (Admin)"""
+    count = await rebuild_projection(repo)
+    return {"message": "Clients rebuilt", "clients": count}
@@ -1,55 +1,56 @@
-from fastapi import APIRouter
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends
+from datetime import datetime
+from collections import Counter
 from models import DashboardStats
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import Optional
+from storage import Repository, get_repository
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
-# Database will be injected
-db: Optional[AsyncIOMotorDatabase] = None
-
-
-def set_db(database: AsyncIOMotorDatabase):
-    global db
-    db = database
-
 
 @router.get("/stats", response_model=DashboardStats)
-async def get_dashboard_stats():
+async def get_dashboard_stats(repo: Repository = Depends(get_repository)):
     """Get dashboard statistics"""
     # Total appointments
-    total_appointments = await db.appointments.count_documents({})
+    total_appointments = await repo.count_appointments()
     
     # Pending appointments
-    pending_appointments = await db.appointments.count_documents({"status": "pending"})
+    pending_appointments = await repo.count_appointments(status="pending")
     
     # Confirmed appointments
-    confirmed_appointments = await db.appointments.count_documents({"status": "confirmed"})
+    confirmed_appointments = await repo.count_appointments(status="confirmed")
     
     # Total services
-    total_services = await db.services.count_documents({"active": True})
+    total_services = await repo.count_services(active=True)
     
     # Revenue this month (completed appointments)
-    start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    completed_this_month = await db.appointments.find({
-        "status": "completed",
-        "date": {"$gte": start_of_month}
-    }).to_list(1000)
-    
+    # Datas são gravadas como "YYYY-MM-DD"
+    today = datetime.now().date()
+    start_of_month = today.replace(day=1).isoformat()
+    # Percorre o mês inteiro (sem teto) somando o preço gravado no
+    # agendamento; os antigos, sem preço, só são contados por serviço
     revenue_month = 0.0
-    for appointment in completed_this_month:
-        # Get service price
-        service = await db.services.find_one({"id": appointment["service_id"]})
+    completed_by_service = Counter()
+    async for appointment in repo.iter_appointments(
+        status="completed",
+        date_from=start_of_month
+    ):
+        if appointment.get("price") is not None:
+            revenue_month += appointment["price"]
+        else:
+            completed_by_service[appointment["service_id"]] += 1
+    
+    # Preço atual dos serviços numa consulta só
+    services = await repo.get_services(completed_by_service)
+    for service_id, count in completed_by_service.items():
+        service = services.get(service_id)
         if service:
-            revenue_month += service["price"]
+            revenue_month += service["price"] * count
     
     # Appointments today
-    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today_start + timedelta(days=1)
-    appointments_today = await db.appointments.count_documents({
-        "date": {"$gte": today_start, "$lt": today_end}
-    })
+    appointments_today = await repo.count_appointments(
+        date_from=today.isoformat(),
+        date_to=today.isoformat()
+    )
     
     return DashboardStats(
         total_appointments=total_appointments,
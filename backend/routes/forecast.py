@@ -0,0 +1,113 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date, datetime, timedelta
+from typing import Optional
+import os
+
+from cache import LockPool, TTLCache
+import events
+import monitoring
+import tenancy
+from storage import Repository, get_repository
+
+router = APIRouter(
+    prefix="/api/forecast",
+    tags=["Forecast"]
+)
+
+
+# =========================
+# Cache
+# =========================
+
+# O histórico (dois anos por padrão) quase não muda com as escritas do dia: só TTL,
+# mais mudanças de expediente/bloqueios (mudam capacidade e previsão)
+CACHE_TTL_SECONDS = int(os.getenv("FORECAST_CACHE_TTL_SECONDS", "3600"))
+HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "730"))
+MAX_HISTORY_DAYS = int(os.getenv("FORECAST_MAX_HISTORY_DAYS", str(3 * 366)))
+MINUTES_PER_DAY = 24 * 60
+
+_cache = TTLCache(tenancy.TENANT_CACHE_SIZE, CACHE_TTL_SECONDS)
+# Um cálculo por loja de cada vez: requisições iguais esperam e reusam
+_locks = LockPool(tenancy.TENANT_CACHE_SIZE)
+
+monitoring.register_cache("forecast", _cache.stats)
+
+
+def invalidate(shop_id: Optional[str] = None):
+    """Drop cached forecasts (of one shop)"""
+    if shop_id is None:
+        _cache.clear()
+    else:
+        _cache.pop_where(lambda key: key[0] == shop_id)
+
+
+async def _on_catalog_change(collection: str):
+    if collection in ("working_hours", "blocked_dates"):
+        invalidate(tenancy.current_shop())
+
+
+events.subscribe(events.CATALOG_CHANGED, _on_catalog_change)
+
+
+def _parse_range(date_from: Optional[str], date_to: Optional[str]):
+    try:
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to \
+            else datetime.utcnow().date()
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from \
+            else end - timedelta(days=HISTORY_DAYS - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Date out of range")
+
+    # As semanas começam na segunda anterior a start
+    if start < date.min + timedelta(days=7):
+        raise HTTPException(status_code=400, detail="Date out of range")
+
+    if start > end:
+        raise HTTPException(status_code=400, detail="date_from after date_to")
+    if (end - start).days >= MAX_HISTORY_DAYS:
+        raise HTTPException(status_code=400, detail="Range too long")
+
+    return start, end
+
+
+# =========================
+# Endpoint
+# =========================
+
+@router.get("/demand")
+async def demand_forecast(
+    date_from: Optional[str] = Query(None, example="2025-01-01"),
+    date_to: Optional[str] = Query(None, example="2025-12-31"),
+    slot_minutes: int = Query(30, ge=5, le=120),
+    weeks: int = Query(4, ge=1, le=12),
+    min_demand: float = Query(0.25, ge=0),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Occupancy, cancel and no-show heatmaps per weekday × slot over the
+    history (default: last FORECAST_HISTORY_DAYS days), expected demand
+    for the next `weeks` weeks and suggested working hours per weekday
+    (slots expecting at least `min_demand` bookings per day)
+    """
+    if MINUTES_PER_DAY % slot_minutes:
+        raise HTTPException(status_code=400, detail="slot_minutes must divide 24h")
+    start, end = _parse_range(date_from, date_to)
+    today = datetime.utcnow().date()
+
+    shop_id = tenancy.current_shop()
+    key = (shop_id, start, end, today, slot_minutes, weeks, min_demand)
+
+    result = _cache.get(key)
+    if result is None:
+        async with _locks[shop_id]:
+            result = _cache.get(key)
+            if result is None:
+                # NumPy só é carregado na primeira previsão, não no startup
+                import forecasting
+                result = await forecasting.build(
+                    repo, start, end, today, slot_minutes, weeks, min_demand
+                )
+                _cache.put(key, result)
+    return result
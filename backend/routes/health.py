@@ -0,0 +1,99 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import asyncio
+import os
+import time
+
+import monitoring
+
+router = APIRouter(
+    prefix="/api/health",
+    tags=["Health"]
+)
+
+_db = None
+
+def set_db(db):
+    global _db
+    _db = db
+
+
+# Limites de readiness (0 desativa o limite)
+PING_TIMEOUT_MS = float(os.getenv("READINESS_PING_TIMEOUT_MS", "1000"))
+MAX_DB_LATENCY_MS = float(os.getenv("READINESS_MAX_DB_LATENCY_MS", "500"))
+MAX_IN_FLIGHT = int(os.getenv("READINESS_MAX_IN_FLIGHT", "100"))
+
+
+async def ping_db() -> dict:
+    """Ping MongoDB with a timeout and measure the round-trip time"""
+    if _db is None:
+        # STORAGE_BACKEND=memory: não há banco externo para verificar
+        return {"ok": True, "backend": "memory", "latency_ms": 0.0}
+
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(
+            _db.command("ping"),
+            timeout=PING_TIMEOUT_MS / 1000
+        )
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": "timeout", "latency_ms": None}
+    except Exception as exc:
+        return {"ok": False, "error": str(exc), "latency_ms": None}
+
+    return {
+        "ok": True,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+@router.get("/live")
+async def liveness():
+    """
+    Liveness: o processo está de pé e o event loop responde.
+    Não toca dependências externas.
+    """
+    return {
+        "status": "ok",
+        "uptime_seconds": monitoring.uptime_seconds(),
+        "in_flight": monitoring.in_flight
+    }
+
+
+@router.get("/ready")
+async def readiness():
+    """
+    Readiness: MongoDB acessível e instância com folga.
+    Retorna 503 para o load balancer tirar a instância de rotação.
+    """
+    database = await ping_db()
+    in_flight = monitoring.in_flight
+
+    reasons = []
+    if not database["ok"]:
+        reasons.append(f"database: {database['error']}")
+    elif MAX_DB_LATENCY_MS and database["latency_ms"] > MAX_DB_LATENCY_MS:
+        reasons.append(
+            f"database latency {database['latency_ms']}ms > {MAX_DB_LATENCY_MS}ms"
+        )
+
+    if MAX_IN_FLIGHT and in_flight > MAX_IN_FLIGHT:
+        reasons.append(f"in-flight requests {in_flight} > {MAX_IN_FLIGHT}")
+
+    body = {
+        "status": "unavailable" if reasons else "ok",
+        "reasons": reasons,
+        "database": {
+            **database,
+            "pool": monitoring.mongo_pool.snapshot()
+        },
+        "in_flight": in_flight,
+        "pools": monitoring.pool_stats(),
+        "caches": monitoring.cache_stats(),
+        "thresholds": {
+            "max_db_latency_ms": MAX_DB_LATENCY_MS,
+            "max_in_flight": MAX_IN_FLIGHT
+        }
+    }
+
+    return JSONResponse(status_code=503 if reasons else 200, content=body)
@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+import asyncio
+
+from models import ProfilingUpdate
+import profiling
+
+router = APIRouter(
+    prefix="/api/profiling",
+    tags=["Profiling"]
+)
+
+
+async def startup():
+    # Tasks filhas (corpo em streaming) entram no tempo de CPU da requisição
+    profiling.install_task_factory(asyncio.get_running_loop())
+
+
+@router.get("")
+async def profiling_status():
+    """Profiling settings, per-route CPU/await times, slow queries and dumps (Admin)"""
+    return {
+        **profiling.current_settings(),
+        "profile_dir": str(profiling.PROFILE_DIR),
+        "routes": profiling.route_summary(),
+        "slow_queries": list(profiling.slow_queries),
+        "profiles": profiling.recent_dumps()
+    }
+
+
+@router.put("")
+async def update_profiling(update: ProfilingUpdate):
+    """Turn profiling on/off and tune it at runtime, in this process (Admin)"""
+    profiling.configure(**{
+        k.upper(): v for k, v in update.dict().items() if v is not None
+    })
+    return profiling.current_settings()
+
+
+@router.delete("/stats")
+async def reset_profiling_stats():
+    """Clear per-route stats and the slow query log (Admin)"""
+    profiling.reset()
+    return {"message": "Profiling stats cleared"}
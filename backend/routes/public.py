@@ -0,0 +1,167 @@
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.encoders import jsonable_encoder
+from datetime import datetime
+from typing import Optional
+import gzip
+import hashlib
+import json
+import os
+
+import brotli
+
+from cache import LockPool, TTLCache
+import events
+import monitoring
+import tenancy
+from models import BlockedDate, Service, Setting, WorkingHours
+from storage import Repository, get_repository
+
+router = APIRouter(
+    prefix="/api/public",
+    tags=["Public"]
+)
+
+
+# =========================
+# Bundle da página de agendamento
+# =========================
+
+# Eventos só chegam ao worker que fez a escrita: o TTL cobre os demais
+BOOTSTRAP_TTL_SECONDS = int(os.getenv("BOOTSTRAP_TTL_SECONDS", "60"))
+# max-age para o navegador/CDN; depois revalida com If-None-Match (304)
+BOOTSTRAP_MAX_AGE_SECONDS = int(os.getenv("BOOTSTRAP_MAX_AGE_SECONDS", "60"))
+
+# Chave = (loja, dia atual): bloqueios passados saem do bundle na virada do dia
+_cache = TTLCache(2 * tenancy.TENANT_CACHE_SIZE, BOOTSTRAP_TTL_SECONDS)
+# Um lock por loja: a reconstrução de uma não segura as outras
+_locks = LockPool(tenancy.TENANT_CACHE_SIZE)
+
+monitoring.register_cache("bootstrap", _cache.stats)
+
+
+def invalidate(shop_id: Optional[str] = None):
+    """Drop the bundle (of one shop); rebuilt on the next request"""
+    if shop_id is None:
+        _cache.clear()
+    else:
+        _cache.pop_where(lambda key: key[0] == shop_id)
+
+
+async def _on_catalog_change(collection: str):
+    invalidate(tenancy.current_shop())
+
+
+events.subscribe(events.CATALOG_CHANGED, _on_catalog_change)
+
+
+async def _build(repo: Repository, today: str) -> dict:
+    services = await repo.list_services(active=True)
+    settings = await repo.list_settings()
+    working_hours = await repo.list_working_hours()
+    blocked_dates = await repo.list_blocked_dates()
+
+    content = jsonable_encoder({
+        "services": [Service(**s) for s in services],
+        "settings": [Setting(**s) for s in settings],
+        "working_hours": sorted(
+            (WorkingHours(**w) for w in working_hours if w.get("active", True)),
+            key=lambda w: w.day_of_week
+        ),
+        "blocked_dates": sorted(
+            (BlockedDate(**b) for b in blocked_dates if b["date"] >= today),
+            key=lambda b: b.date
+        ),
+    })
+
+    # Versão = hash do conteúdo: igual em todos os workers enquanto nada muda
+    serialized = json.dumps(content, separators=(",", ":"), sort_keys=True)
+    version = hashlib.sha256(serialized.encode()).hexdigest()[:16]
+
+    body = json.dumps(
+        {"version": version, "generated_at": datetime.utcnow().isoformat(), **content},
+        separators=(",", ":"),
+        ensure_ascii=False
+    ).encode()
+
+    encoded = {
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9),
+        "br": brotli.compress(body, quality=11)
+    }
+
+    return {"version": version, "encoded": encoded}
+
+
+async def _get_bundle(repo: Repository) -> dict:
+    shop_id = tenancy.current_shop()
+    today = datetime.utcnow().date().isoformat()
+    key = (shop_id, today)
+
+    bundle = _cache.get(key)
+    if bundle is None:
+        # Uma reconstrução por vez: as demais requisições esperam e reusam
+        async with _locks[shop_id]:
+            bundle = _cache.get(key)
+            if bundle is None:
+                bundle = await _build(repo, today)
+                _cache.put(key, bundle)
+    return bundle
+
+
+def _negotiate(accept_encoding: str, available) -> str:
+    """Pick the best encoding the client accepts (br > gzip > identity)"""
+    accepted = set()
+    for token in accept_encoding.lower().split(","):
+        name, _, params = token.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                pass
+        accepted.add(name.strip())
+
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+@router.get("/bootstrap")
+async def get_bootstrap(
+    accept_encoding: str = Header("", alias="Accept-Encoding"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Everything the booking page needs for the first render (active
+    services, settings, working hours, upcoming blocked dates) in one
+    versioned, pre-compressed response. Availability stays per date in
+    /api/availability/.
+    """
+    bundle = await _get_bundle(repo)
+    # Fraco: a mesma versão é servida em mais de um Content-Encoding
+    etag = f'W/"{bundle["version"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={BOOTSTRAP_MAX_AGE_SECONDS}",
+        # A loja pode vir do header (não só do host): caches compartilhados
+        # e CDNs precisam separar as respostas por ele
+        "Vary": f"Accept-Encoding, {tenancy.TENANT_HEADER}",
+    }
+
+    if if_none_match and etag[2:] in [
+        t.strip().removeprefix("W/") for t in if_none_match.split(",")
+    ]:
+        return Response(status_code=304, headers=headers)
+
+    encoding = _negotiate(accept_encoding, bundle["encoded"])
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    return Response(
+        content=bundle["encoded"][encoding],
+        media_type="application/json",
+        headers=headers
+    )
@@ -0,0 +1,242 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional, Literal
+from datetime import datetime, timedelta
+from collections import defaultdict
+import os
+
+from cache import TTLCache
+import events
+import monitoring
+import tenancy
+from storage import Repository, get_repository
+from storage.buckets import truncate
+
+router = APIRouter(
+    prefix="/api/reports",
+    tags=["Reports"]
+)
+
+async def ensure_indexes(db):
+    # Cobre o $match + $group dos relatórios sem ler os documentos
+    for collection in (db.appointments, db.appointments_archive):
+        await collection.create_index(
+            [("date", 1), ("status", 1), ("service_id", 1), ("source", 1), ("price", 1)]
+        )
+
+
+Bucket = Literal["day", "week", "month"]
+GroupBy = Literal["none", "service", "source"]
+
+
+# =========================
+# Cache (invalidado a cada escrita em appointments da loja)
+# =========================
+
+CACHE_SIZE = 256
+# O TTL cobre escritas feitas por outros workers
+CACHE_TTL_SECONDS = int(os.getenv("REPORTS_CACHE_TTL_SECONDS", "300"))
+
+_cache = TTLCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+
+
+def invalidate(shop_id: Optional[str] = None):
+    """Drop cached reports (of one shop); called whenever appointments change"""
+    if shop_id is None:
+        _cache.clear()
+    else:
+        _cache.pop_where(lambda key: key[1] == shop_id)
+
+
+async def _on_change(*_):
+    invalidate(tenancy.current_shop())
+
+
+events.subscribe(events.APPOINTMENT_CHANGED, _on_change)
+events.subscribe(events.CATALOG_CHANGED, _on_change)
+
+monitoring.register_cache("reports", _cache.stats)
+
+
+# =========================
+# Utils
+# =========================
+
+def _parse_range(date_from: Optional[str], date_to: Optional[str]):
+    try:
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to \
+            else datetime.utcnow().date()
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from \
+            else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    if start > end:
+        raise HTTPException(status_code=400, detail="date_from after date_to")
+
+    return start, end
+
+
+def _slots(working_hours: dict) -> int:
+    start = datetime.strptime(working_hours["start_time"], "%H:%M")
+    end = datetime.strptime(working_hours["end_time"], "%H:%M")
+    interval = working_hours.get("interval_minutes", 30)
+    minutes = (end - start).total_seconds() / 60
+    return max(0, int(-(-minutes // interval)))
+
+
+# =========================
+# Endpoints
+# =========================
+
+@router.get("/bookings")
+async def bookings_report(
+    date_from: Optional[str] = Query(None, example="2026-01-01"),
+    date_to: Optional[str] = Query(None, example="2026-12-31"),
+    bucket: Bucket = Query("day"),
+    group_by: GroupBy = Query("none"),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Bookings and revenue (completed appointments) per day/week/month,
+    optionally split by service or source
+    """
+    start, end = _parse_range(date_from, date_to)
+
+    cache_key = ("bookings", tenancy.current_shop(), start, end, bucket, group_by)
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    rows = await repo.appointment_counts(start.isoformat(), end.isoformat(), bucket)
+    services = {s["id"]: s for s in await repo.list_services()}
+
+    series = defaultdict(lambda: {
+        "bookings": 0,
+        "cancelled": 0,
+        "completed": 0,
+        "revenue": 0.0
+    })
+
+    for row in rows:
+        group = None
+        if group_by == "service":
+            group = row.get("service_id")
+        elif group_by == "source":
+            group = row.get("source")
+
+        entry = series[(row["bucket"], group)]
+        count = row["count"]
+        status = row.get("status")
+
+        entry["bookings"] += count
+        if status == "cancelled":
+            entry["cancelled"] += count
+        elif status == "completed":
+            entry["completed"] += count
+            entry["revenue"] += row["revenue"]
+            # Agendamentos anteriores ao preço gravado: preço atual do serviço
+            service = services.get(row.get("service_id"))
+            if service and row.get("unpriced"):
+                entry["revenue"] += row["unpriced"] * float(service["price"])
+
+    result = []
+    for (bucket_start, group), values in sorted(
+        series.items(), key=lambda item: (item[0][0], str(item[0][1]))
+    ):
+        item = {"bucket": bucket_start, **values}
+        if group_by == "service":
+            item["service_id"] = group
+            item["service_name"] = services.get(group, {}).get("name")
+        elif group_by == "source":
+            item["source"] = group
+        result.append(item)
+
+    report = {
+        "date_from": start.isoformat(),
+        "date_to": end.isoformat(),
+        "bucket": bucket,
+        "group_by": group_by,
+        "totals": {
+            "bookings": sum(r["bookings"] for r in result),
+            "cancelled": sum(r["cancelled"] for r in result),
+            "completed": sum(r["completed"] for r in result),
+            "revenue": sum(r["revenue"] for r in result)
+        },
+        "series": result
+    }
+
+    _cache.put(cache_key, report)
+    return report
+
+
+@router.get("/occupancy")
+async def occupancy_report(
+    date_from: Optional[str] = Query(None, example="2026-01-01"),
+    date_to: Optional[str] = Query(None, example="2026-12-31"),
+    bucket: Bucket = Query("week"),
+    repo: Repository = Depends(get_repository)
+):
+    """
+    Booked slots (not cancelled) against capacity from working hours,
+    excluding blocked dates
+    """
+    start, end = _parse_range(date_from, date_to)
+
+    cache_key = ("occupancy", tenancy.current_shop(), start, end, bucket)
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    rows = await repo.appointment_counts(start.isoformat(), end.isoformat(), bucket)
+
+    working_hours = {
+        wh["day_of_week"]: _slots(wh)
+        for wh in await repo.list_working_hours() if wh.get("active")
+    }
+    blocked = {
+        b["date"]
+        for b in await repo.list_blocked_dates(start.isoformat(), end.isoformat())
+    }
+
+    capacity = defaultdict(int)
+    day = start
+    while day <= end:
+        if day.isoformat() not in blocked:
+            capacity[truncate(day, bucket).isoformat()] += \
+                working_hours.get(day.weekday(), 0)
+        day += timedelta(days=1)
+
+    booked = defaultdict(int)
+    for row in rows:
+        if row.get("status") != "cancelled":
+            booked[row["bucket"]] += row["count"]
+
+    series = []
+    for bucket_start in sorted(set(capacity) | set(booked)):
+        slots = capacity.get(bucket_start, 0)
+        taken = booked.get(bucket_start, 0)
+        series.append({
+            "bucket": bucket_start,
+            "capacity": slots,
+            "booked": taken,
+            "occupancy_rate": round(taken / slots, 4) if slots else None
+        })
+
+    total_capacity = sum(s["capacity"] for s in series)
+    total_booked = sum(s["booked"] for s in series)
+
+    report = {
+        "date_from": start.isoformat(),
+        "date_to": end.isoformat(),
+        "bucket": bucket,
+        "totals": {
+            "capacity": total_capacity,
+            "booked": total_booked,
+            "occupancy_rate": round(total_booked / total_capacity, 4)
+            if total_capacity else None
+        },
+        "series": series
+    }
+
+    _cache.put(cache_key, report)
+    return report
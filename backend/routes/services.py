@@ -1,37 +1,26 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional, List
 from datetime import datetime
 from models import Service, ServiceCreate, ServiceUpdate
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from storage import Repository, get_repository
+from streaming import stream_list
 
 router = APIRouter(prefix="/api/services", tags=["services"])
 
-# Database will be injected
-db: Optional[AsyncIOMotorDatabase] = None
-
-
-def set_db(database: AsyncIOMotorDatabase):
-    global db
-    db = database
-
 
 @router.get("", response_model=List[Service])
-async def get_services(active: Optional[bool] = Query(None)):
-    """Get all services"""
-    query = {}
-    
-    if active is not None:
-        query["active"] = active
-    
-    services = await db.services.find(query).sort("created_at", 1).to_list(100)
-    
-    return [Service(**service) for service in services]
+async def get_services(
+    active: Optional[bool] = Query(None),
+    repo: Repository = Depends(get_repository)
+):
+    """Get all services (streamed)"""
+    return stream_list(repo.iter_services(active), Service)
 
 
 @router.get("/{service_id}", response_model=Service)
-async def get_service(service_id: str):
+async def get_service(service_id: str, repo: Repository = Depends(get_repository)):
     """Get specific service"""
-    service = await db.services.find_one({"id": service_id})
+    service = await repo.get_service(service_id)
     
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -40,44 +29,38 @@ async def get_service(service_id: str):
 
 
 @router.post("", response_model=Service, status_code=201)
-async def create_service(service: ServiceCreate):
+async def create_service(service: ServiceCreate, repo: Repository = Depends(get_repository)):
     """Create new service (Admin)"""
     service_obj = Service(**service.dict())
     
-    await db.services.insert_one(service_obj.dict())
+    await repo.create_service(service_obj.dict())
     
     return service_obj
 
 
 @router.put("/{service_id}", response_model=Service)
-async def update_service(service_id: str, update: ServiceUpdate):
+async def update_service(
+    service_id: str,
+    update: ServiceUpdate,
+    repo: Repository = Depends(get_repository)
+):
     """Update service (Admin)"""
-    service = await db.services.find_one({"id": service_id})
-    
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
-    
     # Update fields
     update_data = {k: v for k, v in update.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.services.update_one(
-        {"id": service_id},
-        {"$set": update_data}
-    )
+    updated_service = await repo.update_service(service_id, update_data)
     
-    # Get updated service
-    updated_service = await db.services.find_one({"id": service_id})
+    if not updated_service:
+        raise HTTPException(status_code=404, detail="Service not found")
     
     return Service(**updated_service)
 
 
 @router.delete("/{service_id}")
-async def delete_service(service_id: str):
+async def delete_service(service_id: str, repo: Repository = Depends(get_repository)):
     """Delete service (Admin)"""
-    result = await db.services.delete_one({"id": service_id})
-    
-    if result.deleted_count == 0:
+    if not await repo.delete_service(service_id):
         raise HTTPException(status_code=404, detail="Service not found")
     
     return {"message": "Service deleted successfully"}
@@ -1,18 +1,64 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from pydantic import BaseModel
+import asyncio
+import hmac
+import logging
 import os
-import httpx
+
+from cache import TTLCache
+import idempotency
+import monitoring
+from storage import Repository, get_storage
+import tenancy
+import telegram_bot
+import telegram_client
+from telegram_client import send_message
 
 router = APIRouter(
     prefix="/api/telegram",
     tags=["Telegram"]
 )
 
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-if not BOT_TOKEN:
-    raise RuntimeError("TELEGRAM_BOT_TOKEN não definido")
+logger = logging.getLogger("primo-barber.telegram")
+
+# O server só inclui este router quando o Telegram está habilitado
+# (TELEGRAM_ENABLED / TELEGRAM_BOT_TOKEN), então não falhamos no import.
+
+# Obrigatório para o webhook: sem ele qualquer um que ache a URL forja
+# updates (e agenda horários). Registrar com setWebhook(secret_token=...)
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+if not WEBHOOK_SECRET:
+    logger.warning("TELEGRAM_WEBHOOK_SECRET not set: the webhook refuses every update")
+WORKERS = int(os.getenv("TELEGRAM_WORKERS", "4"))
+QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000"))
+UPDATE_TTL_SECONDS = 24 * 3600
+
+# Uma fila por worker, escolhida pelo chat_id: updates do mesmo chat são
+# processados em ordem, chats diferentes em paralelo. Cada item leva a
+# loja do webhook (o bot atende a loja do host/header do webhook).
+_queues: list[asyncio.Queue] = []
+_workers: list[asyncio.Task] = []
+_seen_updates = TTLCache(50_000, UPDATE_TTL_SECONDS)
+_stats = {"received": 0, "ignored": 0, "duplicates": 0, "processed": 0, "failed": 0}
+
+
+def queue_stats() -> dict:
+    return {
+        **_stats,
+        "workers": len(_workers),
+        "queued": sum(q.qsize() for q in _queues)
+    }
+
 
-TELEGRAM_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
+monitoring.register_pool("telegram_updates", queue_stats)
+
+
+async def ensure_indexes(db):
+    await db.telegram_updates.create_index(
+        "received_at",
+        expireAfterSeconds=UPDATE_TTL_SECONDS
+    )
+    await telegram_bot.ensure_indexes(db)
 
 
 # =========================
@@ -26,30 +72,100 @@ class TelegramMessage(BaseModel):
 
 
 # =========================
-# Utils
+# Fila de updates
 # =========================
 
-async def send_message(chat_id: int, text: str, reply_markup: dict | None = None):
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML"
-    }
+async def _first_delivery(update_id: int) -> bool:
+    """Persistent dedup across restarts and workers (telegram_updates is global)"""
+    return await Repository(get_storage()).record_telegram_update(update_id)
 
-    if reply_markup:
-        payload["reply_markup"] = reply_markup
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{TELEGRAM_API}/sendMessage",
-            json=payload
-        )
+async def _worker(queue: asyncio.Queue):
+    while True:
+        shop_id, update = await queue.get()
+        try:
+            with tenancy.using(shop_id):
+                if await _first_delivery(update["update_id"]):
+                    await telegram_bot.handle_update(update)
+                    _stats["processed"] += 1
+                else:
+                    _stats["duplicates"] += 1
+        except Exception:
+            _stats["failed"] += 1
+            logger.exception("Failed to process update %s", update.get("update_id"))
+        finally:
+            queue.task_done()
 
-    if response.status_code != 200:
-        raise HTTPException(
-            status_code=500,
-            detail=response.text
-        )
+
+async def startup():
+    for _ in range(WORKERS):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        _queues.append(queue)
+        _workers.append(asyncio.create_task(_worker(queue)))
+
+
+async def shutdown():
+    for task in _workers:
+        task.cancel()
+    _workers.clear()
+    _queues.clear()
+    await telegram_client.close()
+
+
+async def drain():
+    """Wait until every queued update was processed"""
+    for queue in _queues:
+        await queue.join()
+
+
+# =========================
+# Webhook do Telegram
+# =========================
+
+@router.post("/webhook")
+async def telegram_webhook(
+    request: Request,
+    secret_token: str | None = Header(None, alias="X-Telegram-Bot-Api-Secret-Token")
+):
+    """
+    Recebe updates do Telegram. Só valida, deduplica e enfileira: o
+    processamento acontece nos workers, então a resposta é imediata.
+    """
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="Webhook secret not configured")
+    if not secret_token or not hmac.compare_digest(secret_token, WEBHOOK_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid secret token")
+
+    # Telegram reenvia qualquer resposta != 2xx: updates que não entendemos
+    # são descartados com 200, senão voltariam para sempre
+    try:
+        update = await request.json()
+    except ValueError:
+        update = None
+    update_id = update.get("update_id") if isinstance(update, dict) else None
+    if not isinstance(update_id, int):
+        logger.warning("Ignoring malformed Telegram update")
+        return {"ok": True}
+    # Edições de mensagem e afins: nem fila, nem dedup, nem telegram_updates
+    if not telegram_bot.handles(update):
+        _stats["ignored"] += 1
+        return {"ok": True}
+
+    _stats["received"] += 1
+    if _seen_updates.get(update_id) is not None:
+        _stats["duplicates"] += 1
+        return {"ok": True}
+
+    chat_id = telegram_bot.chat_id_of(update)
+    queue = _queues[(chat_id if isinstance(chat_id, int) else 0) % len(_queues)]
+    try:
+        queue.put_nowait((tenancy.current_shop(), update))
+    except asyncio.QueueFull:
+        # Telegram reenvia depois: backpressure em vez de memória sem limite
+        raise HTTPException(status_code=503, detail="Update queue full")
+
+    _seen_updates.put(update_id, True)
+    return {"ok": True}
 
 
 # =========================
@@ -57,14 +173,25 @@ async def send_message(chat_id: int, text: str, reply_markup: dict | None = None
 # =========================
 
 @router.post("/send")
-async def send_from_n8n(message: TelegramMessage):
+async def send_from_n8n(
+    message: TelegramMessage,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key")
+):
     """
-    Endpoint chamado pelo n8n para enviar mensagens Telegram
+    Endpoint chamado pelo n8n para enviar mensagens Telegram.
+    Com `Idempotency-Key`, retries do n8n não duplicam a mensagem.
     """
-    await send_message(
-        chat_id=message.chat_id,
-        text=message.text,
-        reply_markup=message.reply_markup
-    )
+    async def send():
+        await send_message(
+            chat_id=message.chat_id,
+            text=message.text,
+            reply_markup=message.reply_markup
+        )
+        return {"ok": True}
 
-    return {"ok": True}
+    if idempotency_key:
+        return await idempotency.run(
+            "telegram-send", idempotency_key, message, send
+        )
+
+    return await send()
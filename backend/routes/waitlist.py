@@ -0,0 +1,337 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+
+import events
+import tenancy
+from models import Appointment, WaitlistEntry, WaitlistEntryCreate
+import telegram_bot
+import telegram_client
+from routes.avaliability import day_slots
+from storage import Repository, get_repository, get_storage, list_shops
+from streaming import stream_list
+
+router = APIRouter(
+    prefix="/api/waitlist",
+    tags=["Waitlist"]
+)
+
+logger = logging.getLogger("primo-barber.waitlist")
+
+# Oferta é feita pelo bot: o server só inclui este router com o Telegram
+# habilitado.
+
+# Vaga fica reservada (agendamento "held") por este tempo para quem recebeu a oferta
+HOLD_MINUTES = int(os.getenv("WAITLIST_HOLD_MINUTES", "15"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("WAITLIST_SWEEP_INTERVAL_SECONDS", "30"))
+
+_task: Optional[asyncio.Task] = None
+# Referências aos matchers em andamento (create_task sem referência pode ser coletado)
+_pending: set = set()
+
+
+async def ensure_indexes(db):
+    await db.waitlist.create_index("id", unique=True)
+    # Matcher: igualdade em status/date/slots (multikey) + ordem de chegada.
+    # Uma descida na árvore por cancelamento, qualquer que seja o tamanho da fila.
+    await db.waitlist.create_index(
+        [("status", 1), ("date", 1), ("slots", 1), ("created_at", 1)],
+        name="match"
+    )
+    await db.waitlist.create_index([("status", 1), ("offer_expires_at", 1)])
+    await db.waitlist.create_index([("service_id", 1), ("date", 1)])
+
+
+# =========================
+# Matcher (cancelamento -> oferta)
+# =========================
+
+def _frees_slot(old: Optional[dict], new: Optional[dict]) -> bool:
+    if not old or old.get("status") == "cancelled":
+        return False
+    return new is None or new.get("status") == "cancelled"
+
+
+async def _on_appointment_change(old: Optional[dict], new: Optional[dict]):
+    if not _frees_slot(old, new):
+        return
+    if old["date"] < datetime.utcnow().date().isoformat():
+        return
+
+    # Fora do caminho da requisição que cancelou
+    task = asyncio.create_task(backfill(old["date"], old["time"]))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+events.subscribe(events.APPOINTMENT_CHANGED, _on_appointment_change)
+
+
+async def _claim(repo: Repository, date: str, time: str) -> Optional[dict]:
+    """Atomically take the oldest waiting entry that wants this slot"""
+    now = datetime.utcnow()
+    return await repo.claim_waitlist_entry(date, time, {
+        "status": "offered",
+        "offer_time": time,
+        "offer_expires_at": now + timedelta(minutes=HOLD_MINUTES),
+        "updated_at": now
+    })
+
+
+async def _unclaim(repo: Repository, entry: dict):
+    """Put a claimed entry back in line (keeps its created_at)"""
+    await repo.update_waitlist_entry(
+        entry["id"],
+        {"status": "waiting", "updated_at": datetime.utcnow()},
+        only_if_status=["offered"],
+        unset=["offer_time", "offer_expires_at"]
+    )
+
+
+async def backfill(date: str, time: str) -> Optional[dict]:
+    """
+    Offer a freed slot to the next waitlisted client: hold it with a
+    "held" appointment and send the offer over Telegram. Returns the
+    entry offered, if any.
+    """
+    try:
+        repo = Repository(get_storage())
+
+        # Bloqueio/expediente; a vaga em si é conferida na escrita da reserva
+        if await repo.slot_problem(date, time):
+            return None
+
+        entry = await _claim(repo, date, time)
+        if entry is None:
+            return None
+
+        service = await repo.get_service(entry["service_id"])
+        hold = Appointment(
+            client_name=entry["client_name"],
+            client_phone=entry["client_phone"],
+            service_id=entry["service_id"],
+            price=service["price"] if service else None,
+            date=date,
+            time=time,
+            status="held",
+            source="waitlist"
+        )
+        # Reagendado entre o cancelamento e aqui: a entrada volta para a fila
+        if not await repo.create_appointment_if_free(hold.dict(exclude_none=True)):
+            await _unclaim(repo, entry)
+            return None
+        await repo.update_waitlist_entry(entry["id"], {"offer_appointment_id": hold.id})
+
+        await _send_offer(entry, time)
+        return entry
+    except Exception:
+        logger.exception("Waitlist backfill failed for %s %s", date, time)
+        return None
+
+
+async def _send_offer(entry: dict, time: str):
+    day = datetime.strptime(entry["date"], "%Y-%m-%d")
+    await telegram_client.send_message(
+        entry["telegram_chat_id"],
+        "🔔 Vagou um horário da sua lista de espera!\n\n"
+        f"📅 {day.strftime('%d/%m/%Y')} às {time}\n"
+        f"Reservado para você por {HOLD_MINUTES} minutos.",
+        {"inline_keyboard": [[
+            {"text": "✅ Quero", "callback_data": f"wl:yes:{entry['id']}"},
+            {"text": "❌ Não quero", "callback_data": f"wl:no:{entry['id']}"}
+        ]]}
+    )
+
+
+async def _release(repo: Repository, entry: dict, status: str):
+    """Close an offer and free its hold (which offers it to the next in line)"""
+    if entry.get("offer_appointment_id"):
+        # Só a reserva: se já foi confirmada, o agendamento fica
+        await repo.update_appointment(
+            entry["offer_appointment_id"],
+            {"status": "cancelled"},
+            only_if_status="held"
+        )
+    logger.info("Waitlist offer %s %s", entry["id"], status)
+
+
+# =========================
+# Resposta pelo bot
+# =========================
+
+async def _on_offer_answer(chat_id: int, value: str, callback: dict):
+    answer, _, entry_id = value.partition(":")
+    now = datetime.utcnow()
+    repo = Repository(get_storage())
+
+    if answer != "yes":
+        entry = await repo.close_waitlist_offer(entry_id, chat_id, now, "declined")
+        if entry is None:
+            await telegram_client.send_message(chat_id, "Essa oferta não está mais disponível.")
+            return
+        await _release(repo, entry, "declined")
+        await telegram_client.send_message(chat_id, "Tudo bem, liberamos o horário.")
+        return
+
+    # A reserva decide: só confirma se ainda está "held" (expiração e saída
+    # da fila só a cancelam com a mesma condição)
+    entry = await repo.get_waitlist_offer(entry_id, chat_id, now)
+    confirmed = None
+    if entry is not None and entry.get("offer_appointment_id"):
+        confirmed = await repo.update_appointment(
+            entry["offer_appointment_id"],
+            {"status": "confirmed"},
+            only_if_status="held"
+        )
+    if confirmed is None:
+        await telegram_client.send_message(chat_id, "Essa oferta não está mais disponível.")
+        return
+
+    await repo.update_waitlist_entry(entry_id, {"status": "booked", "updated_at": now})
+
+    await telegram_client.send_message(
+        chat_id,
+        f"✅ Agendamento confirmado para {entry['offer_time']}!\n"
+        f"Código: <code>{entry['offer_appointment_id'][:8]}</code>"
+    )
+
+
+telegram_bot.register_callback("wl", _on_offer_answer)
+
+
+# =========================
+# Expiração das reservas
+# =========================
+
+async def expire_offers() -> int:
+    """Expire offers and past entries of every shop"""
+    expired = 0
+    for shop_id in await list_shops("waitlist"):
+        with tenancy.using(shop_id):
+            expired += await _expire_shop_offers()
+    return expired
+
+
+async def _expire_shop_offers() -> int:
+    repo = Repository(get_storage())
+    now = datetime.utcnow()
+    expired = 0
+
+    while True:
+        entry = await repo.expire_waitlist_offer(now)
+        if entry is None:
+            break
+        expired += 1
+        await _release(repo, entry, "expired")
+        await telegram_client.send_message(
+            entry["telegram_chat_id"],
+            "⌛ O horário reservado para você expirou."
+        )
+
+    # Datas que já passaram não serão mais oferecidas
+    await repo.expire_past_waitlist(now.date().isoformat(), now)
+    return expired
+
+
+async def _sweep():
+    while True:
+        try:
+            await expire_offers()
+        except Exception:
+            logger.exception("Waitlist sweep failed")
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+
+async def startup():
+    global _task
+    _task = asyncio.create_task(_sweep())
+
+
+async def shutdown():
+    if _task is not None:
+        _task.cancel()
+    for task in list(_pending):
+        task.cancel()
+
+
+# =========================
+# Endpoints
+# =========================
+
+@router.post("", response_model=WaitlistEntry, status_code=201)
+async def join_waitlist(
+    payload: WaitlistEntryCreate,
+    repo: Repository = Depends(get_repository)
+):
+    """Join the waitlist for a day (optionally a time window)"""
+    try:
+        datetime.strptime(payload.date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    if await repo.get_blocked_date(payload.date):
+        raise HTTPException(status_code=400, detail="This date is blocked")
+
+    working_hours = await repo.working_hours_for(payload.date)
+    if not working_hours:
+        raise HTTPException(status_code=400, detail="No working hours for this day")
+
+    if not await repo.get_service(payload.service_id):
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    # A janela vira a lista de horários: o matcher casa por igualdade
+    slots = [
+        s for s in day_slots(working_hours)
+        if (not payload.time_from or s >= payload.time_from)
+        and (not payload.time_to or s <= payload.time_to)
+    ]
+    if not slots:
+        raise HTTPException(status_code=400, detail="No slots in this time window")
+
+    entry = WaitlistEntry(**payload.dict(), slots=slots)
+    await repo.create_waitlist_entry(entry.dict())
+
+    return entry
+
+
+@router.get("", response_model=List[WaitlistEntry])
+async def list_waitlist(
+    request: Request,
+    date: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    repo: Repository = Depends(get_repository)
+):
+    """List waitlist entries in arrival order, streamed (Admin)"""
+    total = await repo.count_waitlist(date, status)
+    entries = repo.iter_waitlist(date, status, skip=offset, limit=limit)
+
+    return stream_list(
+        entries, WaitlistEntry,
+        request=request, total=total, offset=offset, limit=limit
+    )
+
+
+@router.delete("/{entry_id}")
+async def leave_waitlist(
+    entry_id: str,
+    repo: Repository = Depends(get_repository)
+):
+    """Leave the waitlist (releases a pending offer)"""
+    entry = await repo.update_waitlist_entry(
+        entry_id,
+        {"status": "cancelled", "updated_at": datetime.utcnow()},
+        only_if_status=["waiting", "offered"]
+    )
+
+    if not entry:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+
+    if entry["status"] == "offered":
+        await _release(repo, entry, "cancelled")
+
+    return {"message": "Waitlist entry cancelled"}
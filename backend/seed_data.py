@@ -8,6 +8,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from pathlib import Path
 from models import Service, Setting
+from storage.scoped import ScopedDatabase
+import tenancy
 from datetime import datetime
 
 ROOT_DIR = Path(__file__).parent
@@ -109,7 +111,11 @@ async def seed_database():
     # Connect to MongoDB
     mongo_url = os.environ['MONGO_URL']
     client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ['DB_NAME']]
+    # SHOP_ID=<loja> popula uma loja específica (padrão: DEFAULT_SHOP_ID)
+    db = ScopedDatabase(
+        client[os.environ['DB_NAME']],
+        os.getenv("SHOP_ID", tenancy.DEFAULT_SHOP_ID)
+    )
     
     print("🌱 Starting database seeding...")
     
@@ -12,30 +12,125 @@ load_dotenv(ROOT_DIR / ".env")
 # --------------------------------------------------
 from fastapi import FastAPI, APIRouter
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from contextlib import asynccontextmanager
+from collections import defaultdict
+import asyncio
+import importlib
 import os
 import logging
 
-from routes import (
-    appointments,
-    services,
-    settings,
-    dashboard,
-    telegram,
-    working_hours,
-    avaliability,
-)
+import idempotency
+import monitoring
+import profiling
+import ratelimit
+import tenancy
+from storage import init_storage
+from storage.memory import MemoryStorage
+from storage.mongo import MongoStorage
+from storage.scoped import ScopedDatabase, migrate
 
 # --------------------------------------------------
 # Config
 # --------------------------------------------------
-mongo_url = os.environ["MONGO_URL"]
-db_name = os.environ["DB_NAME"]
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("primo-barber")
 
+# mongo (produção) | memory (testes, benchmarks e dev sem MongoDB)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+if STORAGE_BACKEND not in ("mongo", "memory"):
+    raise RuntimeError(f"STORAGE_BACKEND inválido: {STORAGE_BACKEND}")
+
+MONGO_ENABLED = STORAGE_BACKEND == "mongo"
+
+if MONGO_ENABLED:
+    mongo_url = os.environ["MONGO_URL"]
+    db_name = os.environ["DB_NAME"]
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Subsistemas opcionais ficam atrás de feature flags: o módulo só é
+# importado (e suas dependências carregadas) quando estiver habilitado.
+TELEGRAM_ENABLED = _env_flag(
+    "TELEGRAM_ENABLED",
+    default=bool(os.getenv("TELEGRAM_BOT_TOKEN")),
+)
+
+if TELEGRAM_ENABLED and not os.getenv("TELEGRAM_BOT_TOKEN"):
+    raise RuntimeError("TELEGRAM_ENABLED=true mas TELEGRAM_BOT_TOKEN não definido")
+
+# (module name, enabled, needs db)
+# Routers sem acesso direto ao banco usam storage.Repository via Depends
+ROUTE_MODULES = [
+    ("health", True, True),
+    ("appointments", True, False),
+    ("services", True, False),
+    ("settings", True, False),
+    ("dashboard", True, False),
+    ("telegram", TELEGRAM_ENABLED, False),
+    ("waitlist", TELEGRAM_ENABLED, False),
+    ("working_hours", True, False),
+    ("blocked_dates", True, False),
+    ("avaliability", True, False),
+    ("public", True, False),
+    ("profiling", True, False),
+    ("forecast", True, False),
+    ("clients", True, False),
+    ("reports", True, False),
+    ("archive", True, False),
+]
+
+
+def load_route_modules():
+    """Import only the enabled router modules"""
+    modules = []
+    for name, enabled, needs_db in ROUTE_MODULES:
+        if not enabled:
+            logger.info("Router %s disabled", name)
+            continue
+        modules.append((importlib.import_module(f"routes.{name}"), needs_db))
+    return modules
+
+
+route_modules = load_route_modules()
+
+# Módulos que não são routers mas usam o banco
+service_modules = [ratelimit, idempotency]
+
+
+async def ensure_indexes(db, storage):
+    """
+    Create indexes declared by the storage and by modules
+    (`ensure_indexes(db)`), led by shop_id (db is a ScopedDatabase).
+    Runs in background so an unreachable MongoDB does not block startup.
+    """
+    try:
+        # Base de loja única -> multi-tenant (uma vez por banco)
+        await migrate(db.unscoped)
+    except Exception:
+        logger.exception("Failed to migrate database to multi-tenant")
+
+    try:
+        await storage.ensure_indexes()
+    except Exception:
+        logger.exception("Failed to create storage indexes")
+
+    modules = [m for m, _ in route_modules] + service_modules
+    for module in modules:
+        if not hasattr(module, "ensure_indexes"):
+            continue
+        try:
+            await module.ensure_indexes(db)
+        except Exception:
+            logger.exception("Failed to create indexes for %s", module.__name__)
+
 # --------------------------------------------------
 # Lifespan
 # --------------------------------------------------
@@ -43,23 +138,58 @@ logger = logging.getLogger("primo-barber")
 async def lifespan(app: FastAPI):
     logger.info("🚀 Starting Primo Barber API")
 
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    if MONGO_ENABLED:
+        # Um client (e um pool de conexões) para todas as lojas; cada
+        # consulta é filtrada pela loja da requisição (storage.scoped)
+        client = AsyncIOMotorClient(
+            mongo_url,
+            event_listeners=[monitoring.mongo_pool, profiling.command_listener]
+        )
+        db = ScopedDatabase(client[db_name])
+        storage = MongoStorage(db)
+        init_storage(lambda shop_id: MongoStorage(db.for_shop(shop_id)), db.shops)
+    else:
+        # Sem banco: módulos com set_db recebem None e usam só memória
+        client = db = storage = None
+        # Os dados de cada loja vivem no próprio storage: ficam aqui, fora
+        # do LRU de get_storage (limitados pela lista SHOP_IDS)
+        memory_storages = defaultdict(MemoryStorage)
+
+        async def memory_shops(collection: str):
+            return list(memory_storages)
 
-    appointments.set_db(db)
-    services.set_db(db)
-    settings.set_db(db)
-    dashboard.set_db(db)
-    working_hours.set_db(db)
-    avaliability.set_db(db)
+        init_storage(memory_storages.__getitem__, memory_shops)
+        logger.info("Using in-memory storage (nothing is persisted)")
+
+    for module, needs_db in route_modules:
+        if needs_db:
+            module.set_db(db)
+    for module in service_modules:
+        if hasattr(module, "set_db"):
+            module.set_db(db)
 
     app.state.db = db
     app.state.mongo_client = client
 
+    index_task = asyncio.create_task(ensure_indexes(db, storage)) \
+        if MONGO_ENABLED else None
+
+    modules = [m for m, _ in route_modules] + service_modules
+    for module in modules:
+        if hasattr(module, "startup"):
+            await module.startup()
+
     yield
 
+    if index_task is not None:
+        index_task.cancel()
+
     logger.info("🛑 Shutting down Primo Barber API")
-    client.close()
+    for module in modules:
+        if hasattr(module, "shutdown"):
+            await module.shutdown()
+    if client is not None:
+        client.close()
 
 # --------------------------------------------------
 # App
@@ -84,6 +214,7 @@ async def root():
 
 @api_router.get("/health")
 async def health_check():
+    # Mantido para compatibilidade: equivale ao liveness (/api/health/live)
     return {
         "status": "ok",
         "service": "primo-barber-api"
@@ -93,13 +224,13 @@ async def health_check():
 # Routers
 # --------------------------------------------------
 app.include_router(api_router)
-app.include_router(appointments.router)
-app.include_router(services.router)
-app.include_router(settings.router)
-app.include_router(dashboard.router)
-app.include_router(telegram.router)
-app.include_router(working_hours.router)
-app.include_router(avaliability.router)
+
+for module, _ in route_modules:
+    app.include_router(module.router)
+
+# Rate limit / concorrência das rotas públicas antes do roteamento (o corpo
+# nem é lido quando rejeitada); por dentro do CORS para o 429 chegar ao browser
+app.add_middleware(ratelimit.AdmissionMiddleware)
 
 # --------------------------------------------------
 # CORS
@@ -111,3 +242,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Respostas grandes (listas, relatórios) saem comprimidas quando o cliente
+# aceita; as já comprimidas (ex.: /api/public/bootstrap) passam direto
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")),
+    compresslevel=int(os.getenv("GZIP_LEVEL", "6")),
+)
+
+app.add_middleware(monitoring.QueryCountMiddleware)
+app.add_middleware(monitoring.InFlightMiddleware)
+# Loja da requisição (X-Shop-Id / subdomínio) para tudo que vem depois
+app.add_middleware(tenancy.TenantMiddleware)
+# Mais externo: o tempo medido inclui os demais middlewares (gzip etc.)
+app.add_middleware(profiling.ProfilingMiddleware)
@@ -0,0 +1,17 @@
+"""
+Camada de acesso a dados compartilhada pelos routers.
+
+`Storage` (ex.: MongoStorage) fala com o banco; `Repository` é criado por
+requisição via `Depends(get_repository)` e concentra as consultas comuns
+(bloqueios, horário de trabalho, conflitos, serviços) com memo por
+requisição e contagem de consultas.
+"""
+from storage.repository import (
+    Repository,
+    get_repository,
+    get_storage,
+    init_storage,
+    list_shops,
+)
+
+__all__ = ["Repository", "get_repository", "get_storage", "init_storage", "list_shops"]
@@ -0,0 +1,29 @@
+"""
+Archive horizon shared by the storage backends and the routers.
+
+Appointments dated before `cutoff_date()` are moved by routes/archive.py
+from `appointments` to `appointments_archive`; queries only read the
+archive when their range reaches back past it, or, without a start
+date, when the caller asks for it (include_archive).
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import os
+
+HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+
+
+def cutoff_date() -> str:
+    """Appointments dated before this day live in the archive"""
+    return (datetime.utcnow().date() - timedelta(days=HORIZON_DAYS)).isoformat()
+
+
+def reaches_archive(date_from: Optional[str], include_archive: bool = False) -> bool:
+    """
+    Whether a query starting at `date_from` reads archived records. Open
+    ranges (no date_from) only do when the caller opts in: listing
+    everything shouldn't open a second cursor on every page.
+    """
+    if date_from is None:
+        return include_archive
+    return date_from < cutoff_date()
@@ -0,0 +1,13 @@
+"""
+Report buckets shared by the storage backends and routes/reports.py.
+"""
+from datetime import date, timedelta
+
+
+def truncate(day: date, bucket: str) -> date:
+    """Start of the bucket of `day`: same as $dateTrunc (weeks start on monday)"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
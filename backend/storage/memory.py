@@ -0,0 +1,937 @@
+"""
+In-memory storage backend (STORAGE_BACKEND=memory).
+
+Same interface as MongoStorage, for tests, benchmarks and local runs
+without a MongoDB. Single process only: nothing is persisted.
+
+Appointments (hot and archive) are indexed the way the Mongo collections are:
+  - id -> document (dict, unique index on id)
+  - sorted list of (date, time, id)   ~ index (date, time)
+  - status -> sorted list of (date, time, id) ~ index (status, date, time)
+  - client_phone -> set of ids         ~ index (client_phone, date)
+Clients keep sorted (value, phone) lists for phone, name_lower and
+telegram_username; waiting waitlist entries are kept per date in arrival
+order (~ the "match" index).
+Lookups use bisect on those lists, so the cost of each query is the cost
+the matching Mongo index would have: O(log n + k) for k matches.
+
+`iter_appointments` walks the index by key rather than by position, so
+writes made while a response is still streaming don't skip or repeat
+entries (same as a Mongo cursor).
+
+Inserting a duplicate appointment/service id or setting key raises
+pymongo's DuplicateKeyError, as the unique indexes do in MongoStorage.
+Nothing expires here (no TTL indexes): archived cancellations and
+idempotency keys are kept for the life of the process.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from copy import deepcopy
+from datetime import datetime
+from heapq import merge
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from storage.archive import reaches_archive
+from storage.buckets import truncate
+
+# Maior que qualquer hora/id: fecha intervalos em bisect_right
+_MAX = "\uffff"
+
+# Campos de clients com índice (busca por prefixo e igualdade)
+_CLIENT_INDEXES = ("phone", "name_lower", "telegram_username")
+
+
+def _copy(doc: Optional[dict]) -> Optional[dict]:
+    return dict(doc) if doc is not None else None
+
+
+def _unarchived(doc: dict) -> dict:
+    # Como a projeção {"archived_at": 0} das leituras do arquivo em MongoStorage
+    return {k: v for k, v in doc.items() if k != "archived_at"}
+
+
+def _sort_key(appointment: dict):
+    return appointment["date"], appointment["time"]
+
+
+def _duplicate(collection: str, field: str, value) -> DuplicateKeyError:
+    # Mesmo erro dos índices únicos de MongoStorage.ensure_indexes
+    message = (
+        f"E11000 duplicate key error collection: {collection} "
+        f"index: {field}_1 dup key: {{ {field}: {value!r} }}"
+    )
+    return DuplicateKeyError(message, 11000, {
+        "code": 11000,
+        "errmsg": message,
+        "keyPattern": {field: 1},
+        "keyValue": {field: value}
+    })
+
+
+def _bounds(date_from: Optional[str], date_to: Optional[str]) -> Tuple[tuple, tuple]:
+    return (date_from or "",), ((date_to or _MAX) + _MAX,)
+
+
+def _walk_desc(entries: list, low: tuple, high: tuple):
+    """Index keys in [low, high], highest first, resuming by key after each one"""
+    position = bisect_right(entries, high)
+    while position > 0 and entries[position - 1] >= low:
+        key = entries[position - 1]
+        yield key
+        position = bisect_left(entries, key)
+
+
+class _Appointments:
+    """One appointments collection (hot or archive): documents and their indexes"""
+
+    def __init__(self):
+        self.docs: Dict[str, dict] = {}
+        self.by_slot: List[Tuple[str, str, str]] = []
+        self.by_status: Dict[str, List[Tuple[str, str, str]]] = defaultdict(list)
+        self.by_phone: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def get(self, appointment_id: str) -> Optional[dict]:
+        return self.docs.get(appointment_id)
+
+    def _index(self, doc: dict):
+        key = (doc["date"], doc["time"], doc["id"])
+        insort(self.by_slot, key)
+        insort(self.by_status[doc.get("status")], key)
+        self.by_phone[doc["client_phone"]].add(doc["id"])
+
+    def _unindex(self, doc: dict):
+        key = (doc["date"], doc["time"], doc["id"])
+        del self.by_slot[bisect_left(self.by_slot, key)]
+        by_status = self.by_status[doc.get("status")]
+        del by_status[bisect_left(by_status, key)]
+        self.by_phone[doc["client_phone"]].discard(doc["id"])
+
+    def add(self, doc: dict):
+        self.docs[doc["id"]] = doc
+        self._index(doc)
+
+    def update(self, appointment_id: str, fields: dict) -> Optional[dict]:
+        """Document before the update (None when missing)"""
+        current = self.docs.get(appointment_id)
+        if current is None:
+            return None
+        before = dict(current)
+        self._unindex(current)
+        current.update(fields)
+        self._index(current)
+        return before
+
+    def remove(self, appointment_id: str) -> Optional[dict]:
+        doc = self.docs.pop(appointment_id, None)
+        if doc is not None:
+            self._unindex(doc)
+        return doc
+
+    def keys_desc(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None
+    ) -> Iterator[Tuple[str, str, str]]:
+        """Index keys (date, time, id) of the matching documents, most recent first"""
+        low, high = _bounds(date_from, date_to)
+        if client_phones is None:
+            entries = self.by_status.get(status, []) if status else self.by_slot
+            return _walk_desc(entries, low, high)
+        ids = set().union(*(self.by_phone.get(p, ()) for p in client_phones))
+        keys = sorted(
+            (
+                (a["date"], a["time"], a["id"])
+                for a in (self.docs[i] for i in ids)
+                if (not status or a.get("status") == status)
+            ),
+            reverse=True
+        )
+        return (k for k in keys if low <= k <= high)
+
+    def iter_desc(self, *args, **kwargs) -> Iterator[dict]:
+        """Matching documents (same arguments as keys_desc), most recent first"""
+        for key in self.keys_desc(*args, **kwargs):
+            doc = self.docs.get(key[-1])
+            # None: removido enquanto a resposta ainda era enviada
+            if doc is not None:
+                yield doc
+
+    def count(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None
+    ) -> int:
+        if client_phones is not None:
+            return sum(1 for _ in self.keys_desc(status, date_from, date_to, client_phones))
+        if not (status or date_from or date_to):
+            return len(self.docs)
+        low, high = _bounds(date_from, date_to)
+        entries = self.by_status.get(status, []) if status else self.by_slot
+        return bisect_right(entries, high) - bisect_left(entries, low)
+
+    def active_in_slot(self, date: str, time: Optional[str] = None) -> Iterator[dict]:
+        low = (date, time or "")
+        high = (date, (time or _MAX) + _MAX)
+        lo = bisect_left(self.by_slot, low)
+        hi = bisect_right(self.by_slot, high)
+        for _, _, appointment_id in self.by_slot[lo:hi]:
+            appointment = self.docs[appointment_id]
+            if appointment.get("status") != "cancelled":
+                yield appointment
+
+
+class MemoryStorage:
+    name = "memory"
+
+    def __init__(self):
+        self.services: Dict[str, dict] = {}
+        self.settings: Dict[str, dict] = {}
+        self.working_hours: Dict[int, dict] = {}
+        self.blocked_dates: Dict[str, dict] = {}
+
+        self.appointments = _Appointments()
+        self.archive = _Appointments()
+
+        self.clients: Dict[str, dict] = {}
+        self._client_index: Dict[str, List[Tuple[str, str]]] = {
+            field: [] for field in _CLIENT_INDEXES
+        }
+
+        self.waitlist: Dict[str, dict] = {}
+        # Entradas "waiting" por data, em ordem de chegada (~ índice "match")
+        self._waiting: Dict[str, List[Tuple[datetime, str]]] = defaultdict(list)
+        self._offered: Set[str] = set()
+
+        self.telegram_updates: Set[int] = set()
+        self.telegram_sessions: Dict[str, dict] = {}
+        self.idempotency_keys: Dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    # =========================
+    # Services
+    # =========================
+
+    async def list_services(self, active: Optional[bool] = None) -> List[dict]:
+        services = [
+            s for s in self.services.values()
+            if active is None or s.get("active") == active
+        ]
+        services.sort(key=lambda s: s.get("created_at") or 0)
+        return [_copy(s) for s in services]
+
+    async def iter_services(self, active: Optional[bool] = None) -> AsyncIterator[dict]:
+        for service in await self.list_services(active):
+            yield service
+
+    async def get_service(self, service_id: str) -> Optional[dict]:
+        return _copy(self.services.get(service_id))
+
+    async def get_services(self, service_ids: Iterable[str]) -> List[dict]:
+        return [
+            _copy(self.services[i]) for i in set(service_ids)
+            if i in self.services
+        ]
+
+    async def count_services(self, active: Optional[bool] = None) -> int:
+        if active is None:
+            return len(self.services)
+        return sum(1 for s in self.services.values() if s.get("active") == active)
+
+    async def insert_service(self, doc: dict):
+        if doc["id"] in self.services:
+            raise _duplicate("services", "id", doc["id"])
+        self.services[doc["id"]] = dict(doc)
+
+    async def update_service(self, service_id: str, fields: dict) -> Optional[dict]:
+        return self._update(self.services, service_id, fields)
+
+    async def delete_service(self, service_id: str) -> Optional[dict]:
+        return self.services.pop(service_id, None)
+
+    # =========================
+    # Settings
+    # =========================
+
+    async def list_settings(self) -> List[dict]:
+        return [_copy(s) for s in self.settings.values()]
+
+    async def iter_settings(self) -> AsyncIterator[dict]:
+        for setting in await self.list_settings():
+            yield setting
+
+    async def get_setting(self, key: str) -> Optional[dict]:
+        return _copy(self.settings.get(key))
+
+    async def insert_setting(self, doc: dict):
+        if doc["key"] in self.settings:
+            raise _duplicate("settings", "key", doc["key"])
+        self.settings[doc["key"]] = dict(doc)
+
+    async def update_setting(self, key: str, fields: dict) -> Optional[dict]:
+        return self._update(self.settings, key, fields)
+
+    async def delete_setting(self, key: str) -> Optional[dict]:
+        return self.settings.pop(key, None)
+
+    # =========================
+    # Working hours
+    # =========================
+
+    async def list_working_hours(self) -> List[dict]:
+        return [_copy(w) for w in self.working_hours.values()]
+
+    async def iter_working_hours(self) -> AsyncIterator[dict]:
+        for working_hours in await self.list_working_hours():
+            yield working_hours
+
+    async def get_working_hours(
+        self,
+        day_of_week: int,
+        active: Optional[bool] = None
+    ) -> Optional[dict]:
+        working_hours = self.working_hours.get(day_of_week)
+        if working_hours is None:
+            return None
+        if active is not None and working_hours.get("active") != active:
+            return None
+        return _copy(working_hours)
+
+    async def insert_working_hours(self, doc: dict):
+        self.working_hours[doc["day_of_week"]] = dict(doc)
+
+    async def update_working_hours(self, day_of_week: int, fields: dict) -> Optional[dict]:
+        before = self._update(self.working_hours, day_of_week, fields)
+        # day_of_week é a chave: mantém o dict coerente se ele mudar
+        if before is not None and fields.get("day_of_week", day_of_week) != day_of_week:
+            self.working_hours[fields["day_of_week"]] = self.working_hours.pop(day_of_week)
+        return before
+
+    async def delete_working_hours(self, day_of_week: int) -> Optional[dict]:
+        return self.working_hours.pop(day_of_week, None)
+
+    # =========================
+    # Blocked dates
+    # =========================
+
+    async def list_blocked_dates(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None
+    ) -> List[dict]:
+        return [
+            _copy(b) for d, b in self.blocked_dates.items()
+            if (not date_from or d >= date_from) and (not date_to or d <= date_to)
+        ]
+
+    async def iter_blocked_dates(self) -> AsyncIterator[dict]:
+        for blocked in await self.list_blocked_dates():
+            yield blocked
+
+    async def get_blocked_date(self, date: str) -> Optional[dict]:
+        return _copy(self.blocked_dates.get(date))
+
+    async def get_blocked_dates(self, dates: Iterable[str]) -> List[dict]:
+        return [
+            _copy(self.blocked_dates[d]) for d in set(dates)
+            if d in self.blocked_dates
+        ]
+
+    async def insert_blocked_date(self, doc: dict):
+        self.blocked_dates[doc["date"]] = dict(doc)
+
+    async def delete_blocked_date(self, date: str) -> Optional[dict]:
+        return self.blocked_dates.pop(date, None)
+
+    # =========================
+    # Appointments
+    # =========================
+
+    async def get_appointment(self, appointment_id: str) -> Optional[dict]:
+        """Get one appointment by id, falling back to the archive"""
+        appointment = self.appointments.get(appointment_id)
+        if appointment is not None:
+            return _copy(appointment)
+        archived = self.archive.get(appointment_id)
+        return _unarchived(archived) if archived is not None else None
+
+    async def iter_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        include_archive: bool = False
+    ) -> AsyncIterator[dict]:
+        """
+        Appointments most recent first (limit None/0 = all), merged with
+        the archive when the range reaches it (as in MongoStorage)
+        """
+        query = (status, date_from, date_to, client_phones)
+        appointments = self.appointments.iter_desc(*query)
+        if reaches_archive(date_from, include_archive):
+            archived = (_unarchived(a) for a in self.archive.iter_desc(*query))
+            # Empates de data/hora: a coleção quente primeiro (como _merge_desc)
+            appointments = merge(appointments, archived, key=_sort_key, reverse=True)
+
+        sent = 0
+        for appointment in appointments:
+            if skip:
+                skip -= 1
+                continue
+            yield _copy(appointment)
+            sent += 1
+            if limit and sent >= limit:
+                return
+
+    async def find_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 100,
+        client_phones: Optional[List[str]] = None,
+        include_archive: bool = False
+    ) -> List[dict]:
+        return [
+            appointment async for appointment in self.iter_appointments(
+                status, date_from, date_to, client_phones,
+                limit=limit, include_archive=include_archive
+            )
+        ]
+
+    async def iter_appointment_batches(
+        self,
+        fields: List[str],
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[dict]]:
+        """Only `fields` of the appointments in [date_from, date_to], in lists of `batch_size`"""
+        collections = [self.appointments]
+        if reaches_archive(date_from):
+            collections.append(self.archive)
+
+        batch = []
+        for collection in collections:
+            for appointment in collection.iter_desc(None, date_from, date_to):
+                batch.append({field: appointment.get(field) for field in fields})
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async def count_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None,
+        include_archive: bool = False,
+        limit: Optional[int] = None
+    ) -> int:
+        """Same count as MongoStorage (each collection capped at `limit`)"""
+        query = (status, date_from, date_to, client_phones)
+        collections = [self.appointments]
+        if reaches_archive(date_from, include_archive):
+            collections.append(self.archive)
+        return sum(
+            min(c.count(*query), limit) if limit else c.count(*query)
+            for c in collections
+        )
+
+    async def appointment_counts(
+        self,
+        date_from: str,
+        date_to: str,
+        bucket: str
+    ) -> List[dict]:
+        """Same rows as MongoStorage.appointment_counts"""
+        collections = [self.appointments]
+        if reaches_archive(date_from):
+            collections.append(self.archive)
+
+        rows: Dict[tuple, dict] = {}
+        buckets: Dict[str, str] = {}
+        for collection in collections:
+            for appointment in collection.iter_desc(None, date_from, date_to):
+                day = appointment["date"]
+                if day not in buckets:
+                    buckets[day] = truncate(
+                        datetime.strptime(day, "%Y-%m-%d").date(), bucket
+                    ).isoformat()
+                key = (
+                    buckets[day],
+                    appointment.get("service_id"),
+                    appointment.get("source"),
+                    appointment.get("status")
+                )
+                row = rows.get(key)
+                if row is None:
+                    row = rows[key] = {
+                        "bucket": key[0],
+                        "service_id": key[1],
+                        "source": key[2],
+                        "status": key[3],
+                        "count": 0,
+                        "revenue": 0.0,
+                        "unpriced": 0
+                    }
+                row["count"] += 1
+                if appointment.get("price") is None:
+                    row["unpriced"] += 1
+                else:
+                    row["revenue"] += float(appointment["price"])
+        return list(rows.values())
+
+    async def find_conflict(self, date: str, time: str) -> Optional[dict]:
+        return _copy(next(self.appointments.active_in_slot(date, time), None))
+
+    async def booked_dates(self, dates: Iterable[str], time: str) -> List[str]:
+        return [
+            d for d in set(dates)
+            if next(self.appointments.active_in_slot(d, time), None) is not None
+        ]
+
+    async def booked_times(self, date: str) -> List[str]:
+        return [a["time"] for a in self.appointments.active_in_slot(date)]
+
+    async def insert_appointment(self, doc: dict):
+        if self.appointments.get(doc["id"]) is not None:
+            raise _duplicate("appointments", "id", doc["id"])
+        self.appointments.add(dict(doc))
+
+    async def insert_appointments(self, docs: List[dict]):
+        # Como insert_many ordenado: para no primeiro duplicado, os anteriores ficam
+        for index, doc in enumerate(docs):
+            try:
+                await self.insert_appointment(doc)
+            except DuplicateKeyError as exc:
+                raise BulkWriteError({
+                    "writeErrors": [{**exc.details, "index": index, "op": dict(doc)}],
+                    "writeConcernErrors": [],
+                    "nInserted": index,
+                    "nUpserted": 0,
+                    "nMatched": 0,
+                    "nModified": 0,
+                    "nRemoved": 0,
+                    "upserted": []
+                })
+
+    async def insert_appointment_if_free(self, doc: dict) -> bool:
+        # Sem await entre a verificação e a escrita: atômico no event loop
+        if next(self.appointments.active_in_slot(doc["date"], doc["time"]), None) is not None:
+            return False
+        await self.insert_appointment(doc)
+        return True
+
+    async def update_appointment(
+        self,
+        appointment_id: str,
+        fields: dict,
+        only_if_status: Optional[str] = None
+    ) -> Optional[dict]:
+        current = self.appointments.get(appointment_id)
+        if current is None:
+            return None
+        if only_if_status and current.get("status") != only_if_status:
+            return None
+        return self.appointments.update(appointment_id, fields)
+
+    async def delete_appointment(self, appointment_id: str) -> Optional[dict]:
+        deleted = self.appointments.remove(appointment_id)
+        if deleted is not None:
+            self.archive.remove(appointment_id)
+        return deleted
+
+    # =========================
+    # Archive
+    # =========================
+
+    async def archive_batch(self, cutoff: str, batch_size: int) -> Tuple[int, List[dict]]:
+        """
+        Move up to `batch_size` appointments dated before `cutoff` to the
+        archive: (read, moved). One step of the event loop, so nothing can
+        change between the copy and the removal.
+        """
+        hot = self.appointments
+        keys = hot.by_slot[:min(bisect_left(hot.by_slot, (cutoff,)), batch_size)]
+        now = datetime.utcnow()
+        moved = []
+        for _, _, appointment_id in keys:
+            appointment = hot.remove(appointment_id)
+            # Cópia de uma execução anterior é substituída
+            self.archive.remove(appointment_id)
+            self.archive.add({**appointment, "archived_at": now})
+            moved.append(_copy(appointment))
+        return len(keys), moved
+
+    # =========================
+    # Clients
+    # =========================
+
+    def _index_client(self, client: dict):
+        for field, entries in self._client_index.items():
+            if isinstance(client.get(field), str):
+                insort(entries, (client[field], client["phone"]))
+
+    def _unindex_client(self, client: dict):
+        for field, entries in self._client_index.items():
+            if isinstance(client.get(field), str):
+                del entries[bisect_left(entries, (client[field], client["phone"]))]
+
+    def _clients_with(self, field: str, prefix: str) -> Iterator[dict]:
+        """Clients whose indexed `field` starts with `prefix`, sorted by it"""
+        entries = self._client_index[field]
+        position = bisect_left(entries, (prefix,))
+        while position < len(entries) and entries[position][0].startswith(prefix):
+            yield self.clients[entries[position][1]]
+            position += 1
+
+    async def get_client(self, phone: str) -> Optional[dict]:
+        return deepcopy(self.clients.get(phone))
+
+    async def get_client_by_telegram(self, username: str) -> Optional[dict]:
+        for client in self._clients_with("telegram_username", username):
+            if client["telegram_username"] == username:
+                return deepcopy(client)
+            break
+        return None
+
+    async def find_client_by_telegram(self, username: str) -> Optional[dict]:
+        """From the clients projection (routes/clients.py), as in MongoStorage"""
+        client = await self.get_client_by_telegram(username)
+        if not client or not client.get("phone_variants"):
+            return None
+        return {"name": client["name"], "phone": client["phone_variants"][0]}
+
+    async def search_clients(self, field: str, prefix: str, limit: int) -> List[dict]:
+        clients = []
+        for client in self._clients_with(field, prefix):
+            if len(clients) == limit:
+                break
+            clients.append(deepcopy(client))
+        return clients
+
+    async def update_client_counters(
+        self,
+        phone: str,
+        variant: str,
+        inc: dict,
+        fields: dict,
+        last_visit: Optional[str] = None,
+        upsert: bool = True
+    ) -> Optional[dict]:
+        """Same update as MongoStorage ($inc, $addToSet, $max); the client after it"""
+        now = datetime.utcnow()
+        client = self.clients.get(phone)
+        if client is None:
+            if not upsert:
+                return None
+            client = self.clients[phone] = {"phone": phone, "created_at": now}
+        else:
+            self._unindex_client(client)
+
+        client.update(fields)
+        client["updated_at"] = now
+        variants = client.setdefault("phone_variants", [])
+        if variant not in variants:
+            variants.append(variant)
+        for key, amount in inc.items():
+            # "service_counts.<id>": caminho com ponto, como no $inc
+            *path, leaf = key.split(".")
+            target = client
+            for part in path:
+                target = target.setdefault(part, {})
+            target[leaf] = target.get(leaf, 0) + amount
+        if last_visit and (client.get("last_visit") is None or last_visit > client["last_visit"]):
+            client["last_visit"] = last_visit
+
+        self._index_client(client)
+        return deepcopy(client)
+
+    async def set_client_fields(self, phone: str, fields: dict):
+        client = self.clients.get(phone)
+        if client is not None:
+            self._unindex_client(client)
+            client.update(fields)
+            self._index_client(client)
+
+    async def iter_client_history(self, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Same rows as MongoStorage.iter_client_history (hot, then archive)"""
+        for collection in (self.appointments, self.archive):
+            rows: Dict[tuple, dict] = {}
+            for appointment in collection.docs.values():
+                key = (
+                    appointment.get("client_phone"),
+                    appointment.get("service_id"),
+                    appointment.get("client_telegram_username"),
+                    appointment.get("status")
+                )
+                row = rows.get(key)
+                if row is None:
+                    row = rows[key] = {
+                        "phone": key[0],
+                        "service_id": key[1],
+                        "username": key[2],
+                        "status": key[3],
+                        "count": 0,
+                        "spend": 0.0,
+                        "unpriced": 0,
+                        "last_date": None,
+                        "latest": None
+                    }
+                price = appointment.get("price")
+                latest = f"{appointment['date']} {appointment['time']} {appointment['client_name']}"
+                row["count"] += 1
+                row["spend"] += float(price or 0)
+                row["unpriced"] += price is None
+                row["last_date"] = max(row["last_date"] or "", appointment["date"])
+                row["latest"] = max(row["latest"] or "", latest)
+            for row in rows.values():
+                yield row
+
+    async def upsert_clients(self, clients: List[dict]):
+        for fields in clients:
+            client = self.clients.get(fields["phone"])
+            if client is None:
+                client = self.clients[fields["phone"]] = {
+                    "created_at": fields.get("updated_at") or datetime.utcnow()
+                }
+            else:
+                self._unindex_client(client)
+            client.update(deepcopy(fields))
+            self._index_client(client)
+
+    async def delete_clients_updated_before(self, when: datetime) -> int:
+        stale = [
+            c for c in self.clients.values()
+            if c.get("updated_at") is not None and c["updated_at"] < when
+        ]
+        for client in stale:
+            self._unindex_client(client)
+            del self.clients[client["phone"]]
+        return len(stale)
+
+    # =========================
+    # Waitlist
+    # =========================
+
+    def _index_entry(self, entry: dict):
+        if entry["status"] == "waiting":
+            insort(self._waiting[entry["date"]], (entry["created_at"], entry["id"]))
+        elif entry["status"] == "offered":
+            self._offered.add(entry["id"])
+
+    def _unindex_entry(self, entry: dict):
+        if entry["status"] == "waiting":
+            waiting = self._waiting[entry["date"]]
+            del waiting[bisect_left(waiting, (entry["created_at"], entry["id"]))]
+            if not waiting:
+                del self._waiting[entry["date"]]
+        elif entry["status"] == "offered":
+            self._offered.discard(entry["id"])
+
+    def _update_entry(self, entry: dict, fields: dict, unset: Iterable[str] = ()) -> dict:
+        """Entry before the update"""
+        before = deepcopy(entry)
+        self._unindex_entry(entry)
+        entry.update(fields)
+        for field in unset:
+            entry.pop(field, None)
+        self._index_entry(entry)
+        return before
+
+    def _open_offer(self, entry_id: str, chat_id: int, now: datetime) -> Optional[dict]:
+        entry = self.waitlist.get(entry_id)
+        if entry is None or entry["status"] != "offered" \
+                or entry.get("telegram_chat_id") != chat_id \
+                or not entry.get("offer_expires_at") or entry["offer_expires_at"] <= now:
+            return None
+        return entry
+
+    async def insert_waitlist_entry(self, doc: dict):
+        if doc["id"] in self.waitlist:
+            raise _duplicate("waitlist", "id", doc["id"])
+        entry = self.waitlist[doc["id"]] = deepcopy(doc)
+        self._index_entry(entry)
+
+    async def iter_waitlist(
+        self,
+        date: Optional[str] = None,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[dict]:
+        """Entries in arrival order (limit None/0 = all)"""
+        entries = sorted(
+            (
+                e for e in self.waitlist.values()
+                if (not date or e["date"] == date) and (not status or e["status"] == status)
+            ),
+            key=lambda e: e["created_at"]
+        )
+        for entry in entries[skip:skip + limit if limit else None]:
+            yield deepcopy(entry)
+
+    async def count_waitlist(
+        self,
+        date: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> int:
+        if date and status == "waiting":
+            return len(self._waiting.get(date, ()))
+        return sum(
+            1 for e in self.waitlist.values()
+            if (not date or e["date"] == date) and (not status or e["status"] == status)
+        )
+
+    async def claim_waitlist_entry(self, date: str, time: str, fields: dict) -> Optional[dict]:
+        for _, entry_id in self._waiting.get(date, ()):
+            entry = self.waitlist[entry_id]
+            if time in entry["slots"]:
+                self._update_entry(entry, fields)
+                return deepcopy(entry)
+        return None
+
+    async def update_waitlist_entry(
+        self,
+        entry_id: str,
+        fields: dict,
+        only_if_status: Iterable[str] = (),
+        unset: Iterable[str] = ()
+    ) -> Optional[dict]:
+        entry = self.waitlist.get(entry_id)
+        if entry is None:
+            return None
+        only_if_status = list(only_if_status)
+        if only_if_status and entry["status"] not in only_if_status:
+            return None
+        return self._update_entry(entry, fields, unset)
+
+    async def get_waitlist_offer(
+        self,
+        entry_id: str,
+        chat_id: int,
+        now: datetime
+    ) -> Optional[dict]:
+        return deepcopy(self._open_offer(entry_id, chat_id, now))
+
+    async def close_waitlist_offer(
+        self,
+        entry_id: str,
+        chat_id: int,
+        now: datetime,
+        status: str
+    ) -> Optional[dict]:
+        entry = self._open_offer(entry_id, chat_id, now)
+        if entry is None:
+            return None
+        return self._update_entry(entry, {"status": status, "updated_at": now})
+
+    async def expire_waitlist_offer(self, now: datetime) -> Optional[dict]:
+        for entry_id in self._offered:
+            entry = self.waitlist[entry_id]
+            if entry.get("offer_expires_at") and entry["offer_expires_at"] <= now:
+                return self._update_entry(entry, {"status": "expired", "updated_at": now})
+        return None
+
+    async def expire_past_waitlist(self, today: str, now: datetime) -> int:
+        expired = 0
+        for date in [d for d in self._waiting if d < today]:
+            for _, entry_id in list(self._waiting[date]):
+                self._update_entry(self.waitlist[entry_id], {"status": "expired", "updated_at": now})
+                expired += 1
+        return expired
+
+    # =========================
+    # Idempotency keys
+    # =========================
+
+    async def insert_idempotency_key(
+        self,
+        key: str,
+        fingerprint: str,
+        owner: str,
+        lease_until: datetime
+    ) -> bool:
+        if key in self.idempotency_keys:
+            return False
+        self.idempotency_keys[key] = {
+            "_id": key,
+            "fingerprint": fingerprint,
+            "state": "pending",
+            "owner": owner,
+            "lease_until": lease_until,
+            "created_at": datetime.utcnow()
+        }
+        return True
+
+    async def get_idempotency_key(self, key: str) -> Optional[dict]:
+        return deepcopy(self.idempotency_keys.get(key))
+
+    async def take_over_idempotency_key(
+        self,
+        key: str,
+        previous_owner: Optional[str],
+        owner: str,
+        lease_until: datetime
+    ) -> bool:
+        record = self.idempotency_keys.get(key)
+        if record is None or record["state"] != "pending" or record.get("owner") != previous_owner:
+            return False
+        record.update(owner=owner, lease_until=lease_until)
+        return True
+
+    async def complete_idempotency_key(self, key: str, owner: str, status_code: int, body: Any):
+        record = self.idempotency_keys.get(key)
+        if record is not None and record.get("owner") == owner:
+            record.update(state="completed", status_code=status_code, body=deepcopy(body))
+
+    async def release_idempotency_key(self, key: str, owner: str):
+        record = self.idempotency_keys.get(key)
+        if record is not None and record["state"] == "pending" and record.get("owner") == owner:
+            del self.idempotency_keys[key]
+
+    # =========================
+    # Telegram
+    # =========================
+
+    async def record_telegram_update(self, update_id: int) -> bool:
+        if update_id in self.telegram_updates:
+            return False
+        self.telegram_updates.add(update_id)
+        return True
+
+    async def get_telegram_session(self, key: str) -> Optional[dict]:
+        # Sessões têm dicts aninhados ("data"): cópia profunda, como o BSON
+        return deepcopy(self.telegram_sessions.get(key))
+
+    async def save_telegram_session(self, session: dict):
+        self.telegram_sessions[session["_id"]] = deepcopy(session)
+
+    # =========================
+    # Utils
+    # =========================
+
+    @staticmethod
+    def _update(collection: dict, key, fields: dict) -> Optional[dict]:
+        current = collection.get(key)
+        if current is None:
+            return None
+        before = dict(current)
+        current.update(fields)
+        return before
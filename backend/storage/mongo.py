@@ -0,0 +1,881 @@
+"""
+MongoDB (Motor) storage backend.
+
+Every method is one round-trip (two when a query reaches the archive).
+Documents are returned without `_id`. `update_*` and `delete_*` return the
+document as it was before the write (None when nothing matched).
+
+`iter_*` methods are async generators over a cursor fetched in batches of
+STREAM_BATCH_SIZE documents: memory stays bounded by one batch whatever
+the size of the result.
+"""
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import os
+import re
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from storage.archive import reaches_archive
+
+NO_ID = {"_id": 0}
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "200"))
+
+# Ordem das listas de agendamentos: mais recentes primeiro, estável entre páginas
+APPOINTMENT_SORT = [("date", -1), ("time", -1)]
+
+
+def _sort_key(appointment: dict):
+    return appointment["date"], appointment["time"]
+
+
+async def _merge_desc(first: AsyncIterator[dict], second: AsyncIterator[dict]):
+    """Merge two cursors already in APPOINTMENT_SORT order, one item at a time"""
+    a = await anext(first, None)
+    b = await anext(second, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and _sort_key(a) >= _sort_key(b)):
+            yield a
+            a = await anext(first, None)
+        else:
+            yield b
+            b = await anext(second, None)
+
+
+class MongoStorage:
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+
+    async def ensure_indexes(self):
+        db = self.db
+        await db.appointments.create_index("id", unique=True)
+        # status no fim: cobre iter_appointment_batches(["date", "time", "status"])
+        await db.appointments.create_index([("date", 1), ("time", 1), ("status", 1)])
+        await db.appointments.create_index([("status", 1), ("date", -1), ("time", -1)])
+        await db.services.create_index("id", unique=True)
+        await db.settings.create_index("key", unique=True)
+        await db.working_hours.create_index("day_of_week")
+        await db.blocked_dates.create_index("date")
+
+    # =========================
+    # Services
+    # =========================
+
+    async def list_services(self, active: Optional[bool] = None) -> List[dict]:
+        query = {} if active is None else {"active": active}
+        return await self.db.services.find(query, NO_ID) \
+            .sort("created_at", 1) \
+            .to_list(None)
+
+    async def iter_services(self, active: Optional[bool] = None) -> AsyncIterator[dict]:
+        query = {} if active is None else {"active": active}
+        async for service in self.db.services.find(query, NO_ID) \
+                .sort("created_at", 1) \
+                .batch_size(STREAM_BATCH_SIZE):
+            yield service
+
+    async def get_service(self, service_id: str) -> Optional[dict]:
+        return await self.db.services.find_one({"id": service_id}, NO_ID)
+
+    async def get_services(self, service_ids: Iterable[str]) -> List[dict]:
+        return await self.db.services.find(
+            {"id": {"$in": list(service_ids)}}, NO_ID
+        ).to_list(None)
+
+    async def count_services(self, active: Optional[bool] = None) -> int:
+        query = {} if active is None else {"active": active}
+        return await self.db.services.count_documents(query)
+
+    async def insert_service(self, doc: dict):
+        await self.db.services.insert_one(dict(doc))
+
+    async def update_service(self, service_id: str, fields: dict) -> Optional[dict]:
+        return await self.db.services.find_one_and_update(
+            {"id": service_id},
+            {"$set": fields},
+            projection=NO_ID,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def delete_service(self, service_id: str) -> Optional[dict]:
+        return await self.db.services.find_one_and_delete(
+            {"id": service_id}, projection=NO_ID
+        )
+
+    # =========================
+    # Settings
+    # =========================
+
+    async def list_settings(self) -> List[dict]:
+        return await self.db.settings.find({}, NO_ID).to_list(None)
+
+    async def iter_settings(self) -> AsyncIterator[dict]:
+        async for setting in self.db.settings.find({}, NO_ID).batch_size(STREAM_BATCH_SIZE):
+            yield setting
+
+    async def get_setting(self, key: str) -> Optional[dict]:
+        return await self.db.settings.find_one({"key": key}, NO_ID)
+
+    async def insert_setting(self, doc: dict):
+        await self.db.settings.insert_one(dict(doc))
+
+    async def update_setting(self, key: str, fields: dict) -> Optional[dict]:
+        return await self.db.settings.find_one_and_update(
+            {"key": key},
+            {"$set": fields},
+            projection=NO_ID,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def delete_setting(self, key: str) -> Optional[dict]:
+        return await self.db.settings.find_one_and_delete(
+            {"key": key}, projection=NO_ID
+        )
+
+    # =========================
+    # Working hours
+    # =========================
+
+    async def list_working_hours(self) -> List[dict]:
+        return await self.db.working_hours.find({}, NO_ID).to_list(None)
+
+    async def iter_working_hours(self) -> AsyncIterator[dict]:
+        async for working_hours in self.db.working_hours.find({}, NO_ID) \
+                .batch_size(STREAM_BATCH_SIZE):
+            yield working_hours
+
+    async def get_working_hours(
+        self,
+        day_of_week: int,
+        active: Optional[bool] = None
+    ) -> Optional[dict]:
+        query = {"day_of_week": day_of_week}
+        if active is not None:
+            query["active"] = active
+        return await self.db.working_hours.find_one(query, NO_ID)
+
+    async def insert_working_hours(self, doc: dict):
+        await self.db.working_hours.insert_one(dict(doc))
+
+    async def update_working_hours(self, day_of_week: int, fields: dict) -> Optional[dict]:
+        return await self.db.working_hours.find_one_and_update(
+            {"day_of_week": day_of_week},
+            {"$set": fields},
+            projection=NO_ID,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def delete_working_hours(self, day_of_week: int) -> Optional[dict]:
+        return await self.db.working_hours.find_one_and_delete(
+            {"day_of_week": day_of_week}, projection=NO_ID
+        )
+
+    # =========================
+    # Blocked dates
+    # =========================
+
+    async def list_blocked_dates(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None
+    ) -> List[dict]:
+        query = {}
+        if date_from:
+            query["date"] = {"$gte": date_from}
+        if date_to:
+            query.setdefault("date", {})["$lte"] = date_to
+        return await self.db.blocked_dates.find(query, NO_ID).to_list(None)
+
+    async def iter_blocked_dates(self) -> AsyncIterator[dict]:
+        async for blocked in self.db.blocked_dates.find({}, NO_ID) \
+                .batch_size(STREAM_BATCH_SIZE):
+            yield blocked
+
+    async def get_blocked_date(self, date: str) -> Optional[dict]:
+        return await self.db.blocked_dates.find_one({"date": date}, NO_ID)
+
+    async def get_blocked_dates(self, dates: Iterable[str]) -> List[dict]:
+        return await self.db.blocked_dates.find(
+            {"date": {"$in": list(dates)}}, NO_ID
+        ).to_list(None)
+
+    async def insert_blocked_date(self, doc: dict):
+        await self.db.blocked_dates.insert_one(dict(doc))
+
+    async def delete_blocked_date(self, date: str) -> Optional[dict]:
+        return await self.db.blocked_dates.find_one_and_delete(
+            {"date": date}, projection=NO_ID
+        )
+
+    # =========================
+    # Appointments
+    # =========================
+
+    @staticmethod
+    def _appointment_query(
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None
+    ) -> dict:
+        query = {}
+        if status:
+            query["status"] = status
+        if date_from:
+            query["date"] = {"$gte": date_from}
+        if date_to:
+            query.setdefault("date", {})["$lte"] = date_to
+        if client_phones is not None:
+            query["client_phone"] = {"$in": client_phones}
+        return query
+
+    async def get_appointment(self, appointment_id: str) -> Optional[dict]:
+        """Get one appointment by id, falling back to the archive"""
+        appointment = await self.db.appointments.find_one(
+            {"id": appointment_id}, NO_ID
+        )
+        if appointment is None:
+            appointment = await self.db.appointments_archive.find_one(
+                {"id": appointment_id}, {"_id": 0, "archived_at": 0}
+            )
+        return appointment
+
+    async def iter_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        include_archive: bool = False
+    ) -> AsyncIterator[dict]:
+        """
+        Appointments most recent first (limit None/0 = all). The archive is
+        only read when the range reaches back past its cutoff (or has no
+        start and `include_archive` is set): archived records are always
+        older than it, so later ranges skip it entirely.
+        """
+        query = self._appointment_query(status, date_from, date_to, client_phones)
+
+        # A coleção quente é sempre consultada: até a próxima execução do
+        # arquivamento ela ainda pode ter registros mais antigos que o cutoff
+        hot = self.db.appointments.find(query, NO_ID) \
+            .sort(APPOINTMENT_SORT) \
+            .batch_size(STREAM_BATCH_SIZE)
+
+        if not reaches_archive(date_from, include_archive):
+            if skip:
+                hot = hot.skip(skip)
+            if limit:
+                hot = hot.limit(limit)
+            async for appointment in hot:
+                yield appointment
+            return
+
+        # Com o arquivo, o skip vale para a sequência intercalada: cada
+        # cursor traz no máximo skip + limit e o excedente é descartado aqui
+        cold = self.db.appointments_archive.find(query, {"_id": 0, "archived_at": 0}) \
+            .sort(APPOINTMENT_SORT) \
+            .batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            hot = hot.limit(skip + limit)
+            cold = cold.limit(skip + limit)
+
+        sent = 0
+        async for appointment in _merge_desc(hot.__aiter__(), cold.__aiter__()):
+            if skip:
+                skip -= 1
+                continue
+            yield appointment
+            sent += 1
+            if limit and sent >= limit:
+                break
+
+    async def find_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 100,
+        client_phones: Optional[List[str]] = None,
+        include_archive: bool = False
+    ) -> List[dict]:
+        return [
+            appointment async for appointment in self.iter_appointments(
+                status, date_from, date_to, client_phones,
+                limit=limit, include_archive=include_archive
+            )
+        ]
+
+    async def iter_appointment_batches(
+        self,
+        fields: List[str],
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        batch_size: int = STREAM_BATCH_SIZE
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Only `fields` of the appointments in [date_from, date_to], in lists
+        of `batch_size` and in no particular order (hot, then archive).
+        date/time/status are covered by the index: documents aren't read.
+        """
+        query = self._appointment_query(date_from=date_from, date_to=date_to)
+        projection = {"_id": 0, **{field: 1 for field in fields}}
+
+        collections = [self.db.appointments]
+        if reaches_archive(date_from):
+            collections.append(self.db.appointments_archive)
+
+        for collection in collections:
+            cursor = collection.find(query, projection).batch_size(batch_size)
+            while batch := await cursor.to_list(batch_size):
+                yield batch
+
+    async def count_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None,
+        include_archive: bool = False,
+        limit: Optional[int] = None
+    ) -> int:
+        """
+        Count, with the archive under the same rule as iter_appointments.
+        With `limit`, each collection stops counting there: enough to tell
+        whether there is a next page without walking the whole index.
+        """
+        query = self._appointment_query(status, date_from, date_to, client_phones)
+        options = {"limit": limit} if limit else {}
+        count = await self.db.appointments.count_documents(query, **options)
+        if reaches_archive(date_from, include_archive):
+            count += await self.db.appointments_archive.count_documents(query, **options)
+        return count
+
+    async def find_conflict(self, date: str, time: str) -> Optional[dict]:
+        return await self.db.appointments.find_one(
+            {"date": date, "time": time, "status": {"$ne": "cancelled"}},
+            NO_ID
+        )
+
+    async def booked_dates(self, dates: Iterable[str], time: str) -> List[str]:
+        """Which of `dates` already have `time` booked (one query)"""
+        appointments = await self.db.appointments.find(
+            {"date": {"$in": list(dates)}, "time": time, "status": {"$ne": "cancelled"}},
+            {"_id": 0, "date": 1}
+        ).to_list(None)
+        return [a["date"] for a in appointments]
+
+    async def booked_times(self, date: str) -> List[str]:
+        appointments = await self.db.appointments.find(
+            {"date": date, "status": {"$ne": "cancelled"}},
+            {"_id": 0, "time": 1}
+        ).to_list(None)
+        return [a["time"] for a in appointments]
+
+    async def insert_appointment(self, doc: dict):
+        await self.db.appointments.insert_one(dict(doc))
+
+    async def insert_appointments(self, docs: List[dict]):
+        await self.db.appointments.insert_many([dict(d) for d in docs])
+
+    async def insert_appointment_if_free(self, doc: dict) -> bool:
+        """Upsert matching any active appointment in the slot: inserts only when none"""
+        result = await self.db.appointments.update_one(
+            {"date": doc["date"], "time": doc["time"], "status": {"$ne": "cancelled"}},
+            {"$setOnInsert": dict(doc)},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    async def update_appointment(
+        self,
+        appointment_id: str,
+        fields: dict,
+        only_if_status: Optional[str] = None
+    ) -> Optional[dict]:
+        query = {"id": appointment_id}
+        if only_if_status:
+            query["status"] = only_if_status
+        return await self.db.appointments.find_one_and_update(
+            query,
+            {"$set": fields},
+            projection=NO_ID,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def delete_appointment(self, appointment_id: str) -> Optional[dict]:
+        deleted = await self.db.appointments.find_one_and_delete(
+            {"id": appointment_id}, projection=NO_ID
+        )
+        if deleted is not None:
+            # Uma cópia feita pelo arquivamento em andamento sai junto
+            await self.db.appointments_archive.delete_one({"id": appointment_id})
+        return deleted
+
+    async def appointment_counts(
+        self,
+        date_from: str,
+        date_to: str,
+        bucket: str
+    ) -> List[dict]:
+        """
+        Appointments in [date_from, date_to] counted per (bucket, service,
+        source, status) by MongoDB: {"bucket": "YYYY-MM-DD" (start of the
+        day/week/month), "service_id", "source", "status", "count",
+        "revenue" (stored prices), "unpriced" (without one)}. The result
+        size depends on the number of buckets, not of appointments.
+        """
+        match = {"$match": {"date": {"$gte": date_from, "$lte": date_to}}}
+        pipeline = [match]
+
+        if reaches_archive(date_from):
+            pipeline.append({"$unionWith": {
+                "coll": "appointments_archive",
+                "pipeline": [match]
+            }})
+
+        pipeline += [
+            # 1º agrupamento só com campos do índice: no máximo
+            # dias × serviços × origens × status linhas
+            {"$group": {
+                "_id": {
+                    "date": "$date",
+                    "service_id": "$service_id",
+                    "source": "$source",
+                    "status": "$status"
+                },
+                "count": {"$sum": 1},
+                "revenue": {"$sum": "$price"},
+                "unpriced": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$price", None]}, None]}, 1, 0]}}
+            }},
+            # 2º agrupamento trunca a data já sobre as linhas diárias
+            {"$group": {
+                "_id": {
+                    "bucket": {"$dateTrunc": {
+                        "date": {"$toDate": "$_id.date"},
+                        "unit": bucket,
+                        "startOfWeek": "monday"
+                    }},
+                    "service_id": "$_id.service_id",
+                    "source": "$_id.source",
+                    "status": "$_id.status"
+                },
+                "count": {"$sum": "$count"},
+                "revenue": {"$sum": "$revenue"},
+                "unpriced": {"$sum": "$unpriced"}
+            }}
+        ]
+
+        rows = await self.db.appointments.aggregate(pipeline).to_list(None)
+        return [
+            {
+                "bucket": row["_id"]["bucket"].date().isoformat(),
+                # Campos ausentes não aparecem no _id do $group
+                "service_id": row["_id"].get("service_id"),
+                "source": row["_id"].get("source"),
+                "status": row["_id"].get("status"),
+                "count": row["count"],
+                "revenue": float(row.get("revenue") or 0),
+                "unpriced": row.get("unpriced") or 0
+            }
+            for row in rows
+        ]
+
+    # =========================
+    # Archive (routes/archive.py)
+    # =========================
+
+    @staticmethod
+    def _unchanged(appointments: List[dict]) -> dict:
+        """Filter matching these appointments only while still as they were read"""
+        # updated_at é gravado em toda edição (Repository.update_appointment)
+        return {"$or": [
+            {"_id": a["_id"], "updated_at": a.get("updated_at")} for a in appointments
+        ]}
+
+    async def _current(self, appointments: List[dict]) -> Dict[Any, dict]:
+        """_id -> (_id, updated_at) of those still in the hot collection"""
+        cursor = self.db.appointments.find(
+            {"_id": {"$in": [a["_id"] for a in appointments]}},
+            {"_id": 1, "updated_at": 1}
+        )
+        return {a["_id"]: a async for a in cursor}
+
+    async def _drop_copies(self, appointments: List[dict]):
+        """Remove archive copies that no longer match the hot collection"""
+        if appointments:
+            await self.db.appointments_archive.delete_many(
+                {"id": {"$in": [a["id"] for a in appointments]}}
+            )
+
+    async def archive_batch(self, cutoff: str, batch_size: int) -> Tuple[int, List[dict]]:
+        """
+        Move up to `batch_size` appointments dated before `cutoff` to the
+        archive. Returns (read, moved): edited or removed meanwhile are
+        read but not moved.
+        """
+        batch = await self.db.appointments.find(
+            {"date": {"$lt": cutoff}}
+        ).limit(batch_size).to_list(batch_size)
+
+        if not batch:
+            return 0, []
+
+        now = datetime.utcnow()
+        copies = [{**a, "archived_at": now} for a in batch]
+
+        try:
+            await self.db.appointments_archive.insert_many(copies, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(e["code"] != 11000 for e in errors):
+                raise
+            # Já arquivados numa execução interrompida: a cópia antiga pode ser
+            # de antes de uma edição
+            for error in errors:
+                copy = copies[error["index"]]
+                await self.db.appointments_archive.replace_one({"id": copy["id"]}, copy)
+
+        # Editados ou removidos entre a leitura e a cópia: a cópia sai do
+        # arquivo (os editados continuam quentes e voltam num próximo lote)
+        current = await self._current(batch)
+        moving, stale = [], []
+        for a in batch:
+            found = current.get(a["_id"])
+            unchanged = found is not None and found.get("updated_at") == a.get("updated_at")
+            (moving if unchanged else stale).append(a)
+        await self._drop_copies(stale)
+
+        # Só remove da coleção quente depois de copiado, e só o que não mudou
+        # desde a leitura
+        if moving:
+            result = await self.db.appointments.delete_many(self._unchanged(moving))
+            if result.deleted_count < len(moving):
+                # Editados depois da conferência continuam quentes; removidos
+                # depois da cópia já tiveram o arquivo limpo por delete_appointment
+                current = await self._current(moving)
+                await self._drop_copies([a for a in moving if a["_id"] in current])
+                moving = [a for a in moving if a["_id"] not in current]
+
+        return len(batch), [
+            {k: v for k, v in a.items() if k != "_id"} for a in moving
+        ]
+
+    # =========================
+    # Clients (projeção mantida por routes/clients.py)
+    # =========================
+
+    async def get_client(self, phone: str) -> Optional[dict]:
+        return await self.db.clients.find_one({"phone": phone}, NO_ID)
+
+    async def get_client_by_telegram(self, username: str) -> Optional[dict]:
+        return await self.db.clients.find_one({"telegram_username": username}, NO_ID)
+
+    async def find_client_by_telegram(self, username: str) -> Optional[dict]:
+        """From the clients projection (routes/clients.py)"""
+        client = await self.db.clients.find_one(
+            {"telegram_username": username},
+            {"_id": 0, "name": 1, "phone_variants": 1}
+        )
+        if not client or not client.get("phone_variants"):
+            return None
+        return {"name": client["name"], "phone": client["phone_variants"][0]}
+
+    async def search_clients(self, field: str, prefix: str, limit: int) -> List[dict]:
+        """Clients whose `field` starts with `prefix`, sorted by it (anchored: uses the index)"""
+        return await self.db.clients.find(
+            {field: {"$regex": f"^{re.escape(prefix)}"}}, NO_ID
+        ).sort(field, 1).limit(limit).to_list(limit)
+
+    async def update_client_counters(
+        self,
+        phone: str,
+        variant: str,
+        inc: dict,
+        fields: dict,
+        last_visit: Optional[str] = None,
+        upsert: bool = True
+    ) -> Optional[dict]:
+        """
+        Add `inc` to the counters of client `phone` (dotted keys allowed),
+        set `fields`, record the `variant` typed and raise last_visit.
+        Returns the client after the write (None when missing and not upsert).
+        """
+        now = datetime.utcnow()
+        update = {
+            "$setOnInsert": {"created_at": now},
+            "$set": {**fields, "updated_at": now},
+            "$addToSet": {"phone_variants": variant},
+        }
+        if inc:
+            update["$inc"] = inc
+        if last_visit:
+            update["$max"] = {"last_visit": last_visit}
+        return await self.db.clients.find_one_and_update(
+            {"phone": phone},
+            update,
+            projection=NO_ID,
+            upsert=upsert,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def set_client_fields(self, phone: str, fields: dict):
+        await self.db.clients.update_one({"phone": phone}, {"$set": fields})
+
+    async def iter_client_history(self, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """
+        Appointment totals (hot, then archive) per phone as typed, service,
+        username as typed and status, grouped by MongoDB: the rows scale
+        with clients × services, not with appointments. Each row:
+        {"phone", "service_id", "username", "status", "count", "spend"
+        (stored prices), "unpriced" (without one), "last_date", "latest"
+        ("date time name" of the most recent appointment)}.
+        """
+        pipeline = [
+            {"$group": {
+                "_id": {
+                    "phone": "$client_phone",
+                    "service_id": "$service_id",
+                    "username": "$client_telegram_username",
+                    "status": "$status"
+                },
+                "count": {"$sum": 1},
+                "spend": {"$sum": {"$ifNull": ["$price", 0]}},
+                "unpriced": {"$sum": {"$cond": [
+                    {"$eq": [{"$ifNull": ["$price", None]}, None]}, 1, 0
+                ]}},
+                "last_date": {"$max": "$date"},
+                # Ordem de string: "data hora nome" do mais recente
+                "latest": {"$max": {"$concat": ["$date", " ", "$time", " ", "$client_name"]}},
+            }}
+        ]
+        for collection in (self.db.appointments, self.db.appointments_archive):
+            async for row in collection.aggregate(pipeline, batchSize=batch_size):
+                key = row.pop("_id")
+                yield {
+                    # Campos ausentes não aparecem no _id do $group
+                    "phone": key.get("phone"),
+                    "service_id": key.get("service_id"),
+                    "username": key.get("username"),
+                    "status": key.get("status"),
+                    **row
+                }
+
+    async def upsert_clients(self, clients: List[dict]):
+        """Replace the fields of each client (by phone), creating missing ones"""
+        if not clients:
+            return
+        await self.db.clients.bulk_write([
+            UpdateOne(
+                {"phone": client["phone"]},
+                {
+                    "$set": client,
+                    "$setOnInsert": {"created_at": client.get("updated_at") or datetime.utcnow()}
+                },
+                upsert=True
+            )
+            for client in clients
+        ], ordered=False)
+
+    async def delete_clients_updated_before(self, when: datetime) -> int:
+        result = await self.db.clients.delete_many({"updated_at": {"$lt": when}})
+        return result.deleted_count
+
+    # =========================
+    # Waitlist (routes/waitlist.py)
+    # =========================
+
+    @staticmethod
+    def _waitlist_query(date: Optional[str] = None, status: Optional[str] = None) -> dict:
+        query = {}
+        if date:
+            query["date"] = date
+        if status:
+            query["status"] = status
+        return query
+
+    async def insert_waitlist_entry(self, doc: dict):
+        await self.db.waitlist.insert_one(dict(doc))
+
+    async def iter_waitlist(
+        self,
+        date: Optional[str] = None,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[dict]:
+        """Entries in arrival order (limit None/0 = all)"""
+        cursor = self.db.waitlist.find(self._waitlist_query(date, status), NO_ID) \
+            .sort("created_at", 1) \
+            .skip(skip) \
+            .batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        async for entry in cursor:
+            yield entry
+
+    async def count_waitlist(
+        self,
+        date: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> int:
+        return await self.db.waitlist.count_documents(self._waitlist_query(date, status))
+
+    async def claim_waitlist_entry(self, date: str, time: str, fields: dict) -> Optional[dict]:
+        """Atomically set `fields` on the oldest waiting entry that wants this slot (after)"""
+        return await self.db.waitlist.find_one_and_update(
+            {"status": "waiting", "date": date, "slots": time},
+            {"$set": fields},
+            sort=[("created_at", 1)],
+            projection=NO_ID,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def update_waitlist_entry(
+        self,
+        entry_id: str,
+        fields: dict,
+        only_if_status: Iterable[str] = (),
+        unset: Iterable[str] = ()
+    ) -> Optional[dict]:
+        query = {"id": entry_id}
+        if only_if_status:
+            query["status"] = {"$in": list(only_if_status)}
+        update = {"$set": fields}
+        if unset:
+            update["$unset"] = {field: "" for field in unset}
+        return await self.db.waitlist.find_one_and_update(
+            query, update, projection=NO_ID, return_document=ReturnDocument.BEFORE
+        )
+
+    async def get_waitlist_offer(
+        self,
+        entry_id: str,
+        chat_id: int,
+        now: datetime
+    ) -> Optional[dict]:
+        """The entry while its offer to `chat_id` is still open"""
+        return await self.db.waitlist.find_one({
+            "id": entry_id,
+            "telegram_chat_id": chat_id,
+            "status": "offered",
+            "offer_expires_at": {"$gt": now}
+        }, NO_ID)
+
+    async def close_waitlist_offer(
+        self,
+        entry_id: str,
+        chat_id: int,
+        now: datetime,
+        status: str
+    ) -> Optional[dict]:
+        """Move an open offer to `status` (before; None when no longer open)"""
+        return await self.db.waitlist.find_one_and_update(
+            {
+                "id": entry_id,
+                "telegram_chat_id": chat_id,
+                "status": "offered",
+                "offer_expires_at": {"$gt": now}
+            },
+            {"$set": {"status": status, "updated_at": now}},
+            projection=NO_ID
+        )
+
+    async def expire_waitlist_offer(self, now: datetime) -> Optional[dict]:
+        """Expire one offer past its deadline (before; None when there is none)"""
+        return await self.db.waitlist.find_one_and_update(
+            {"status": "offered", "offer_expires_at": {"$lte": now}},
+            {"$set": {"status": "expired", "updated_at": now}},
+            projection=NO_ID
+        )
+
+    async def expire_past_waitlist(self, today: str, now: datetime) -> int:
+        """Expire waiting entries dated before `today`"""
+        result = await self.db.waitlist.update_many(
+            {"status": "waiting", "date": {"$lt": today}},
+            {"$set": {"status": "expired", "updated_at": now}}
+        )
+        return result.modified_count
+
+    # =========================
+    # Idempotency keys (idempotency.py)
+    # =========================
+
+    async def insert_idempotency_key(
+        self,
+        key: str,
+        fingerprint: str,
+        owner: str,
+        lease_until: datetime
+    ) -> bool:
+        """Reserve `key` (pending, leased to `owner`); False when it already exists"""
+        try:
+            await self.db.idempotency_keys.insert_one({
+                "_id": key,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "owner": owner,
+                "lease_until": lease_until,
+                "created_at": datetime.utcnow()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def get_idempotency_key(self, key: str) -> Optional[dict]:
+        return await self.db.idempotency_keys.find_one({"_id": key})
+
+    async def take_over_idempotency_key(
+        self,
+        key: str,
+        previous_owner: Optional[str],
+        owner: str,
+        lease_until: datetime
+    ) -> bool:
+        """Move a pending key from `previous_owner` to `owner` (False if someone else did)"""
+        result = await self.db.idempotency_keys.update_one(
+            {"_id": key, "state": "pending", "owner": previous_owner},
+            {"$set": {"owner": owner, "lease_until": lease_until}}
+        )
+        return result.modified_count > 0
+
+    async def complete_idempotency_key(self, key: str, owner: str, status_code: int, body: Any):
+        """Store the response, unless another owner took the key over"""
+        await self.db.idempotency_keys.update_one(
+            {"_id": key, "owner": owner},
+            {"$set": {"state": "completed", "status_code": status_code, "body": body}}
+        )
+
+    async def release_idempotency_key(self, key: str, owner: str):
+        await self.db.idempotency_keys.delete_one(
+            {"_id": key, "state": "pending", "owner": owner}
+        )
+
+    # =========================
+    # Telegram (routes/telegram.py, telegram_bot.py)
+    # =========================
+
+    async def record_telegram_update(self, update_id: int) -> bool:
+        """False when `update_id` was already received (persistent dedup)"""
+        try:
+            await self.db.telegram_updates.insert_one({
+                "_id": update_id,
+                "received_at": datetime.utcnow()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def get_telegram_session(self, key: str) -> Optional[dict]:
+        return await self.db.telegram_sessions.find_one({"_id": key})
+
+    async def save_telegram_session(self, session: dict):
+        await self.db.telegram_sessions.replace_one(
+            {"_id": session["_id"]}, session, upsert=True
+        )
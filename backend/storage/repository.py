@@ -0,0 +1,682 @@
+"""
+Repository: the single entry point routers use to read and write data.
+
+One instance per request (`Depends(get_repository)`). Reads of single
+documents are memoized for the lifetime of the instance, so the same
+service / working hours / blocked date is fetched at most once per request
+no matter how many code paths ask for it. Every round-trip to the storage
+is counted in `queries` (exposed as the X-DB-Queries response header).
+
+`iter_*` return the storage's async generators for streaming responses;
+opening one counts as one query (the cursor), however many batches follow.
+
+Writes go through here too and emit `events` so projections and caches
+(clients, reports) stay in sync without the routers calling them.
+
+Each shop (tenancy.current_shop()) has its own storage, kept in an LRU
+of tenancy.TENANT_CACHE_SIZE shops (rebuilt on demand). Services,
+settings and working hours are also cached per shop across requests
+(CATALOG_CACHE_TTL_SECONDS, LRU over tenancy.TENANT_CACHE_SIZE shops),
+dropped on every catalog write made by this process; the TTL covers the
+other workers.
+"""
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import os
+
+from fastapi import Request
+
+from cache import TTLCache
+import events
+import monitoring
+import tenancy
+
+_factory: Optional[Callable[[str], Any]] = None
+_shops: Optional[Callable[[str], Awaitable[List[str]]]] = None
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "30"))
+# Storages sem uso saem do LRU; recriar um é barato (só a visão da loja)
+STORAGE_IDLE_SECONDS = float(os.getenv("STORAGE_IDLE_SECONDS", "3600"))
+
+_storages = TTLCache(tenancy.TENANT_CACHE_SIZE, STORAGE_IDLE_SECONDS)
+
+# loja -> {chave de leitura: resultado}
+_catalogs = TTLCache(tenancy.TENANT_CACHE_SIZE, CATALOG_CACHE_TTL_SECONDS)
+
+monitoring.register_cache("catalog", _catalogs.stats)
+monitoring.register_cache("storages", _storages.stats)
+
+
+def init_storage(
+    factory: Callable[[str], Any],
+    shops: Optional[Callable[[str], Awaitable[List[str]]]] = None
+):
+    """
+    `factory(shop_id)` builds a shop's storage (again after eviction);
+    `shops(collection)` lists the shops with data in a collection, for
+    background jobs that go over every shop (default: only the current one)
+    """
+    global _factory, _shops
+    _factory = factory
+    _shops = shops
+    _storages.clear()
+    _catalogs.clear()
+
+
+def get_storage(shop_id: Optional[str] = None):
+    """Storage of `shop_id` (default: the current shop)"""
+    if _factory is None:
+        raise RuntimeError("Storage not initialized")
+    shop_id = shop_id or tenancy.current_shop()
+    storage = _storages.get(shop_id)
+    if storage is None:
+        storage = _factory(shop_id)
+        _storages.put(shop_id, storage)
+    return storage
+
+
+async def list_shops(collection: str) -> List[str]:
+    """Shops with documents in `collection`"""
+    if _shops is None:
+        return [tenancy.current_shop()]
+    return await _shops(collection)
+
+
+def get_repository(request: Request) -> "Repository":
+    """FastAPI dependency: one Repository per request"""
+    repository = getattr(request.state, "repository", None)
+    if repository is None:
+        repository = Repository(get_storage())
+        request.state.repository = repository
+    return repository
+
+
+_MISSING = object()
+
+# Tipos de leitura cacheados por loja entre requisições
+CATALOG_KINDS = ("service", "services", "setting", "settings", "working_hours")
+
+
+class Repository:
+
+    def __init__(self, storage, shop_id: Optional[str] = None):
+        self.storage = storage
+        self.shop_id = shop_id or tenancy.current_shop()
+        self.queries = 0
+        self._memo: Dict[tuple, Any] = {}
+
+    async def _call(self, method: str, *args, **kwargs):
+        self.queries += 1
+        return await getattr(self.storage, method)(*args, **kwargs)
+
+    async def _memoized(self, key: tuple, method: str, *args, **kwargs):
+        value = self._memo.get(key, _MISSING)
+        if value is _MISSING:
+            value = await self._call(method, *args, **kwargs)
+            self._memo[key] = value
+        return value
+
+    def _iter(self, method: str, *args, **kwargs) -> AsyncIterator[dict]:
+        # Contado na abertura: o X-DB-Queries sai antes do corpo em streaming
+        self.queries += 1
+        return getattr(self.storage, method)(*args, **kwargs)
+
+    def _catalog(self) -> dict:
+        catalog = _catalogs.get(self.shop_id)
+        if catalog is None:
+            catalog = {}
+            _catalogs.put(self.shop_id, catalog)
+        return catalog
+
+    async def _cached(self, key: tuple, method: str, *args, **kwargs):
+        """Catalog read: request memo, then the shop's cache, then the storage"""
+        value = self._memo.get(key, _MISSING)
+        if value is _MISSING:
+            catalog = self._catalog()
+            value = catalog.get(key, _MISSING)
+            if value is _MISSING:
+                value = await self._call(method, *args, **kwargs)
+                catalog[key] = value
+            self._memo[key] = value
+        return value
+
+    def _forget(self, kind: str):
+        # "service" também descarta as listas ("services", ...)
+        for key in [k for k in self._memo if k[0] in (kind, kind + "s")]:
+            del self._memo[key]
+        if kind in CATALOG_KINDS:
+            _catalogs.pop(self.shop_id)
+
+    # =========================
+    # Services
+    # =========================
+
+    async def list_services(self, active: Optional[bool] = None) -> List[dict]:
+        return await self._cached(("services", active), "list_services", active)
+
+    def iter_services(self, active: Optional[bool] = None) -> AsyncIterator[dict]:
+        return self._iter("iter_services", active)
+
+    async def get_service(self, service_id: str) -> Optional[dict]:
+        return await self._cached(("service", service_id), "get_service", service_id)
+
+    async def get_services(self, service_ids: Iterable[str]) -> Dict[str, dict]:
+        """Services by id in one round-trip (ids already cached are skipped)"""
+        ids = set(service_ids)
+        catalog = self._catalog()
+        for service_id in ids:
+            key = ("service", service_id)
+            if key not in self._memo and key in catalog:
+                self._memo[key] = catalog[key]
+        missing = [i for i in ids if ("service", i) not in self._memo]
+        if missing:
+            found = {s["id"]: s for s in await self._call("get_services", missing)}
+            for service_id in missing:
+                self._memo[("service", service_id)] = found.get(service_id)
+                catalog[("service", service_id)] = found.get(service_id)
+        return {
+            i: self._memo[("service", i)]
+            for i in ids
+            if self._memo[("service", i)] is not None
+        }
+
+    async def count_services(self, active: Optional[bool] = None) -> int:
+        return await self._call("count_services", active)
+
+    async def create_service(self, doc: dict):
+        await self._call("insert_service", doc)
+        self._forget("service")
+        await events.emit(events.CATALOG_CHANGED, "services")
+
+    async def update_service(self, service_id: str, fields: dict) -> Optional[dict]:
+        before = await self._call("update_service", service_id, fields)
+        self._forget("service")
+        if before is None:
+            return None
+        await events.emit(events.CATALOG_CHANGED, "services")
+        return {**before, **fields}
+
+    async def delete_service(self, service_id: str) -> bool:
+        deleted = await self._call("delete_service", service_id)
+        self._forget("service")
+        if deleted is None:
+            return False
+        await events.emit(events.CATALOG_CHANGED, "services")
+        return True
+
+    # =========================
+    # Settings
+    # =========================
+
+    async def list_settings(self) -> List[dict]:
+        return await self._cached(("settings",), "list_settings")
+
+    def iter_settings(self) -> AsyncIterator[dict]:
+        return self._iter("iter_settings")
+
+    async def get_setting(self, key: str) -> Optional[dict]:
+        return await self._cached(("setting", key), "get_setting", key)
+
+    async def create_setting(self, doc: dict):
+        await self._call("insert_setting", doc)
+        self._forget("setting")
+        await events.emit(events.CATALOG_CHANGED, "settings")
+
+    async def update_setting(self, key: str, fields: dict) -> Optional[dict]:
+        before = await self._call("update_setting", key, fields)
+        self._forget("setting")
+        if before is None:
+            return None
+        await events.emit(events.CATALOG_CHANGED, "settings")
+        return {**before, **fields}
+
+    async def delete_setting(self, key: str) -> bool:
+        deleted = await self._call("delete_setting", key)
+        self._forget("setting")
+        if deleted is None:
+            return False
+        await events.emit(events.CATALOG_CHANGED, "settings")
+        return True
+
+    # =========================
+    # Working hours
+    # =========================
+
+    async def list_working_hours(self) -> List[dict]:
+        return await self._cached(("working_hours",), "list_working_hours")
+
+    def iter_working_hours(self) -> AsyncIterator[dict]:
+        return self._iter("iter_working_hours")
+
+    async def get_working_hours(
+        self,
+        day_of_week: int,
+        active: Optional[bool] = None
+    ) -> Optional[dict]:
+        return await self._cached(
+            ("working_hours", day_of_week, active),
+            "get_working_hours", day_of_week, active
+        )
+
+    async def working_hours_for(self, date: str) -> Optional[dict]:
+        """Active working hours for a "YYYY-MM-DD" date"""
+        day_of_week = datetime.strptime(date, "%Y-%m-%d").weekday()  # 0 = segunda
+        return await self.get_working_hours(day_of_week, active=True)
+
+    async def create_working_hours(self, doc: dict):
+        await self._call("insert_working_hours", doc)
+        self._forget("working_hours")
+        await events.emit(events.CATALOG_CHANGED, "working_hours")
+
+    async def update_working_hours(self, day_of_week: int, fields: dict) -> Optional[dict]:
+        before = await self._call("update_working_hours", day_of_week, fields)
+        self._forget("working_hours")
+        if before is None:
+            return None
+        await events.emit(events.CATALOG_CHANGED, "working_hours")
+        return {**before, **fields}
+
+    async def delete_working_hours(self, day_of_week: int) -> bool:
+        deleted = await self._call("delete_working_hours", day_of_week)
+        self._forget("working_hours")
+        if deleted is None:
+            return False
+        await events.emit(events.CATALOG_CHANGED, "working_hours")
+        return True
+
+    # =========================
+    # Blocked dates
+    # =========================
+
+    async def list_blocked_dates(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None
+    ) -> List[dict]:
+        """Blocked dates, optionally only those in [date_from, date_to]"""
+        return await self._call("list_blocked_dates", date_from, date_to)
+
+    def iter_blocked_dates(self) -> AsyncIterator[dict]:
+        return self._iter("iter_blocked_dates")
+
+    async def get_blocked_date(self, date: str) -> Optional[dict]:
+        return await self._memoized(("blocked_date", date), "get_blocked_date", date)
+
+    async def create_blocked_date(self, doc: dict):
+        await self._call("insert_blocked_date", doc)
+        self._forget("blocked_date")
+        await events.emit(events.CATALOG_CHANGED, "blocked_dates")
+
+    async def delete_blocked_date(self, date: str) -> bool:
+        deleted = await self._call("delete_blocked_date", date)
+        self._forget("blocked_date")
+        if deleted is None:
+            return False
+        await events.emit(events.CATALOG_CHANGED, "blocked_dates")
+        return True
+
+    # =========================
+    # Appointments
+    # =========================
+
+    async def get_appointment(self, appointment_id: str) -> Optional[dict]:
+        return await self._memoized(
+            ("appointment", appointment_id), "get_appointment", appointment_id
+        )
+
+    async def find_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 100,
+        client_phones: Optional[List[str]] = None,
+        include_archive: bool = False
+    ) -> List[dict]:
+        return await self._call(
+            "find_appointments",
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            client_phones=client_phones,
+            include_archive=include_archive
+        )
+
+    def iter_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        include_archive: bool = False
+    ) -> AsyncIterator[dict]:
+        """
+        Appointments most recent first, streamed from the storage cursor.
+        Open ranges (no date_from) skip the archive unless `include_archive`.
+        """
+        return self._iter(
+            "iter_appointments",
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            client_phones=client_phones,
+            skip=skip,
+            limit=limit,
+            include_archive=include_archive
+        )
+
+    def iter_appointment_batches(
+        self,
+        fields: List[str],
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[dict]]:
+        """Projected appointments in lists of `batch_size`, unordered (analytics)"""
+        return self._iter(
+            "iter_appointment_batches",
+            fields,
+            date_from=date_from,
+            date_to=date_to,
+            batch_size=batch_size
+        )
+
+    async def count_appointments(
+        self,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        client_phones: Optional[List[str]] = None,
+        include_archive: bool = False,
+        limit: Optional[int] = None
+    ) -> int:
+        """Count (capped per collection at `limit`, when given)"""
+        return await self._call(
+            "count_appointments",
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            client_phones=client_phones,
+            include_archive=include_archive,
+            limit=limit
+        )
+
+    async def appointment_counts(
+        self,
+        date_from: str,
+        date_to: str,
+        bucket: str
+    ) -> List[dict]:
+        """Counts and stored revenue per (bucket, service, source, status), archive included"""
+        return await self._call("appointment_counts", date_from, date_to, bucket)
+
+    async def find_conflict(self, date: str, time: str) -> Optional[dict]:
+        return await self._call("find_conflict", date, time)
+
+    async def booked_times(self, date: str) -> List[str]:
+        return await self._call("booked_times", date)
+
+    async def slot_problems(self, dates: List[str], time: str) -> Dict[str, str]:
+        """
+        slot_problem for the same time on many dates, with one fetch per
+        check instead of one per date. Returns {date: reason} for the
+        dates that can't be booked.
+        """
+        blocked = {
+            b["date"]: b for b in await self._call("get_blocked_dates", dates)
+        }
+        for date in dates:
+            self._memo[("blocked_date", date)] = blocked.get(date)
+
+        problems = {}
+        for date in dates:
+            if date in blocked:
+                problems[date] = "This date is blocked"
+            # Memo por dia da semana: uma consulta para a série inteira
+            elif not await self.working_hours_for(date):
+                problems[date] = "No working hours for this day"
+
+        remaining = [d for d in dates if d not in problems]
+        if remaining:
+            for date in await self._call("booked_dates", remaining, time):
+                problems[date] = "Time slot already booked"
+
+        return problems
+
+    async def slot_problem(self, date: str, time: str) -> Optional[str]:
+        """
+        Why `time` on `date` can't be booked (None if it can): blocked
+        date, no working hours that day, or already booked.
+        """
+        if await self.get_blocked_date(date):
+            return "This date is blocked"
+
+        if not await self.working_hours_for(date):
+            return "No working hours for this day"
+
+        if await self.find_conflict(date, time):
+            return "Time slot already booked"
+
+        return None
+
+    async def create_appointment(self, doc: dict):
+        await self._call("insert_appointment", doc)
+        self._memo[("appointment", doc["id"])] = doc
+        await events.emit(events.APPOINTMENT_CHANGED, None, doc)
+
+    async def create_appointment_if_free(self, doc: dict) -> bool:
+        """
+        create_appointment as one conditional write: nothing is inserted
+        (False) when the slot already has an active appointment
+        """
+        if not await self._call("insert_appointment_if_free", doc):
+            return False
+        self._memo[("appointment", doc["id"])] = doc
+        await events.emit(events.APPOINTMENT_CHANGED, None, doc)
+        return True
+
+    async def create_appointments(self, docs: List[dict]):
+        """Insert many appointments in one batched write"""
+        await self._call("insert_appointments", docs)
+        for doc in docs:
+            self._memo[("appointment", doc["id"])] = doc
+        for doc in docs:
+            await events.emit(events.APPOINTMENT_CHANGED, None, doc)
+
+    async def update_appointment(
+        self,
+        appointment_id: str,
+        fields: dict,
+        only_if_status: Optional[str] = None
+    ) -> Optional[dict]:
+        """Updated appointment; None when missing (or not in `only_if_status`)"""
+        # O arquivamento só move o que não mudou desde a leitura (por updated_at)
+        fields = {"updated_at": datetime.utcnow(), **fields}
+        before = await self._call(
+            "update_appointment", appointment_id, fields, only_if_status
+        )
+        if before is None:
+            self._memo.pop(("appointment", appointment_id), None)
+            return None
+        updated = {**before, **fields}
+        self._memo[("appointment", appointment_id)] = updated
+        await events.emit(events.APPOINTMENT_CHANGED, before, updated)
+        return updated
+
+    async def delete_appointment(self, appointment_id: str) -> Optional[dict]:
+        deleted = await self._call("delete_appointment", appointment_id)
+        self._memo.pop(("appointment", appointment_id), None)
+        if deleted is not None:
+            await events.emit(events.APPOINTMENT_CHANGED, deleted, None)
+        return deleted
+
+    async def archive_batch(self, cutoff: str, batch_size: int) -> Tuple[int, int]:
+        """
+        Move one batch of appointments dated before `cutoff` to the
+        archive: (read, moved)
+        """
+        read, moved = await self._call("archive_batch", cutoff, batch_size)
+        # Mudou de coleção, não de conteúdo: as projeções recebem o mesmo
+        # agendamento antes e depois (nada a descontar)
+        for appointment in moved:
+            self._memo.pop(("appointment", appointment["id"]), None)
+            await events.emit(events.APPOINTMENT_CHANGED, appointment, appointment)
+        return read, len(moved)
+
+    # =========================
+    # Clients
+    # =========================
+
+    async def get_client(self, phone: str) -> Optional[dict]:
+        """Client of the projection by normalized phone"""
+        return await self._memoized(("client_phone", phone), "get_client", phone)
+
+    async def get_client_by_telegram(self, username: str) -> Optional[dict]:
+        return await self._call("get_client_by_telegram", username)
+
+    async def find_client_by_telegram(self, username: str) -> Optional[dict]:
+        """{"name", "phone"} of the client last seen with this (normalized) username"""
+        return await self._memoized(
+            ("client", username), "find_client_by_telegram", username
+        )
+
+    async def search_clients(self, field: str, prefix: str, limit: int) -> List[dict]:
+        return await self._call("search_clients", field, prefix, limit)
+
+    async def update_client_counters(
+        self,
+        phone: str,
+        variant: str,
+        inc: dict,
+        fields: dict,
+        last_visit: Optional[str] = None,
+        upsert: bool = True
+    ) -> Optional[dict]:
+        """Client after the write (see the storage); None when missing and not upsert"""
+        self._memo.pop(("client_phone", phone), None)
+        return await self._call(
+            "update_client_counters", phone, variant, inc, fields, last_visit, upsert
+        )
+
+    async def set_client_fields(self, phone: str, fields: dict):
+        self._memo.pop(("client_phone", phone), None)
+        await self._call("set_client_fields", phone, fields)
+
+    def iter_client_history(self, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Appointment totals per (phone, service, username, status), hot + archive"""
+        return self._iter("iter_client_history", batch_size)
+
+    async def upsert_clients(self, clients: List[dict]):
+        await self._call("upsert_clients", clients)
+
+    async def delete_clients_updated_before(self, when: datetime) -> int:
+        return await self._call("delete_clients_updated_before", when)
+
+    # =========================
+    # Waitlist
+    # =========================
+
+    async def create_waitlist_entry(self, doc: dict):
+        await self._call("insert_waitlist_entry", doc)
+
+    def iter_waitlist(
+        self,
+        date: Optional[str] = None,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[dict]:
+        """Waitlist entries in arrival order, streamed from the storage cursor"""
+        return self._iter("iter_waitlist", date, status, skip, limit)
+
+    async def count_waitlist(
+        self,
+        date: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> int:
+        return await self._call("count_waitlist", date, status)
+
+    async def claim_waitlist_entry(self, date: str, time: str, fields: dict) -> Optional[dict]:
+        """Oldest waiting entry for this slot, atomically updated with `fields`"""
+        return await self._call("claim_waitlist_entry", date, time, fields)
+
+    async def update_waitlist_entry(
+        self,
+        entry_id: str,
+        fields: dict,
+        only_if_status: Iterable[str] = (),
+        unset: Iterable[str] = ()
+    ) -> Optional[dict]:
+        """Entry before the write; None when missing (or not in `only_if_status`)"""
+        return await self._call(
+            "update_waitlist_entry", entry_id, fields, tuple(only_if_status), tuple(unset)
+        )
+
+    async def get_waitlist_offer(self, entry_id: str, chat_id: int, now: datetime) -> Optional[dict]:
+        return await self._call("get_waitlist_offer", entry_id, chat_id, now)
+
+    async def close_waitlist_offer(
+        self,
+        entry_id: str,
+        chat_id: int,
+        now: datetime,
+        status: str
+    ) -> Optional[dict]:
+        return await self._call("close_waitlist_offer", entry_id, chat_id, now, status)
+
+    async def expire_waitlist_offer(self, now: datetime) -> Optional[dict]:
+        return await self._call("expire_waitlist_offer", now)
+
+    async def expire_past_waitlist(self, today: str, now: datetime) -> int:
+        return await self._call("expire_past_waitlist", today, now)
+
+    # =========================
+    # Idempotency keys
+    # =========================
+
+    async def insert_idempotency_key(
+        self,
+        key: str,
+        fingerprint: str,
+        owner: str,
+        lease_until: datetime
+    ) -> bool:
+        """False when the key already exists (pending or completed)"""
+        return await self._call("insert_idempotency_key", key, fingerprint, owner, lease_until)
+
+    async def get_idempotency_key(self, key: str) -> Optional[dict]:
+        return await self._call("get_idempotency_key", key)
+
+    async def take_over_idempotency_key(
+        self,
+        key: str,
+        previous_owner: Optional[str],
+        owner: str,
+        lease_until: datetime
+    ) -> bool:
+        return await self._call(
+            "take_over_idempotency_key", key, previous_owner, owner, lease_until
+        )
+
+    async def complete_idempotency_key(self, key: str, owner: str, status_code: int, body: Any):
+        await self._call("complete_idempotency_key", key, owner, status_code, body)
+
+    async def release_idempotency_key(self, key: str, owner: str):
+        await self._call("release_idempotency_key", key, owner)
+
+    # =========================
+    # Telegram
+    # =========================
+
+    async def record_telegram_update(self, update_id: int) -> bool:
+        """False when the update was already received"""
+        return await self._call("record_telegram_update", update_id)
+
+    async def get_telegram_session(self, key: str) -> Optional[dict]:
+        return await self._call("get_telegram_session", key)
+
+    async def save_telegram_session(self, session: dict):
+        await self._call("save_telegram_session", session)
@@ -0,0 +1,226 @@
+"""
+Tenant-scoped view of a Motor database.
+
+`ScopedDatabase(db)` hands out collections that only see one shop's
+documents: every filter gets `shop_id`, inserted/replaced documents are
+stamped with it, aggregations start with a `$match` on it (also inside
+`$unionWith`), and indexes are created with `shop_id` as their first key.
+The shop is fixed (`ScopedDatabase(db, shop_id)`) or, by default, read
+from tenancy.current_shop() on each call.
+
+All shops share the underlying client and its connection pool.
+
+GLOBAL_COLLECTIONS are handed out as-is: they hold deployment-level data
+keyed by `_id` (rate limit buckets per IP, Telegram update ids).
+"""
+from typing import List, Optional
+import copy
+import logging
+
+from pymongo import InsertOne, ReplaceOne
+
+import tenancy
+
+logger = logging.getLogger("primo-barber.storage")
+
+SHOP_FIELD = "shop_id"
+
+GLOBAL_COLLECTIONS = {"rate_limits", "telegram_updates"}
+
+MIGRATIONS_COLLECTION = "migrations"
+
+
+def _leading(keys) -> list:
+    """Normalize create_index keys to a list of (field, direction)"""
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return list(keys)
+
+
+class ScopedCollection:
+    """Motor collection restricted to one shop"""
+
+    def __init__(self, collection, shop_id: Optional[str] = None):
+        self.unscoped = collection
+        self.name = collection.name
+        self._shop_id = shop_id
+
+    @property
+    def shop_id(self) -> str:
+        return self._shop_id or tenancy.current_shop()
+
+    def _filter(self, query: Optional[dict] = None) -> dict:
+        return {**(query or {}), SHOP_FIELD: self.shop_id}
+
+    def _stamp(self, doc: dict) -> dict:
+        return {**doc, SHOP_FIELD: self.shop_id}
+
+    def _pipeline(self, pipeline: List[dict]) -> List[dict]:
+        match = {"$match": {SHOP_FIELD: self.shop_id}}
+        scoped = [match]
+        for stage in pipeline:
+            union = stage.get("$unionWith")
+            if isinstance(union, dict):
+                stage = {"$unionWith": {
+                    **union, "pipeline": [match, *union.get("pipeline", [])]
+                }}
+            elif isinstance(union, str):
+                stage = {"$unionWith": {"coll": union, "pipeline": [match]}}
+            scoped.append(stage)
+        return scoped
+
+    # Leituras
+
+    def find(self, filter: Optional[dict] = None, *args, **kwargs):
+        return self.unscoped.find(self._filter(filter), *args, **kwargs)
+
+    async def find_one(self, filter: Optional[dict] = None, *args, **kwargs):
+        return await self.unscoped.find_one(self._filter(filter), *args, **kwargs)
+
+    async def count_documents(self, filter: Optional[dict] = None, **kwargs) -> int:
+        return await self.unscoped.count_documents(self._filter(filter), **kwargs)
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        # O contador da coleção inclui todas as lojas: conta pelo índice de shop_id
+        return await self.count_documents({})
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> list:
+        return await self.unscoped.distinct(key, self._filter(filter), **kwargs)
+
+    def aggregate(self, pipeline: List[dict], *args, **kwargs):
+        return self.unscoped.aggregate(self._pipeline(pipeline), *args, **kwargs)
+
+    # Escritas (upsert herda shop_id da igualdade no filtro)
+
+    async def insert_one(self, document: dict, *args, **kwargs):
+        return await self.unscoped.insert_one(self._stamp(document), *args, **kwargs)
+
+    async def insert_many(self, documents, *args, **kwargs):
+        return await self.unscoped.insert_many(
+            [self._stamp(d) for d in documents], *args, **kwargs
+        )
+
+    async def replace_one(self, filter: dict, replacement: dict, *args, **kwargs):
+        return await self.unscoped.replace_one(
+            self._filter(filter), self._stamp(replacement), *args, **kwargs
+        )
+
+    async def update_one(self, filter: dict, update, *args, **kwargs):
+        return await self.unscoped.update_one(self._filter(filter), update, *args, **kwargs)
+
+    async def update_many(self, filter: dict, update, *args, **kwargs):
+        return await self.unscoped.update_many(self._filter(filter), update, *args, **kwargs)
+
+    async def find_one_and_update(self, filter: dict, update, *args, **kwargs):
+        return await self.unscoped.find_one_and_update(
+            self._filter(filter), update, *args, **kwargs
+        )
+
+    async def find_one_and_delete(self, filter: dict, *args, **kwargs):
+        return await self.unscoped.find_one_and_delete(self._filter(filter), *args, **kwargs)
+
+    async def delete_one(self, filter: dict, *args, **kwargs):
+        return await self.unscoped.delete_one(self._filter(filter), *args, **kwargs)
+
+    async def delete_many(self, filter: dict, *args, **kwargs):
+        return await self.unscoped.delete_many(self._filter(filter), *args, **kwargs)
+
+    async def bulk_write(self, requests: list, *args, **kwargs):
+        """pymongo requests (InsertOne, UpdateOne, ...) scoped like the methods above"""
+        return await self.unscoped.bulk_write(
+            [self._request(r) for r in requests], *args, **kwargs
+        )
+
+    def _request(self, request):
+        # Cópia: o pedido do chamador não muda
+        scoped = copy.copy(request)
+        if hasattr(request, "_filter"):
+            scoped._filter = self._filter(request._filter)
+        if isinstance(request, (InsertOne, ReplaceOne)):
+            scoped._doc = self._stamp(request._doc)
+        return scoped
+
+    # Índices
+
+    async def create_index(self, keys, **kwargs):
+        """
+        Same index led by shop_id. TTL indexes must have a single field
+        and are created as-is (they expire documents of every shop).
+        """
+        keys = _leading(keys)
+        if "expireAfterSeconds" not in kwargs and keys[0][0] != SHOP_FIELD:
+            keys = [(SHOP_FIELD, 1), *keys]
+        return await self.unscoped.create_index(keys, **kwargs)
+
+    async def drop(self):
+        """Drop this shop's documents (the collection is shared)"""
+        await self.unscoped.delete_many({SHOP_FIELD: self.shop_id})
+
+
+class ScopedDatabase:
+    """Motor database whose collections are ScopedCollection"""
+
+    def __init__(self, db, shop_id: Optional[str] = None):
+        self.unscoped = db
+        self.name = db.name
+        self._shop_id = shop_id
+        self._collections = {}
+
+    def __getitem__(self, name: str):
+        collection = self._collections.get(name)
+        if collection is None:
+            raw = self.unscoped[name]
+            collection = raw if name in GLOBAL_COLLECTIONS \
+                else ScopedCollection(raw, self._shop_id)
+            self._collections[name] = collection
+        return collection
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def for_shop(self, shop_id: str) -> "ScopedDatabase":
+        return ScopedDatabase(self.unscoped, shop_id)
+
+    async def command(self, *args, **kwargs):
+        return await self.unscoped.command(*args, **kwargs)
+
+    async def shops(self, collection: str) -> List[str]:
+        """Shops with documents in `collection` (distinct over the shop_id indexes)"""
+        return await self.unscoped[collection].distinct(SHOP_FIELD)
+
+
+async def migrate(db) -> None:
+    """
+    One-time move of a single-shop database to multi-tenant: documents
+    without shop_id go to tenancy.DEFAULT_SHOP_ID, and indexes not led by
+    shop_id are dropped (unique ones would clash across shops; the
+    modules' ensure_indexes recreate them led by shop_id).
+    """
+    marker = {"_id": "tenancy"}
+    if await db[MIGRATIONS_COLLECTION].find_one(marker):
+        return
+
+    for name in await db.list_collection_names():
+        if name in GLOBAL_COLLECTIONS or name == MIGRATIONS_COLLECTION \
+                or name.startswith("system."):
+            continue
+        collection = db[name]
+        result = await collection.update_many(
+            {SHOP_FIELD: {"$exists": False}},
+            {"$set": {SHOP_FIELD: tenancy.DEFAULT_SHOP_ID}}
+        )
+        for index in await collection.list_indexes().to_list(None):
+            keys = list(index["key"].keys())
+            if index["name"] == "_id_" or "expireAfterSeconds" in index \
+                    or keys[0] == SHOP_FIELD:
+                continue
+            await collection.drop_index(index["name"])
+            logger.info("Dropped index %s.%s (not led by shop_id)", name, index["name"])
+        logger.info(
+            "Assigned %s documents of %s to shop %s",
+            result.modified_count, name, tenancy.DEFAULT_SHOP_ID
+        )
+
+    await db[MIGRATIONS_COLLECTION].insert_one(marker)
@@ -0,0 +1,91 @@
+"""
+Streaming JSON lists for the list endpoints.
+
+Items come from an async iterator (a storage cursor) and are encoded one
+by one into a JSON array, flushed in chunks of about CHUNK_SIZE bytes, so
+memory does not grow with the size of the result. Nothing is truncated:
+paginated endpoints send explicit metadata in headers (an RFC 8288 Link
+to the next/previous page and, when counted, X-Total-Count).
+"""
+from typing import AsyncIterator, Optional, Type
+import json
+import logging
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+logger = logging.getLogger("primo-barber.streaming")
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def json_array(
+    items: AsyncIterator[dict],
+    model: Optional[Type[BaseModel]] = None
+) -> AsyncIterator[bytes]:
+    """Encode `items` (validated through `model`) as a JSON array"""
+    buffer = bytearray(b"[")
+    first = True
+    try:
+        async for item in items:
+            if model is not None:
+                item = model(**item)
+            if not first:
+                buffer += b","
+            first = False
+            buffer += json.dumps(
+                jsonable_encoder(item),
+                separators=(",", ":"),
+                ensure_ascii=False
+            ).encode()
+            if len(buffer) >= CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+    except Exception:
+        # Status 200 já foi enviado: corta a resposta (JSON inválido) em
+        # vez de fechar o array e fingir que a lista acabou
+        logger.exception("List stream failed")
+        raise
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+def _page_url(request: Request, offset: int, limit: int) -> str:
+    return str(request.url.include_query_params(offset=offset, limit=limit))
+
+
+def stream_list(
+    items: AsyncIterator[dict],
+    model: Optional[Type[BaseModel]] = None,
+    *,
+    request: Optional[Request] = None,
+    total: Optional[int] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    has_more: Optional[bool] = None
+) -> StreamingResponse:
+    """
+    StreamingResponse with a JSON array of `items`. With `total`, adds
+    X-Total-Count; with `total` or `has_more` (there is something after
+    this page), and a `limit`, Link rel="next"/"prev".
+    """
+    headers = {}
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+        has_more = offset + (limit or total) < total
+    if has_more is not None and request is not None and limit:
+        links = []
+        if has_more:
+            links.append(f'<{_page_url(request, offset + limit, limit)}>; rel="next"')
+        if offset > 0:
+            links.append(f'<{_page_url(request, max(offset - limit, 0), limit)}>; rel="prev"')
+        if links:
+            headers["Link"] = ", ".join(links)
+
+    return StreamingResponse(
+        json_array(items, model),
+        media_type="application/json",
+        headers=headers
+    )
@@ -0,0 +1,380 @@
+"""
+Conversa de agendamento do bot do Telegram, executada dentro da API.
+
+Cada update recebido pelo webhook (routes/telegram.py) passa por
+`handle_update`. O estado de cada chat fica em memória e é persistido no
+storage (`telegram_sessions`); disponibilidade
+e criação de agendamentos são chamadas diretamente (com o mesmo
+Repository da API), sem voltar à API por HTTP.
+
+Fluxo: serviço -> dia -> horário -> nome -> telefone -> confirmação.
+"""
+from datetime import datetime, timedelta
+from html import escape
+from typing import Awaitable, Callable, Dict, Optional
+import logging
+import os
+
+from fastapi import HTTPException
+
+from cache import TTLCache
+from models import AppointmentCreate
+import monitoring
+import ratelimit
+import telegram_client
+from routes.appointments import book_appointment
+from routes.avaliability import compute_availability
+from routes.clients import normalize_username
+from storage import Repository, get_storage
+import tenancy
+
+logger = logging.getLogger("primo-barber.telegram")
+
+SESSION_TTL_SECONDS = int(os.getenv("TELEGRAM_SESSION_TTL_HOURS", "24")) * 3600
+DAYS_AHEAD = int(os.getenv("TELEGRAM_BOOKING_DAYS_AHEAD", "7"))
+
+WEEKDAYS = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+
+_sessions = TTLCache(10_000, SESSION_TTL_SECONDS)
+
+monitoring.register_cache("telegram_sessions", _sessions.stats)
+
+CallbackHandler = Callable[[int, str, dict], Awaitable[None]]
+_callback_handlers: Dict[str, CallbackHandler] = {}
+
+
+def register_callback(prefix: str, handler: CallbackHandler):
+    """
+    Route callback_data "<prefix>:<value>" to `handler(chat_id, value,
+    callback_query)`. Lets other modules (e.g. waitlist offers) add
+    buttons to the bot.
+    """
+    _callback_handlers[prefix] = handler
+
+
+async def ensure_indexes(db):
+    await db.telegram_sessions.create_index(
+        "updated_at",
+        expireAfterSeconds=SESSION_TTL_SECONDS
+    )
+
+
+# =========================
+# Sessões
+# =========================
+
+def _new_session(key: str, chat_id: int) -> dict:
+    return {"_id": key, "chat_id": chat_id, "state": "idle", "data": {}}
+
+
+async def load_session(chat_id: int) -> dict:
+    # Mesmo chat pode conversar com lojas diferentes: chave inclui a loja
+    key = tenancy.shop_key(chat_id)
+    session = _sessions.get(key)
+    if session is None:
+        session = await Repository(get_storage()).get_telegram_session(key) \
+            or _new_session(key, chat_id)
+        _sessions.put(key, session)
+    return session
+
+
+async def save_session(session: dict):
+    session["updated_at"] = datetime.utcnow()
+    _sessions.put(session["_id"], session)
+    await Repository(get_storage()).save_telegram_session(session)
+
+
+def _reset(session: dict):
+    session["state"] = "idle"
+    session["data"] = {}
+
+
+# =========================
+# Teclados
+# =========================
+
+def _inline(buttons, per_row: int) -> dict:
+    rows = [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+    return {"inline_keyboard": rows}
+
+
+def _button(text: str, data: str) -> dict:
+    return {"text": text, "callback_data": data}
+
+
+# =========================
+# Passos da conversa
+# =========================
+
+async def _ask_service(chat_id: int, session: dict, repo: Repository):
+    services = await repo.list_services(active=True)
+
+    if not services:
+        await telegram_client.send_message(
+            chat_id, "No momento não há serviços disponíveis."
+        )
+        _reset(session)
+        return
+
+    session["state"] = "choose_service"
+    await telegram_client.send_message(
+        chat_id,
+        "✂️ Qual serviço você deseja?",
+        _inline([
+            _button(f"{s['name']} - R$ {s['price']:.2f}", f"svc:{s['id']}")
+            for s in services
+        ], per_row=1)
+    )
+
+
+async def _ask_date(chat_id: int, session: dict, text: str = "📅 Escolha o dia:"):
+    today = datetime.utcnow().date()
+    days = [today + timedelta(days=i) for i in range(DAYS_AHEAD)]
+
+    session["state"] = "choose_date"
+    await telegram_client.send_message(
+        chat_id,
+        text,
+        _inline([
+            _button(f"{WEEKDAYS[d.weekday()]} {d.strftime('%d/%m')}", f"day:{d.isoformat()}")
+            for d in days
+        ], per_row=4)
+    )
+
+
+async def _ask_time(chat_id: int, session: dict, date: str, repo: Repository):
+    availability = await compute_availability(date, repo)
+    times = availability["available_times"]
+
+    if not times:
+        await _ask_date(chat_id, session, "😕 Sem horários nesse dia. Escolha outro:")
+        return
+
+    session["data"]["date"] = date
+    session["state"] = "choose_time"
+    await telegram_client.send_message(
+        chat_id,
+        "🕒 Escolha o horário:",
+        _inline(
+            [_button(t, f"time:{t}") for t in times]
+            + [_button("⬅️ Outro dia", "back:dates")],
+            per_row=4
+        )
+    )
+
+
+async def _ask_name(chat_id: int, session: dict):
+    session["state"] = "ask_name"
+    await telegram_client.send_message(chat_id, "Qual é o seu nome?")
+
+
+async def _ask_phone(chat_id: int, session: dict):
+    session["state"] = "ask_phone"
+    await telegram_client.send_message(
+        chat_id,
+        "📱 Envie seu telefone (ou toque no botão abaixo):",
+        {
+            "keyboard": [[{"text": "📱 Enviar telefone", "request_contact": True}]],
+            "one_time_keyboard": True,
+            "resize_keyboard": True
+        }
+    )
+
+
+async def _ask_confirmation(chat_id: int, session: dict):
+    data = session["data"]
+    day = datetime.strptime(data["date"], "%Y-%m-%d")
+
+    session["state"] = "confirm"
+    await telegram_client.send_message(
+        chat_id,
+        "Confirma o agendamento?\n\n"
+        f"✂️ {escape(data['service_name'])}\n"
+        f"📅 {WEEKDAYS[day.weekday()]} {day.strftime('%d/%m/%Y')} às {data['time']}\n"
+        f"👤 {escape(data['name'])} - {escape(data['phone'])}",
+        _inline([_button("✅ Confirmar", "ok:yes"), _button("❌ Cancelar", "ok:no")], per_row=2)
+    )
+
+
+async def _book(chat_id: int, session: dict, username: Optional[str], repo: Repository):
+    data = session["data"]
+    try:
+        # O bot é público como o site: mesmo limite por telefone
+        async with ratelimit.phone_quota(data["phone"]):
+            appointment = await book_appointment(
+                AppointmentCreate(
+                    client_name=data["name"],
+                    client_phone=data["phone"],
+                    client_telegram_username=username,
+                    service_id=data["service_id"],
+                    date=data["date"],
+                    time=data["time"]
+                ),
+                repo,
+                source="telegram"
+            )
+    except HTTPException as exc:
+        if exc.status_code == 400 and "booked" in str(exc.detail):
+            await _ask_date(chat_id, session, "😕 Esse horário acabou de ser ocupado. Escolha outro dia:")
+            return
+        await telegram_client.send_message(
+            chat_id, f"Não foi possível agendar: {escape(str(exc.detail))}"
+        )
+        _reset(session)
+        return
+
+    _reset(session)
+    await telegram_client.send_message(
+        chat_id,
+        "✅ Agendamento recebido! Você receberá a confirmação em breve.\n"
+        f"Código: <code>{appointment.id[:8]}</code>"
+    )
+
+
+async def _prefill_known_client(
+    session: dict,
+    username: Optional[str],
+    repo: Repository
+) -> bool:
+    """Skip name/phone for clients that already booked with this username"""
+    username = normalize_username(username)
+    if not username:
+        return False
+
+    client = await repo.find_client_by_telegram(username)
+    if not client:
+        return False
+
+    session["data"]["name"] = client["name"]
+    session["data"]["phone"] = client["phone"]
+    return True
+
+
+# =========================
+# Dispatch
+# =========================
+
+async def _on_message(message: dict, repo: Repository):
+    chat_id = message["chat"]["id"]
+    session = await load_session(chat_id)
+    text = (message.get("text") or "").strip()
+    username = message.get("from", {}).get("username")
+
+    if text.lower() in ("/cancelar", "cancelar"):
+        _reset(session)
+        await telegram_client.send_message(
+            chat_id, "Tudo bem, agendamento cancelado.", {"remove_keyboard": True}
+        )
+
+    elif text.startswith("/start") or text.lower() in ("/agendar", "agendar"):
+        _reset(session)
+        await _ask_service(chat_id, session, repo)
+
+    elif session["state"] == "ask_name" and text:
+        session["data"]["name"] = text[:100]
+        await _ask_phone(chat_id, session)
+
+    elif session["state"] == "ask_phone":
+        contact = message.get("contact")
+        phone = contact["phone_number"] if contact else text
+        if sum(c.isdigit() for c in phone) < 8:
+            await telegram_client.send_message(chat_id, "Telefone inválido, tente de novo.")
+            return
+        session["data"]["phone"] = phone
+        await telegram_client.send_message(chat_id, "Obrigado!", {"remove_keyboard": True})
+        await _ask_confirmation(chat_id, session)
+
+    else:
+        await telegram_client.send_message(
+            chat_id, "Olá! Envie /agendar para marcar um horário ou /cancelar para sair."
+        )
+        return
+
+    await save_session(session)
+
+
+async def _on_callback(callback: dict, repo: Repository):
+    chat_id = callback["message"]["chat"]["id"]
+    username = callback.get("from", {}).get("username")
+    prefix, _, value = (callback.get("data") or "").partition(":")
+
+    await telegram_client.answer_callback(callback["id"])
+
+    if prefix in _callback_handlers:
+        await _callback_handlers[prefix](chat_id, value, callback)
+        return
+
+    session = await load_session(chat_id)
+    state = session["state"]
+
+    if prefix == "svc" and state == "choose_service":
+        service = await repo.get_service(value)
+        if not service or not service.get("active"):
+            await _ask_service(chat_id, session, repo)
+        else:
+            session["data"].update(service_id=value, service_name=service["name"])
+            await _ask_date(chat_id, session)
+
+    elif prefix == "day" and state in ("choose_date", "choose_time"):
+        await _ask_time(chat_id, session, value, repo)
+
+    elif prefix == "back" and state == "choose_time":
+        await _ask_date(chat_id, session)
+
+    elif prefix == "time" and state == "choose_time":
+        session["data"]["time"] = value
+        if await _prefill_known_client(session, username, repo):
+            await _ask_confirmation(chat_id, session)
+        else:
+            await _ask_name(chat_id, session)
+
+    elif prefix == "ok" and state == "confirm":
+        if value == "yes":
+            await _book(chat_id, session, username, repo)
+        else:
+            _reset(session)
+            await telegram_client.send_message(chat_id, "Agendamento cancelado.")
+
+    else:
+        # Botão de uma mensagem antiga: ignorado
+        return
+
+    await save_session(session)
+
+
+# Tipos de update que o bot processa; edições, posts de canal etc. são
+# descartados pelo webhook antes de enfileirar
+UPDATE_KINDS = ("message", "callback_query")
+
+
+def handles(update: dict) -> bool:
+    """Whether the update is of a kind handle_update processes"""
+    return any(kind in update for kind in UPDATE_KINDS)
+
+
+def chat_id_of(update: dict) -> Optional[int]:
+    """Chat of a message/callback update; None for kinds the bot ignores"""
+    if not isinstance(update, dict):
+        return None
+    callback = update.get("callback_query")
+    # Callbacks de modo inline não têm "message"
+    message = callback.get("message") if isinstance(callback, dict) \
+        else update.get("message")
+    chat = message.get("chat") if isinstance(message, dict) else None
+    return chat.get("id") if isinstance(chat, dict) else None
+
+
+async def handle_update(update: dict):
+    if chat_id_of(update) is None:
+        callback = update.get("callback_query") if isinstance(update, dict) else None
+        if isinstance(callback, dict) and callback.get("id"):
+            # Só tira o "carregando" do botão
+            await telegram_client.answer_callback(callback["id"])
+        return
+
+    # Um Repository por update, como um por requisição na API
+    repo = Repository(get_storage())
+    if "callback_query" in update:
+        await _on_callback(update["callback_query"], repo)
+    elif "message" in update:
+        await _on_message(update["message"], repo)
@@ -0,0 +1,113 @@
+"""
+Cliente da Bot API do Telegram: um httpx.AsyncClient compartilhado
+(reaproveita conexões TLS) e helpers de envio.
+
+Só é importado quando o Telegram está habilitado (ver server.py).
+"""
+from fastapi import HTTPException
+import os
+import httpx
+
+import monitoring
+
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+
+TELEGRAM_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
+
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "10"))
+
+_client: httpx.AsyncClient | None = None
+_in_flight = 0
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(
+                max_connections=TELEGRAM_MAX_CONNECTIONS,
+                max_keepalive_connections=TELEGRAM_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+
+def set_client(client: httpx.AsyncClient):
+    """Replace the HTTP client (stubs in benchmarks)"""
+    global _client
+    _client = client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def pool_stats() -> dict:
+    stats = {
+        "open": _client is not None,
+        "max_connections": TELEGRAM_MAX_CONNECTIONS,
+        "in_flight": _in_flight,
+        "connections": 0
+    }
+
+    # httpx não expõe o pool publicamente; lemos do transporte httpcore
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is not None:
+        stats["connections"] = len(connections)
+
+    return stats
+
+
+monitoring.register_pool("telegram", pool_stats)
+
+
+async def call_api(method: str, payload: dict) -> dict:
+    """Call a Bot API method, raising HTTPException on failure"""
+    if not BOT_TOKEN:
+        raise HTTPException(
+            status_code=503,
+            detail="Telegram não configurado"
+        )
+
+    global _in_flight
+    _in_flight += 1
+    try:
+        response = await get_client().post(
+            f"{TELEGRAM_API}/{method}",
+            json=payload
+        )
+    finally:
+        _in_flight -= 1
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=500,
+            detail=response.text
+        )
+
+    return response.json()
+
+
+async def send_message(chat_id: int, text: str, reply_markup: dict | None = None):
+    payload = {
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": "HTML"
+    }
+
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+
+    return await call_api("sendMessage", payload)
+
+
+async def answer_callback(callback_query_id: str, text: str | None = None):
+    payload = {"callback_query_id": callback_query_id}
+    if text:
+        payload["text"] = text
+    return await call_api("answerCallbackQuery", payload)
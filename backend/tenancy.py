@@ -0,0 +1,116 @@
+"""
+Multi-tenant mode: one deployment (and one MongoDB connection pool)
+serving many barbershops.
+
+The shop of each request comes from the X-Shop-Id header or, when
+TENANT_DOMAIN is set, from the host ("<shop>.<TENANT_DOMAIN>"). Requests
+with neither belong to DEFAULT_SHOP_ID, so a single-shop deployment keeps
+working unchanged. Only shops listed in SHOP_IDS are accepted: the header
+is unauthenticated, and every shop gets per-process state (storage,
+caches, locks), so unknown ids are refused before any of it is created.
+
+The shop lives in a ContextVar for the whole request, including event
+handlers and tasks it starts (they copy the context). Storage reads it
+through storage.scoped, which adds `shop_id` to every query. Background
+jobs that span shops set it explicitly with `using(shop_id)`.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import json
+import os
+import re
+
+DEFAULT_SHOP_ID = os.getenv("DEFAULT_SHOP_ID", "default")
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Shop-Id")
+# ex.: "primobarber.app" -> "centro.primobarber.app" é a loja "centro"
+TENANT_DOMAIN = os.getenv("TENANT_DOMAIN", "").lower().strip(".")
+# Lojas aceitas além da padrão (vírgulas); vazia = só DEFAULT_SHOP_ID
+SHOP_IDS = {s.strip() for s in os.getenv("SHOP_IDS", "").split(",") if s.strip()}
+# Quantas lojas os caches por loja (catálogo, bundle público) mantêm (LRU)
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "256"))
+
+SHOP_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]{0,62}$")
+
+_current: ContextVar[Optional[str]] = ContextVar("shop_id", default=None)
+
+
+class TenantError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def current_shop() -> str:
+    """Shop of the running request/job (DEFAULT_SHOP_ID outside of one)"""
+    return _current.get() or DEFAULT_SHOP_ID
+
+
+@contextmanager
+def using(shop_id: str):
+    """Run a block (e.g. a background job step) as `shop_id`"""
+    token = _current.set(shop_id)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def shop_key(*parts) -> str:
+    """Key for process-wide caches/ids shared by every shop"""
+    return ":".join(str(p) for p in (current_shop(), *parts))
+
+
+def _from_host(host: str) -> Optional[str]:
+    host = host.split(":", 1)[0].lower()
+    suffix = "." + TENANT_DOMAIN
+    if TENANT_DOMAIN and host.endswith(suffix):
+        return host[:-len(suffix)] or None
+    return None
+
+
+def resolve(headers: dict) -> str:
+    """Shop id for a request's headers (lower-cased names)"""
+    shop_id = headers.get(TENANT_HEADER.lower()) or _from_host(headers.get("host", ""))
+    if not shop_id:
+        return DEFAULT_SHOP_ID
+
+    shop_id = shop_id.strip().lower()
+    if not SHOP_ID_PATTERN.match(shop_id):
+        raise TenantError(400, "Invalid shop id")
+    if shop_id != DEFAULT_SHOP_ID and shop_id not in SHOP_IDS:
+        raise TenantError(404, "Shop not found")
+    return shop_id
+
+
+class TenantMiddleware:
+    """Resolves the shop of each request and runs the request as that shop"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        try:
+            shop_id = resolve(headers)
+        except TenantError as exc:
+            body = json.dumps({"detail": exc.detail}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": exc.status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        scope.setdefault("state", {})["shop_id"] = shop_id
+        with using(shop_id):
+            await self.app(scope, receive, send)
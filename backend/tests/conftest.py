@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Mesmo esquema dos benchmarks: os módulos ficam na raiz de backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Antes de importar server: os módulos leem o ambiente ao carregar
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("ARCHIVE_ENABLED", "false")
+os.environ.setdefault("TELEGRAM_ENABLED", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+os.environ.setdefault("TELEGRAM_WEBHOOK_SECRET", "test-secret")
+
+
+@pytest.fixture
+def shop(monkeypatch):
+    """A shop of its own: catalog and report caches are per shop and global"""
+    import tenancy
+
+    shop_id = f"test-{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(tenancy, "SHOP_IDS", tenancy.SHOP_IDS | {shop_id})
+    return shop_id
+
+
+@pytest.fixture
+def storage(shop):
+    """MemoryStorage that get_storage() hands out for `shop` (no server)"""
+    from storage import init_storage
+    from storage.memory import MemoryStorage
+
+    storages = defaultdict(MemoryStorage)
+
+    async def shops(collection: str):
+        return list(storages)
+
+    init_storage(storages.__getitem__, shops)
+    return storages[shop]
+
+
+@pytest.fixture
+def telegram():
+    """Telegram Bot API calls made during the test: [(method, payload)]"""
+    calls = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        calls.append((request.url.path.rsplit("/", 1)[-1], json.loads(request.content or b"{}")))
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+    return calls, httpx.AsyncClient(transport=httpx.MockTransport(respond))
+
+
+@pytest.fixture
+def api(shop, telegram):
+    """TestClient on the memory backend, as `shop` (lifespan included)"""
+    from fastapi.testclient import TestClient
+    import server
+    import telegram_client
+
+    with TestClient(server.app, headers={"X-Shop-Id": shop}) as client:
+        # Depois do startup: shutdown fecha o client do Telegram
+        telegram_client.set_client(telegram[1])
+        yield client
@@ -0,0 +1,163 @@
+"""
+The routers end to end on STORAGE_BACKEND=memory, through FastAPI's
+TestClient (the lifespan runs, so storage and startup hooks are real).
+
+Usage (from backend/, needs requirements-dev.txt):
+    python -m pytest tests
+"""
+from datetime import date, timedelta
+
+import pytest
+
+TOMORROW = (date.today() + timedelta(days=1)).isoformat()
+# Antes de qualquer horizonte de arquivo
+LONG_AGO = "2020-03-02"
+
+
+@pytest.fixture
+def catalog(api):
+    """One service and working hours 09:00-12:00 every day: the service id"""
+    for day in range(7):
+        response = api.post("/api/working-hours/", json={
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "12:00", "interval_minutes": 60, "active": True
+        })
+        assert response.status_code == 200
+    response = api.post("/api/services", json={
+        "name": "Corte", "description": "", "price": 50, "duration": "30", "image": ""
+    })
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def book(api, service_id: str, day: str = TOMORROW, time: str = "09:00", **fields):
+    payload = {
+        "client_name": "Ana", "client_phone": "(11) 99999-8888",
+        "service_id": service_id, "date": day, "time": time, **fields
+    }
+    return api.post("/api/appointments", json=payload)
+
+
+def test_services_crud(api):
+    response = api.post("/api/services", json={
+        "name": "Barba", "description": "", "price": 30, "duration": "20", "image": ""
+    })
+    service_id = response.json()["id"]
+
+    assert api.put(f"/api/services/{service_id}", json={"price": 35}).json()["price"] == 35
+    assert [s["name"] for s in api.get("/api/services").json()] == ["Barba"]
+    assert api.delete(f"/api/services/{service_id}").status_code == 200
+    assert api.get(f"/api/services/{service_id}").status_code == 404
+
+
+def test_booking_and_availability(api, catalog):
+    response = book(api, catalog)
+    assert response.status_code == 201
+    appointment = response.json()
+    assert (appointment["price"], appointment["status"]) == (50, "pending")
+
+    # Mesmo horário: conflito
+    assert book(api, catalog).status_code == 400
+    assert book(api, "missing", time="10:00").status_code == 404
+
+    slots = api.get("/api/availability/", params={"date": TOMORROW}).json()
+    assert slots["available_times"] == ["10:00", "11:00"]
+
+    listed = api.get("/api/appointments", params={"date_from": TOMORROW})
+    assert [a["id"] for a in listed.json()] == [appointment["id"]]
+
+    response = api.patch(f"/api/appointments/{appointment['id']}", json={"status": "confirmed"})
+    assert response.json()["status"] == "confirmed"
+    assert api.delete(f"/api/appointments/{appointment['id']}").status_code == 200
+    assert api.get(f"/api/appointments/{appointment['id']}").status_code == 404
+
+
+def test_clients_projection(api, catalog):
+    first = book(api, catalog, client_telegram_username="@Ana_B").json()
+    book(api, catalog, time="10:00", client_phone="11999998888")
+    api.patch(f"/api/appointments/{first['id']}", json={"status": "completed"})
+
+    client = api.get("/api/clients/11 99999-8888").json()
+    assert (client["phone"], client["bookings"], client["visit_count"]) == ("11999998888", 2, 1)
+    assert client["total_spend"] == 50
+    assert client["telegram_username"] == "ana_b"
+
+    assert [c["phone"] for c in api.get("/api/clients/search", params={"q": "an"}).json()] \
+        == [client["phone"]]
+    assert api.get("/api/clients/search", params={"q": "na"}).json() == []
+    assert api.get("/api/clients/telegram/ana_b").json()["phone"] == client["phone"]
+    assert len(api.get(f"/api/clients/{client['phone']}/appointments").json()) == 2
+
+    rebuilt = api.post("/api/clients/rebuild").json()
+    assert rebuilt["clients"] == 1
+    assert api.get("/api/clients/11999998888").json()["bookings"] == 2
+
+
+def test_reports(api, catalog):
+    first = book(api, catalog).json()
+    book(api, catalog, time="10:00")
+    api.patch(f"/api/appointments/{first['id']}", json={"status": "completed"})
+    params = {"date_from": TOMORROW, "date_to": TOMORROW}
+
+    report = api.get("/api/reports/bookings", params={**params, "group_by": "service"}).json()
+    assert report["totals"] == {"bookings": 2, "cancelled": 0, "completed": 1, "revenue": 50}
+    assert report["series"][0]["service_name"] == "Corte"
+
+    occupancy = api.get("/api/reports/occupancy", params={**params, "bucket": "day"})
+    assert occupancy.status_code == 200
+
+
+def test_archive_keeps_old_appointments_readable(api, catalog):
+    old = book(api, catalog, day=LONG_AGO).json()
+    recent = book(api, catalog).json()
+
+    assert api.post("/api/archive/run").json()["moved"] >= 1
+
+    assert api.get(f"/api/appointments/{old['id']}").json()["date"] == LONG_AGO
+    # Sem date_from o arquivo só entra quando pedido
+    assert [a["id"] for a in api.get("/api/appointments").json()] == [recent["id"]]
+    everything = api.get("/api/appointments", params={"include_archive": "true"})
+    assert [a["id"] for a in everything.json()] == [recent["id"], old["id"]]
+    archived = api.get("/api/appointments", params={"date_from": LONG_AGO, "date_to": LONG_AGO})
+    assert [a["id"] for a in archived.json()] == [old["id"]]
+
+
+def test_appointments_pages(api, catalog):
+    for time in ("09:00", "10:00", "11:00"):
+        book(api, catalog, time=time)
+
+    first = api.get("/api/appointments", params={"limit": 2})
+    assert [a["time"] for a in first.json()] == ["11:00", "10:00"]
+    assert 'rel="next"' in first.headers["link"]
+    assert "x-total-count" not in first.headers
+
+    last = api.get("/api/appointments", params={"limit": 2, "offset": 2})
+    assert [a["time"] for a in last.json()] == ["09:00"]
+    assert 'rel="next"' not in last.headers["link"]
+    assert 'rel="prev"' in last.headers["link"]
+
+    counted = api.get("/api/appointments", params={"limit": 2, "count": "true"})
+    assert counted.headers["x-total-count"] == "3"
+
+
+def test_waitlist_endpoints(api, catalog):
+    payload = {
+        "client_name": "Bia", "client_phone": "11988887777", "telegram_chat_id": 42,
+        "service_id": catalog, "date": TOMORROW, "time_from": "10:00"
+    }
+    entry = api.post("/api/waitlist", json=payload)
+    assert entry.status_code == 201
+    assert entry.json()["slots"] == ["10:00", "11:00"]
+    assert api.post("/api/waitlist", json={**payload, "time_from": "13:00"}).status_code == 400
+
+    listed = api.get("/api/waitlist", params={"date": TOMORROW, "status": "waiting"})
+    assert [e["id"] for e in listed.json()] == [entry.json()["id"]]
+
+    assert api.delete(f"/api/waitlist/{entry.json()['id']}").status_code == 200
+    assert api.delete(f"/api/waitlist/{entry.json()['id']}").status_code == 404
+
+
+def test_dashboard_stats(api, catalog):
+    book(api, catalog)
+    stats = api.get("/api/dashboard/stats")
+    assert stats.status_code == 200
@@ -0,0 +1,139 @@
+"""
+Clients projection: counters kept by record_appointment_change on each
+appointment write (memory backend), and the anchored prefix search.
+"""
+import asyncio
+
+import pytest
+
+import tenancy
+from routes.clients import record_appointment_change
+from storage import Repository, get_storage
+
+PHONE = "11999990000"
+
+
+def run_as(shop: str, scenario):
+    async def main():
+        with tenancy.using(shop):
+            await Repository(get_storage()).create_service({
+                "id": "corte", "name": "Corte", "description": "", "price": 50.0,
+                "duration": "30", "image": "", "active": True
+            })
+            return await scenario()
+    return asyncio.run(main())
+
+
+async def stored_client() -> dict:
+    # Repository novo a cada leitura: get_client é memorizado por requisição
+    return await Repository(get_storage()).get_client(PHONE)
+
+
+def appointment(status: str = "pending", **fields) -> dict:
+    return {
+        "id": "a1", "client_name": "Ana", "client_phone": "(11) 99999-0000",
+        "client_telegram_username": "@Ana", "service_id": "corte",
+        "date": "2030-01-07", "time": "09:00", "status": status, "price": 40.0, **fields
+    }
+
+
+def counters(client: dict) -> tuple:
+    """Counters never incremented are absent from the document (as with $inc)"""
+    return tuple(
+        client.get(field, default) for field, default in
+        (("bookings", 0), ("visit_count", 0), ("total_spend", 0.0), ("last_visit", None))
+    )
+
+
+def test_status_changes_move_the_counters(shop, storage):
+    async def scenario():
+        booked = appointment()
+        completed = appointment("completed")
+        cancelled = appointment("cancelled")
+        steps = [(None, booked), (booked, completed), (completed, cancelled)]
+        seen = []
+        for old, new in steps:
+            await record_appointment_change(old, new)
+            seen.append(await stored_client())
+        return seen
+
+    booked, completed, cancelled = run_as(shop, scenario)
+    assert counters(booked) == (1, 0, 0.0, None)
+    assert (booked["name"], booked["telegram_username"]) == ("Ana", "ana")
+    assert booked["favorite_service_id"] == "corte"
+    # Gasto pelo preço gravado no agendamento, não o atual do serviço
+    assert counters(completed) == (1, 1, 40.0, "2030-01-07")
+    # Cancelar devolve exatamente o que a conclusão somou; last_visit fica
+    assert counters(cancelled)[:3] == (0, 0, 0.0)
+    assert cancelled["favorite_service_id"] is None
+
+
+def test_phone_variants_share_one_client(shop, storage):
+    async def scenario():
+        await record_appointment_change(None, appointment())
+        await record_appointment_change(None, appointment(id="a2", client_phone=PHONE))
+        return await stored_client()
+
+    client = run_as(shop, scenario)
+    assert client["bookings"] == 2
+    assert sorted(client["phone_variants"]) == ["(11) 99999-0000", PHONE]
+
+
+@pytest.mark.parametrize("old, new, expected", [
+    # Reserva da lista de espera não é agendamento do cliente
+    (None, appointment("held"), (0, 0, 0.0, None)),
+    (appointment("held"), appointment("confirmed"), (1, 0, 0.0, None)),
+    # Concluído sem preço gravado: preço do serviço
+    (None, appointment("completed", price=None), (1, 1, 50.0, "2030-01-07")),
+])
+def test_unbooked_and_unpriced(shop, storage, old, new, expected):
+    async def scenario():
+        if old:
+            await record_appointment_change(None, old)
+        await record_appointment_change(old, new)
+        return await stored_client()
+
+    assert counters(run_as(shop, scenario)) == expected
+
+
+def test_removing_an_unknown_client_creates_nothing(shop, storage):
+    async def scenario():
+        await record_appointment_change(appointment(), None)
+        return await stored_client()
+
+    assert run_as(shop, scenario) is None
+
+
+def test_search_is_anchored(api):
+    service_id = api.post("/api/services", json={
+        "name": "Corte", "description": "", "price": 50, "duration": "30", "image": ""
+    }).json()["id"]
+    for day in range(7):
+        api.post("/api/working-hours/", json={
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "12:00", "interval_minutes": 60, "active": True
+        })
+    for time, name, phone, username in (
+        ("09:00", "Ana Paula", "(11) 98888-0000", "ana_p"),
+        ("10:00", "Mariana", "11977770000", "mari"),
+        ("11:00", "Anabela", "21966660000", None),
+    ):
+        api.post("/api/appointments", json={
+            "client_name": name, "client_phone": phone, "client_telegram_username": username,
+            "service_id": service_id, "date": "2030-01-07", "time": time
+        })
+
+    def search(q: str, **params):
+        found = api.get("/api/clients/search", params={"q": q, **params}).json()
+        return [c["name"] for c in found]
+
+    # Prefixo do nome, sem diferenciar maiúsculas; "ana" no meio não conta
+    assert search("ANA") == ["Ana Paula", "Anabela"]
+    assert search("ana", limit=1) == ["Ana Paula"]
+    assert search("na") == []
+    # Dígitos buscam pelo telefone normalizado, "@" pelo usuário do Telegram
+    assert search("(11) 9") == ["Mariana", "Ana Paula"]
+    assert search("21 9") == ["Anabela"]
+    assert search("@Mar") == ["Mariana"]
+    assert search("@ana_x") == []
+    assert api.get("/api/clients/search", params={"q": "a"}).status_code == 422
@@ -0,0 +1,143 @@
+"""
+Forecasting: how History.add classifies and drops appointments, the
+seasonal and trend scales (with their fallbacks) and the range checks
+of GET /api/forecast/demand.
+"""
+from datetime import date
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import forecasting
+from forecasting import CANCELLED, COMPLETED, NO_SHOW, SEASON_WEEKS, UPCOMING, History
+
+# Segunda 2030-01-07 a domingo 2030-01-20; hoje é quinta, 2030-01-10
+START, END, TODAY = date(2030, 1, 7), date(2030, 1, 20), date(2030, 1, 10)
+
+
+def appointment(day: str, time: str, status: str) -> dict:
+    return {"date": day, "time": time, "status": status}
+
+
+def test_add_classifies_and_drops():
+    history = History(START, END, TODAY, 60)
+    history.add([
+        appointment("2030-01-07", "09:00", "pending"),     # passado em aberto: no-show
+        appointment("2030-01-08", "10:00", "confirmed"),
+        appointment("2030-01-10", "09:00", "pending"),     # hoje ainda não é no-show
+        appointment("2030-01-14", "09:00", "confirmed"),
+        appointment("2030-01-07", "11:00", "completed"),
+        appointment("2030-01-09", "11:00", "cancelled"),
+        # Fora da contagem: status, datas e horários inválidos, fora do intervalo
+        appointment("2030-01-09", "12:00", "held"),
+        appointment("2030-01-09", "12:00", "whatever"),
+        appointment("2030-02-30", "09:00", "completed"),
+        appointment("not a date", "09:00", "completed"),
+        appointment("2030-01-07", "9:00", "completed"),
+        appointment("2030-01-07", "24:00", "completed"),
+        appointment("2030-01-07", "０９:00", "completed"),
+        appointment("2030-01-07", None, "completed"),
+        appointment("2030-01-06", "09:00", "completed"),
+        appointment("2030-01-21", "09:00", "completed"),
+    ])
+
+    totals = history.counts.sum(axis=(1, 2, 3))
+    assert totals[[COMPLETED, CANCELLED, NO_SHOW, UPCOMING]].tolist() == [1, 1, 2, 2]
+    assert history.rows == 16
+    # [desfecho, semana, dia da semana, slot]
+    assert history.counts[NO_SHOW, 0, 0, 9] == 1
+    assert history.counts[NO_SHOW, 0, 1, 10] == 1
+    assert history.counts[UPCOMING, 0, 3, 9] == 1
+    assert history.counts[UPCOMING, 1, 0, 9] == 1
+
+
+def test_add_accumulates_batches():
+    history = History(START, END, TODAY, 30)
+    for _ in range(3):
+        history.add([appointment("2030-01-07", "09:30", "completed")])
+    assert history.counts[COMPLETED, 0, 0, 19] == 3
+
+
+@pytest.mark.parametrize("weekly, weights, expected", [
+    # Menos de 4 semanas conhecidas: escala neutra
+    ([np.nan, 1, 2], [1, 1, 1], [1, 1]),
+    # Reta 1..8 com centro em 3.5 (4.5): semanas 8 e 9 projetadas em 9 e 10
+    (list(range(1, 9)), [1] * 8, [2, 10 / 4.5]),
+    # Queda: nunca negativa
+    ([4, 3, 2, 1], [1, 1, 1, 1], [0, 0]),
+    # Nível em zero: escala neutra
+    ([3, 2, 1, 0], [0, 0, 0, 1], [1, 1]),
+])
+def test_trend(weekly, weights, expected):
+    targets = np.array([len(weekly), len(weekly) + 1])
+    scale = History._trend(np.array(weekly, dtype=float), np.array(weights, dtype=float), targets)
+    assert scale == pytest.approx(expected)
+
+
+def seasonal(weekly, weights=None, targets=None):
+    weekly = np.array(weekly, dtype=float)
+    weights = np.ones(len(weekly)) if weights is None else np.array(weights, dtype=float)
+    targets = np.arange(len(weekly), len(weekly) + 2) if targets is None else np.array(targets)
+    return History._seasonal(weekly, weights, targets)
+
+
+def test_seasonal():
+    weeks = SEASON_WEEKS + 8
+    assert seasonal([2.0] * weeks) == pytest.approx([1, 1])
+
+    # Semana movimentada no ano passado, suavizada em 3 semanas (8 -> 4):
+    # as semanas-alvo ficam em 4 contra a média 2.25 das semanas do nível
+    busy = [2.0] * weeks
+    busy[8] = 8.0
+    assert seasonal(busy) == pytest.approx([4 / 2.25, 4 / 2.25])
+
+
+@pytest.mark.parametrize("weekly, weights, targets", [
+    # Menos de um ano de histórico
+    ([2.0] * (SEASON_WEEKS + 1), None, None),
+    # Ano passado sem demanda
+    ([0.0] * (SEASON_WEEKS + 8), None, None),
+    # Pesos do nível zerados
+    ([2.0] * (SEASON_WEEKS + 8), [1] * SEASON_WEEKS + [0] * 8, None),
+    # Semana de um ano atrás sem dados (antes do histórico)
+    ([np.nan] * 4 + [2.0] * (SEASON_WEEKS + 4), None, [SEASON_WEEKS, SEASON_WEEKS + 1]),
+])
+def test_seasonal_fallbacks(weekly, weights, targets):
+    assert seasonal(weekly, weights, targets) is None
+
+
+def test_forecast_falls_back_to_trend(monkeypatch):
+    calls = []
+    original = History._trend
+
+    def trend(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(History, "_trend", staticmethod(trend))
+    history = History(START, END, TODAY, 60)
+    history.add([appointment("2030-01-07", "09:00", "completed")])
+    report = history.report([], [], horizon=2, min_demand=0.25)
+
+    # Duas semanas de histórico: sem ano anterior, escala pela tendência (neutra)
+    assert len(calls) == 1
+    assert [w["scale"] for w in report["forecast"]["weeks"]] == [1.0, 1.0]
+
+
+@pytest.mark.parametrize("params, detail", [
+    ({"date_from": "0001-01-05"}, "Date out of range"),
+    ({"date_to": "0001-01-05"}, "Date out of range"),
+    ({"date_from": "2030-02-30"}, "Invalid date format"),
+    ({"date_from": "2030-01-10", "date_to": "2030-01-09"}, "date_from after date_to"),
+])
+def test_demand_rejects_bad_ranges(api, params, detail):
+    response = api.get("/api/forecast/demand", params=params)
+    assert (response.status_code, response.json()["detail"]) == (400, detail)
+
+
+def test_demand(api):
+    params = {"date_from": START.isoformat(), "date_to": END.isoformat()}
+    response = api.get("/api/forecast/demand", params=params)
+    assert response.status_code == 200
+    assert set(response.json()["totals"]) == set(forecasting.OUTCOMES)
@@ -0,0 +1,184 @@
+"""
+idempotency.run on the memory backend: replays, payload mismatch,
+concurrent duplicates, lease takeover and the responses never stored.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+import tenancy
+
+
+def run_as(shop: str, coroutine):
+    async def main():
+        with tenancy.using(shop):
+            return await coroutine
+    return asyncio.run(main())
+
+
+class Handler:
+    """Counts executions; `gate` holds them until set"""
+
+    def __init__(self, *results):
+        self.calls = 0
+        self.results = list(results) or [{"ok": True}]
+        self.gate = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        result = self.results[min(self.calls, len(self.results)) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_replay_returns_the_stored_response(shop, storage):
+    handler = Handler({"id": "a1"})
+
+    async def scenario():
+        first = await idempotency.run("test", "k", {"n": 1}, handler, status_code=201)
+        again = await idempotency.run("test", "k", {"n": 1}, handler, status_code=201)
+        # Sem o LRU (outro worker): a resposta vem do storage
+        idempotency._cache.clear()
+        stored = await idempotency.run("test", "k", {"n": 1}, handler, status_code=201)
+        return first, again, stored
+
+    first, again, stored = run_as(shop, scenario())
+    assert handler.calls == 1
+    assert first.status_code == again.status_code == stored.status_code == 201
+    assert first.body == again.body == stored.body
+    assert "idempotent-replayed" not in first.headers
+    assert again.headers["idempotent-replayed"] == stored.headers["idempotent-replayed"] == "true"
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_different_payload_is_rejected(shop, storage, cached):
+    handler = Handler()
+
+    async def scenario():
+        await idempotency.run("test", "k", {"n": 1}, handler)
+        if not cached:
+            idempotency._cache.clear()
+        await idempotency.run("test", "k", {"n": 2}, handler)
+
+    with pytest.raises(HTTPException) as error:
+        run_as(shop, scenario())
+    assert error.value.status_code == 422
+    assert handler.calls == 1
+
+
+def test_concurrent_duplicates_share_one_execution(shop, storage):
+    handler = Handler({"id": "a1"})
+
+    async def scenario():
+        handler.gate = asyncio.Event()
+        requests = [
+            asyncio.create_task(idempotency.run("test", "k", {"n": 1}, handler))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        handler.gate.set()
+        return await asyncio.gather(*requests)
+
+    responses = run_as(shop, scenario())
+    assert handler.calls == 1
+    assert len({r.body for r in responses}) == 1
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 4
+
+
+def test_waits_for_a_pending_key_of_another_worker(shop, storage, monkeypatch):
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL", 0.01)
+    handler = Handler()
+
+    async def scenario():
+        key = tenancy.shop_key("test", "k")
+        fp = idempotency.fingerprint({"n": 1})
+        await storage.insert_idempotency_key(key, fp, "other", idempotency._lease_until())
+        waiting = asyncio.create_task(idempotency.run("test", "k", {"n": 1}, handler))
+        await asyncio.sleep(0.05)
+        await storage.complete_idempotency_key(key, "other", 201, {"id": "theirs"})
+        return await waiting
+
+    response = run_as(shop, scenario())
+    assert handler.calls == 0
+    assert (response.status_code, response.body) == (201, b'{"id":"theirs"}')
+
+
+def test_expired_lease_is_taken_over(shop, storage):
+    handler = Handler({"id": "mine"})
+
+    async def scenario():
+        key = tenancy.shop_key("test", "k")
+        fp = idempotency.fingerprint({"n": 1})
+        expired = datetime.utcnow() - timedelta(seconds=1)
+        await storage.insert_idempotency_key(key, fp, "dead", expired)
+        response = await idempotency.run("test", "k", {"n": 1}, handler)
+        # O dono antigo volta tarde: não sobrescreve nem libera a chave
+        await idempotency._store(key, fp, "dead", (500, {"detail": "late"}))
+        await idempotency._release(key, "dead")
+        return response, await storage.get_idempotency_key(key)
+
+    response, record = run_as(shop, scenario())
+    assert handler.calls == 1
+    assert response.status_code == 200
+    assert (record["state"], record["body"]) == ("completed", {"id": "mine"})
+    assert record["owner"] != "dead"
+
+
+@pytest.mark.parametrize("status_code", [409, 429, 500, 503])
+def test_transient_errors_are_not_stored(shop, storage, status_code):
+    handler = Handler(HTTPException(status_code, "try again"), {"id": "a1"})
+
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            await idempotency.run("test", "k", {"n": 1}, handler)
+        assert error.value.status_code == status_code
+        record = await storage.get_idempotency_key(tenancy.shop_key("test", "k"))
+        retry = await idempotency.run("test", "k", {"n": 1}, handler)
+        return record, retry
+
+    record, retry = run_as(shop, scenario())
+    assert record is None
+    assert handler.calls == 2
+    assert retry.status_code == 200 and "idempotent-replayed" not in retry.headers
+
+
+def test_waiters_run_again_after_a_transient_error(shop, storage):
+    handler = Handler(HTTPException(503, "down"), {"id": "a1"})
+
+    async def call():
+        try:
+            return (await idempotency.run("test", "k", {"n": 1}, handler)).status_code
+        except HTTPException as exc:
+            return exc.status_code
+
+    async def scenario():
+        handler.gate = asyncio.Event()
+        requests = [asyncio.create_task(call()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        handler.gate.set()
+        return await asyncio.gather(*requests)
+
+    statuses = run_as(shop, scenario())
+    # Só a primeira recebe o 503; a segunda executa de novo, a terceira reaproveita
+    assert sorted(statuses) == [200, 200, 503]
+    assert handler.calls == 2
+
+
+def test_stored_client_errors_replay(shop, storage):
+    handler = Handler(HTTPException(400, "Time slot already booked"))
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await idempotency.run("test", "k", {"n": 1}, handler)
+        return await idempotency.run("test", "k", {"n": 1}, handler)
+
+    replay = run_as(shop, scenario())
+    # 4xx (exceto 409/429) é gravado: a repetição recebe a mesma resposta
+    assert handler.calls == 1
+    assert (replay.status_code, replay.headers["idempotent-replayed"]) == (400, "true")
@@ -0,0 +1,136 @@
+"""
+Admission control: the per-phone booking limit (charged only for
+bookings that go through, per shop) and the client IP behind
+TRUSTED_PROXIES.
+"""
+import asyncio
+import ipaddress
+from datetime import date, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import ratelimit
+import tenancy
+
+TOMORROW = (date.today() + timedelta(days=1)).isoformat()
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Rate limiting on, with empty buckets"""
+    monkeypatch.setattr(ratelimit, "ENABLED", True)
+    monkeypatch.setattr(ratelimit, "memory_store", ratelimit.MemoryBucketStore())
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.ConcurrencyLimiter(
+        ratelimit.MAX_CONCURRENT, ratelimit.MAX_QUEUE, ratelimit.QUEUE_TIMEOUT
+    ))
+
+
+def test_refused_bookings_do_not_use_the_phone_quota(api, limits):
+    for day in range(7):
+        api.post("/api/working-hours/", json={
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "13:00", "interval_minutes": 60, "active": True
+        })
+    service_id = api.post("/api/services", json={
+        "name": "Corte", "description": "", "price": 50, "duration": "30", "image": ""
+    }).json()["id"]
+
+    def book(day: str, time: str):
+        return api.post("/api/appointments", json={
+            "client_name": "Ana", "client_phone": "(11) 99999-0000",
+            "service_id": service_id, "date": day, "time": time
+        }).status_code
+
+    # Erros do cliente (data inválida) não gastam tokens
+    assert [book("25/12/2030", "09:00") for _ in range(3)] == [400] * 3
+    assert book(TOMORROW, "09:00") == 201
+    # Horário ocupado também não
+    assert book(TOMORROW, "09:00") == 400
+    assert [book(TOMORROW, time) for time in ("10:00", "11:00")] == [201, 201]
+    assert book(TOMORROW, "12:00") == 429
+
+
+def test_phone_quota_is_per_shop(limits):
+    async def book(shop: str):
+        with tenancy.using(shop):
+            async with ratelimit.phone_quota("11 99999-0000"):
+                pass
+
+    async def scenario():
+        for _ in range(ratelimit.BOOKING_PHONE.burst):
+            await book("shop-a")
+        with pytest.raises(HTTPException) as error:
+            await book("shop-a")
+        assert error.value.status_code == 429
+        # Mesmo telefone em outra loja: balde próprio
+        await book("shop-b")
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("status_code, refunded", [(400, True), (409, True), (500, False)])
+def test_phone_quota_refunds_client_errors(limits, status_code, refunded):
+    async def scenario():
+        with pytest.raises(HTTPException):
+            async with ratelimit.phone_quota("11999990000"):
+                raise HTTPException(status_code=status_code)
+        left = 0
+        while True:
+            try:
+                async with ratelimit.phone_quota("11999990000"):
+                    left += 1
+            except HTTPException:
+                return left
+
+    burst = ratelimit.BOOKING_PHONE.burst
+    assert asyncio.run(scenario()) == (burst if refunded else burst - 1)
+
+
+# --------------------------------------------------
+# client_ip
+# --------------------------------------------------
+def scope(peer: str, **headers) -> dict:
+    return {
+        "client": (peer, 12345),
+        "headers": [
+            (name.replace("_", "-").lower().encode(), value.encode())
+            for name, value in headers.items()
+        ]
+    }
+
+
+@pytest.fixture
+def proxies(monkeypatch):
+    monkeypatch.setattr(ratelimit, "TRUSTED_PROXIES", [
+        ipaddress.ip_network("10.0.0.0/8"),
+        ipaddress.ip_network("fdaa::/16"),
+    ])
+
+
+def test_forwarding_headers_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(ratelimit, "TRUSTED_PROXIES", [])
+    assert ratelimit.client_ip(scope("10.0.0.1", x_forwarded_for="1.2.3.4")) == "10.0.0.1"
+
+
+@pytest.mark.parametrize("peer, headers, expected", [
+    # Peer que não é proxy: cabeçalhos forjáveis são ignorados
+    ("203.0.113.9", {"x_forwarded_for": "1.2.3.4"}, "203.0.113.9"),
+    ("203.0.113.9", {"fly_client_ip": "1.2.3.4"}, "203.0.113.9"),
+    # Hop mais à direita que não é proxy; o que o cliente pôs à esquerda não conta
+    ("10.0.0.1", {"x_forwarded_for": "6.6.6.6, 1.2.3.4"}, "1.2.3.4"),
+    ("10.0.0.1", {"x_forwarded_for": "1.2.3.4, 10.0.0.7"}, "1.2.3.4"),
+    ("fdaa::1", {"x_forwarded_for": "2001:db8::5"}, "2001:db8::5"),
+    # Só proxies na cadeia: o primeiro hop
+    ("10.0.0.1", {"x_forwarded_for": "10.0.0.8, 10.0.0.7"}, "10.0.0.8"),
+    # Sem cabeçalho (ou vazio): o próprio peer
+    ("10.0.0.1", {}, "10.0.0.1"),
+    ("10.0.0.1", {"x_forwarded_for": " , "}, "10.0.0.1"),
+    ("10.0.0.1", {"fly_client_ip": "1.2.3.4", "x_forwarded_for": "6.6.6.6"}, "1.2.3.4"),
+])
+def test_client_ip_behind_trusted_proxies(proxies, peer, headers, expected):
+    assert ratelimit.client_ip(scope(peer, **headers)) == expected
+
+
+def test_client_ip_without_peer(proxies):
+    assert ratelimit.client_ip({"headers": [(b"x-forwarded-for", b"1.2.3.4")]}) == "unknown"
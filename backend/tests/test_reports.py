@@ -0,0 +1,117 @@
+"""
+Reports: bucket boundaries ($dateTrunc on MongoDB, storage.buckets on
+memory) and revenue taken from the price stored on each appointment.
+"""
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+import tenancy
+from storage import Repository, get_storage
+from storage.buckets import truncate
+from storage.memory import MemoryStorage
+from storage.mongo import MongoStorage
+
+# 2029-12-30 é domingo; 2029-12-31 e 2030-01-07 são segundas
+DAYS = ("2029-12-30", "2029-12-31", "2030-01-06", "2030-01-07")
+
+
+@pytest.mark.parametrize("day, bucket, expected", [
+    ("2029-12-30", "week", "2029-12-24"),
+    ("2029-12-31", "week", "2029-12-31"),
+    ("2030-01-06", "week", "2029-12-31"),
+    ("2030-01-06", "month", "2030-01-01"),
+    ("2029-12-31", "month", "2029-12-01"),
+    ("2030-01-06", "day", "2030-01-06"),
+])
+def test_truncate(day, bucket, expected):
+    assert truncate(date.fromisoformat(day), bucket).isoformat() == expected
+
+
+@pytest.mark.parametrize("bucket, expected", [
+    ("week", {"2029-12-24": 1, "2029-12-31": 2, "2030-01-07": 1}),
+    ("month", {"2029-12-01": 2, "2030-01-01": 2}),
+])
+def test_memory_counts_per_bucket(bucket, expected):
+    async def scenario():
+        repo = Repository(MemoryStorage(), shop_id="reports")
+        for index, day in enumerate(DAYS):
+            await repo.create_appointment({
+                "id": f"a{index}", "client_name": "Ana", "client_phone": "11999990000",
+                "service_id": "corte", "date": day, "time": "09:00",
+                "status": "completed", "source": "web", "price": 10.0 * (index + 1)
+            })
+        return await repo.appointment_counts(DAYS[0], DAYS[-1], bucket)
+
+    rows = asyncio.run(scenario())
+    assert {r["bucket"]: r["count"] for r in rows} == expected
+    assert sum(r["revenue"] for r in rows) == 100.0
+
+
+class _Aggregation:
+    """Stands in for a Motor collection: keeps the pipeline, returns `rows`"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return self
+
+    async def to_list(self, length):
+        return self.rows
+
+
+def test_mongo_counts_truncate_weeks_on_monday():
+    # mongomock não implementa $dateTrunc: confere o pipeline e a conversão
+    appointments = _Aggregation([{
+        "_id": {"bucket": datetime(2029, 12, 31), "service_id": "corte", "status": "completed"},
+        "count": 2, "revenue": 30, "unpriced": 0
+    }])
+    db = type("Db", (), {"appointments": appointments})()
+
+    rows = asyncio.run(MongoStorage(db).appointment_counts(DAYS[1], DAYS[2], "week"))
+
+    [pipeline] = appointments.pipelines
+    truncated = pipeline[-1]["$group"]["_id"]["bucket"]["$dateTrunc"]
+    assert (truncated["unit"], truncated["startOfWeek"]) == ("week", "monday")
+    assert rows == [{
+        "bucket": "2029-12-31", "service_id": "corte", "source": None,
+        "status": "completed", "count": 2, "revenue": 30.0, "unpriced": 0
+    }]
+
+
+def test_revenue_uses_the_stored_price(api, shop):
+    service_id = api.post("/api/services", json={
+        "name": "Corte", "description": "", "price": 50, "duration": "30", "image": ""
+    }).json()["id"]
+    for day in range(7):
+        api.post("/api/working-hours/", json={
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "12:00", "interval_minutes": 60, "active": True
+        })
+    booked = api.post("/api/appointments", json={
+        "client_name": "Ana", "client_phone": "11999990000",
+        "service_id": service_id, "date": DAYS[1], "time": "09:00"
+    }).json()
+    api.patch(f"/api/appointments/{booked['id']}", json={"status": "completed"})
+
+    # Concluído antes de os agendamentos gravarem o preço
+    async def unpriced():
+        with tenancy.using(shop):
+            await Repository(get_storage()).create_appointment({
+                "id": "legacy", "client_name": "Bia", "client_phone": "11988880000",
+                "service_id": service_id, "date": DAYS[2], "time": "10:00",
+                "status": "completed", "source": "web"
+            })
+    asyncio.run(unpriced())
+
+    # Aumento depois da conclusão: só muda o que não tinha preço gravado
+    api.put(f"/api/services/{service_id}", json={"price": 80})
+    params = {"date_from": DAYS[0], "date_to": DAYS[-1], "bucket": "week"}
+    report = api.get("/api/reports/bookings", params=params).json()
+
+    assert [(s["bucket"], s["revenue"]) for s in report["series"]] == [("2029-12-31", 130.0)]
+    assert report["totals"]["revenue"] == 130.0
@@ -0,0 +1,111 @@
+"""
+Recurring appointments: expand_recurrence (month and year ends, the
+MAX_OCCURRENCES cap) and POST /api/appointments/series, which books the
+free occurrences and refuses only when none of them can be booked.
+"""
+import pytest
+from fastapi import HTTPException
+
+from models import RecurrenceRule
+from routes.appointments import MAX_OCCURRENCES, expand_recurrence
+
+# Quintas-feiras (day_of_week 3)
+THURSDAYS = ("2030-01-03", "2030-01-10", "2030-01-17", "2030-01-24")
+
+
+@pytest.mark.parametrize("start, rule, expected", [
+    # Virada de mês e de ano; until é inclusivo
+    ("2030-01-31", {"freq": "weekly", "count": 3}, ["2030-01-31", "2030-02-07", "2030-02-14"]),
+    ("2030-01-31", {"freq": "biweekly", "until": "2030-02-28"}, ["2030-01-31", "2030-02-14", "2030-02-28"]),
+    ("2029-12-24", {"freq": "weekly", "until": "2030-01-06"}, ["2029-12-24", "2029-12-31"]),
+    ("2032-02-22", {"freq": "weekly", "count": 2}, ["2032-02-22", "2032-02-29"]),
+])
+def test_expand_recurrence(start, rule, expected):
+    assert expand_recurrence(start, RecurrenceRule(**rule)) == expected
+
+
+def test_expand_recurrence_caps_occurrences():
+    weekly = expand_recurrence("2030-01-03", RecurrenceRule(freq="weekly", count=MAX_OCCURRENCES))
+    assert len(weekly) == MAX_OCCURRENCES
+
+    # count enorme não itera além do limite
+    for rule in ({"count": MAX_OCCURRENCES + 1}, {"count": 10 ** 9}, {"until": "2099-12-31"}):
+        with pytest.raises(HTTPException) as error:
+            expand_recurrence("2030-01-03", RecurrenceRule(freq="weekly", **rule))
+        assert error.value.status_code == 400
+        assert str(MAX_OCCURRENCES) in error.value.detail
+
+
+@pytest.mark.parametrize("start, rule", [
+    # until e count: exatamente um dos dois
+    ("2030-01-03", {"freq": "weekly"}),
+    ("2030-01-03", {"freq": "weekly", "count": 2, "until": "2030-02-01"}),
+    # until antes do início: nenhuma ocorrência
+    ("2030-01-03", {"freq": "weekly", "until": "2030-01-02"}),
+    # Data inválida e estouro do calendário
+    ("2030-02-30", {"freq": "weekly", "count": 2}),
+    ("9999-12-20", {"freq": "weekly", "count": 3}),
+])
+def test_expand_recurrence_refuses(start, rule):
+    with pytest.raises(HTTPException) as error:
+        expand_recurrence(start, RecurrenceRule(**rule))
+    assert error.value.status_code == 400
+
+
+def setup_week(api, days=range(7)) -> str:
+    for day in days:
+        api.post("/api/working-hours/", json={
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "12:00", "interval_minutes": 60, "active": True
+        })
+    return api.post("/api/services", json={
+        "name": "Corte", "description": "", "price": 50, "duration": "30", "image": ""
+    }).json()["id"]
+
+
+def series(api, service_id: str, **recurrence):
+    return api.post("/api/appointments/series", json={
+        "client_name": "Ana", "client_phone": "11999990000", "service_id": service_id,
+        "date": THURSDAYS[0], "time": "09:00",
+        "recurrence": {"freq": "weekly", "count": len(THURSDAYS), **recurrence}
+    })
+
+
+def booked(api) -> list:
+    listed = api.get("/api/appointments", params={"date_from": THURSDAYS[0]}).json()
+    return sorted(a["date"] for a in listed)
+
+
+def test_series_books_around_conflicts(api):
+    service_id = setup_week(api)
+    api.post("/api/appointments", json={
+        "client_name": "Bia", "client_phone": "11988880000", "service_id": service_id,
+        "date": THURSDAYS[1], "time": "09:00"
+    })
+    api.post("/api/blocked-dates/", json={"date": THURSDAYS[2]})
+
+    response = series(api, service_id)
+
+    assert response.status_code == 201
+    result = response.json()
+    assert [a["date"] for a in result["created"]] == [THURSDAYS[0], THURSDAYS[3]]
+    assert {a["series_id"] for a in result["created"]} == {result["series_id"]}
+    assert result["conflicts"] == [
+        {"date": THURSDAYS[1], "reason": "Time slot already booked"},
+        {"date": THURSDAYS[2], "reason": "This date is blocked"},
+    ]
+    # Bia no dia 10, a série nos dias 3 e 24; nada no dia bloqueado
+    assert booked(api) == [THURSDAYS[0], THURSDAYS[1], THURSDAYS[3]]
+
+
+def test_series_without_any_free_occurrence_books_nothing(api):
+    # Sem expediente às quintas
+    service_id = setup_week(api, days=(0, 1, 2, 4, 5, 6))
+
+    response = series(api, service_id)
+
+    assert response.status_code == 409
+    conflicts = response.json()["detail"]["conflicts"]
+    assert [c["date"] for c in conflicts] == list(THURSDAYS)
+    assert {c["reason"] for c in conflicts} == {"No working hours for this day"}
+    assert booked(api) == []
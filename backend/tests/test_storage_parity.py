@@ -0,0 +1,249 @@
+"""
+The same Repository calls against MemoryStorage and MongoStorage (on
+mongomock-motor) must return the same documents and raise the same errors.
+
+Usage (from backend/, needs requirements-dev.txt):
+    python -m pytest tests
+"""
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from storage.memory import MemoryStorage
+from storage.mongo import MongoStorage
+from storage.repository import Repository
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture(autouse=True)
+def _projected_find_one_and_update(monkeypatch):
+    """
+    mongomock re-reads the AFTER document with the original filter when
+    there is a projection: an update that changes a filtered field
+    (waitlist claims set status) comes back as None or as another document.
+    Project on our side instead, as the server does.
+    """
+    import mongomock
+
+    original = mongomock.collection.Collection.find_one_and_update
+
+    def find_one_and_update(self, filter, update, projection=None, *args, **kwargs):
+        doc = original(self, filter, update, None, *args, **kwargs)
+        if doc is not None and projection == {"_id": 0}:
+            doc.pop("_id", None)
+        return doc
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one_and_update", find_one_and_update)
+
+
+async def _repositories():
+    mongo = MongoStorage(mongomock_motor.AsyncMongoMockClient()["parity"])
+    await mongo.ensure_indexes()
+    # Loja própria por teste: o cache de catálogo é por loja e global
+    suffix = uuid.uuid4().hex[:8]
+    return {
+        "memory": Repository(MemoryStorage(), shop_id=f"memory-{suffix}"),
+        "mongo": Repository(mongo, shop_id=f"mongo-{suffix}"),
+    }
+
+
+def _plain(value):
+    """Comparable value: no _id / timestamps, lists of documents sorted"""
+    # (a ordem entre empates de data/hora não é definida em nenhum dos dois)
+    if isinstance(value, dict):
+        return {
+            k: _plain(v) for k, v in value.items()
+            if k not in ("_id", "created_at", "updated_at")
+        }
+    if isinstance(value, list):
+        items = [_plain(v) for v in value]
+        if all(isinstance(v, dict) for v in items):
+            return sorted(items, key=lambda doc: repr(sorted(doc.items())))
+        return items
+    return value
+
+
+def run_both(scenario):
+    """Run `scenario(repo)` on both backends and return their transcripts"""
+    async def main():
+        results = {}
+        for name, repo in (await _repositories()).items():
+            transcript = []
+            await scenario(repo, transcript.append)
+            results[name] = [_plain(entry) for entry in transcript]
+        return results
+
+    results = asyncio.run(main())
+    assert results["memory"] == results["mongo"]
+    return results["memory"]
+
+
+def service(service_id: str, price: float = 50.0) -> dict:
+    return {
+        "id": service_id, "name": service_id, "description": "",
+        "price": price, "duration": "30 min", "image": "", "active": True
+    }
+
+
+def appointment(appointment_id: str, date: str, time: str, status: str = "pending") -> dict:
+    return {
+        "id": appointment_id, "client_name": "Cliente", "client_phone": "11999990000",
+        "client_telegram_username": "cliente", "service_id": "corte",
+        "date": date, "time": time, "status": status, "source": "web"
+    }
+
+
+def test_duplicate_service_id_raises():
+    async def scenario(repo, record):
+        await repo.create_service(service("corte"))
+        with pytest.raises(DuplicateKeyError):
+            await repo.create_service(service("corte", price=99.0))
+        record(await repo.list_services())
+
+    [services] = run_both(scenario)
+    assert [s["price"] for s in services] == [50.0]
+
+
+def test_duplicate_setting_key_raises():
+    async def scenario(repo, record):
+        await repo.create_setting({"key": "shop_name", "value": "Primo"})
+        with pytest.raises(DuplicateKeyError):
+            await repo.create_setting({"key": "shop_name", "value": "Outro"})
+        record(await repo.get_setting("shop_name"))
+
+    [setting] = run_both(scenario)
+    assert setting["value"] == "Primo"
+
+
+def test_duplicate_appointment_ids():
+    async def scenario(repo, record):
+        await repo.create_appointment(appointment("a1", "2030-01-07", "09:00"))
+        with pytest.raises(DuplicateKeyError):
+            await repo.create_appointment(appointment("a1", "2030-01-07", "10:00"))
+        # Lote ordenado: para no duplicado, os anteriores ficam gravados
+        with pytest.raises(BulkWriteError) as error:
+            await repo.create_appointments([
+                appointment("a2", "2030-01-08", "09:00"),
+                appointment("a1", "2030-01-08", "10:00"),
+                appointment("a3", "2030-01-08", "11:00"),
+            ])
+        record(error.value.details["nInserted"])
+        record(await repo.find_appointments())
+
+    inserted, appointments = run_both(scenario)
+    assert inserted == 1
+    assert sorted(a["id"] for a in appointments) == ["a1", "a2"]
+
+
+def test_appointment_queries():
+    async def scenario(repo, record):
+        await repo.create_appointments([
+            appointment("a1", "2030-01-07", "09:00", "confirmed"),
+            appointment("a2", "2030-01-07", "10:00", "cancelled"),
+            appointment("a3", "2030-01-08", "09:00", "completed"),
+            appointment("a4", "2030-01-09", "11:00"),
+        ])
+        record(await repo.create_appointment_if_free(appointment("a5", "2030-01-07", "09:00")))
+        record(await repo.create_appointment_if_free(appointment("a6", "2030-01-07", "10:00")))
+        record(await repo.booked_times("2030-01-07"))
+        record(await repo.find_conflict("2030-01-08", "09:00"))
+        record(await repo.find_appointments(date_from="2030-01-07", date_to="2030-01-08"))
+        record(await repo.find_appointments(status="completed"))
+        record(await repo.count_appointments(status="pending"))
+        record(await repo.count_appointments(client_phones=["11999990000"]))
+        record(await repo.update_appointment("a4", {"status": "confirmed"}, only_if_status="held"))
+        record(await repo.update_appointment("a4", {"status": "confirmed"}, only_if_status="pending"))
+        record(await repo.delete_appointment("a2"))
+        # find_client_by_telegram fica de fora: no Mongo lê a projeção
+        # `clients`, mantida por routes.clients e não pelo storage
+
+    transcript = run_both(scenario)
+    assert transcript[:2] == [False, True]
+
+
+def test_archive_batch():
+    async def scenario(repo, record):
+        await repo.create_appointments([
+            appointment("a1", "2020-01-06", "09:00"),
+            appointment("a2", "2020-01-07", "09:00", "cancelled"),
+            appointment("a3", "2030-01-07", "09:00"),
+        ])
+        record(await repo.archive_batch("2021-01-01", 1))
+        record(await repo.archive_batch("2021-01-01", 10))
+        record(await repo.archive_batch("2021-01-01", 10))
+        record(await repo.get_appointment("a1"))
+        record(await repo.find_appointments(date_from="2020-01-01", date_to="2020-12-31"))
+        record(await repo.find_appointments())
+        record(await repo.count_appointments())
+        record(await repo.count_appointments(include_archive=True))
+        record(await repo.count_appointments(include_archive=True, limit=1))
+
+    transcript = run_both(scenario)
+    assert transcript[:3] == [(1, 1), (1, 1), (0, 0)]
+    # Sem date_from, o arquivo só entra com include_archive
+    assert [a["id"] for a in transcript[5]] == ["a3"]
+    assert transcript[6:] == [1, 3, 2]
+
+
+def test_clients():
+    async def scenario(repo, record):
+        record(await repo.update_client_counters(
+            "11999990000", "(11) 99999-0000", {"bookings": 1, "service_counts.corte": 1},
+            {"name": "Ana", "name_lower": "ana", "telegram_username": "ana"},
+            last_visit="2030-01-07"
+        ))
+        record(await repo.update_client_counters(
+            "11999990000", "11999990000", {"bookings": 1, "service_counts.corte": 1},
+            {"name": "Ana", "name_lower": "ana", "telegram_username": "ana_b"},
+            last_visit="2030-01-01"
+        ))
+        record(await repo.update_client_counters("11888880000", "11888880000", {}, {}, upsert=False))
+        await repo.upsert_clients([
+            {"phone": "11777770000", "name": "Anabela", "name_lower": "anabela",
+             "telegram_username": None, "bookings": 0}
+        ])
+        record(await repo.search_clients("name_lower", "ana", 10))
+        record(await repo.search_clients("name_lower", "na", 10))
+        record(await repo.search_clients("phone", "117", 10))
+        record(await repo.get_client_by_telegram("ana"))
+        record(await repo.find_client_by_telegram("ana_b"))
+
+    transcript = run_both(scenario)
+    first, second, missing = transcript[:3]
+    assert second["bookings"] == 2 and second["service_counts"] == {"corte": 2}
+    assert second["last_visit"] == "2030-01-07"
+    assert missing is None
+    assert sorted(c["phone"] for c in transcript[3]) == ["11777770000", "11999990000"]
+    assert transcript[4] == []
+
+
+def test_waitlist_claim_order():
+    async def scenario(repo, record):
+        for index, slots in enumerate((["10:00"], ["09:00", "10:00"], ["10:00"])):
+            await repo.create_waitlist_entry({
+                "id": f"w{index}", "date": "2030-01-07", "slots": slots,
+                "status": "waiting", "telegram_chat_id": index,
+                "created_at": datetime(2030, 1, 1, 0, index)
+            })
+        fields = {"status": "offered", "offer_expires_at": datetime(2030, 1, 1, 1)}
+        record(await repo.claim_waitlist_entry("2030-01-07", "09:00", fields))
+        record(await repo.claim_waitlist_entry("2030-01-07", "10:00", fields))
+        record(await repo.count_waitlist("2030-01-07", "waiting"))
+        record(await repo.close_waitlist_offer("w0", 0, datetime(2030, 1, 1, 0, 30), "declined"))
+        record(await repo.expire_waitlist_offer(datetime(2030, 1, 1, 2)))
+        record(await repo.update_waitlist_entry("w2", {"status": "cancelled"}, ["offered"]))
+        record(await repo.expire_past_waitlist("2030-01-08", datetime(2030, 1, 8)))
+        record([e async for e in repo.iter_waitlist()])
+
+    transcript = run_both(scenario)
+    assert transcript[0]["id"] == "w1" and transcript[1]["id"] == "w0"
+    assert transcript[2] == 1
+    assert transcript[3]["status"] == "offered"
+    assert transcript[4]["id"] == "w1"
+    assert transcript[5] is None
+    assert transcript[6] == 1
+    assert [e["status"] for e in transcript[7]] == ["declined", "expired", "expired"]
@@ -0,0 +1,70 @@
+"""
+Telegram webhook: updates are acknowledged at once, deduplicated by
+update_id and handed to the workers; kinds the bot does not handle
+(edited messages, channel posts...) never reach the queue or the dedup.
+"""
+import time
+
+import pytest
+
+import telegram_bot
+from routes import telegram as webhook
+
+SECRET = {"X-Telegram-Bot-Api-Secret-Token": "test-secret"}
+
+
+def message(update_id: int, text: str = "/cancelar", kind: str = "message") -> dict:
+    return {"update_id": update_id, kind: {"chat": {"id": 42}, "text": text}}
+
+
+def processed(count: int):
+    """Wait for the workers (they run on the TestClient's event loop)"""
+    deadline = time.monotonic() + 5
+    while webhook.queue_stats()["processed"] < count:
+        assert time.monotonic() < deadline, "update not processed"
+        time.sleep(0.01)
+
+
+def stored_updates(shop: str) -> set:
+    """update_ids recorded in telegram_updates (no storage yet: none)"""
+    from storage import repository
+    storage = repository._storages.get(shop)
+    return storage.telegram_updates if storage else set()
+
+
+def test_webhook_requires_the_secret(api):
+    assert api.post("/api/telegram/webhook", json=message(1)).status_code == 401
+    response = api.post("/api/telegram/webhook", json=message(1), headers={
+        "X-Telegram-Bot-Api-Secret-Token": "wrong"
+    })
+    assert response.status_code == 401
+
+
+def test_messages_are_processed_once(api, shop, telegram):
+    before = webhook.queue_stats()
+    for _ in range(2):
+        response = api.post("/api/telegram/webhook", json=message(7), headers=SECRET)
+        assert response.json() == {"ok": True}
+    processed(before["processed"] + 1)
+
+    stats = webhook.queue_stats()
+    assert stats["received"] - before["received"] == 2
+    assert stats["duplicates"] - before["duplicates"] == 1
+    assert 7 in stored_updates(shop)
+    assert [m for m, _ in telegram[0]] == ["sendMessage"]
+
+
+@pytest.mark.parametrize("kind", ["edited_message", "channel_post"])
+def test_other_kinds_are_dropped_before_the_queue(api, shop, telegram, kind):
+    before = webhook.queue_stats()
+
+    response = api.post("/api/telegram/webhook", json=message(8, kind=kind), headers=SECRET)
+
+    assert response.json() == {"ok": True}
+    stats = webhook.queue_stats()
+    assert stats["ignored"] - before["ignored"] == 1
+    assert stats["received"] == before["received"]
+    assert webhook._seen_updates.get(8) is None
+    assert 8 not in stored_updates(shop)
+    assert telegram_bot.chat_id_of(message(8, kind=kind)) is None
+    assert telegram[0] == []
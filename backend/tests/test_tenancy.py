@@ -0,0 +1,195 @@
+"""
+Shop isolation: ScopedDatabase (on mongomock-motor) must only ever
+read and write the current shop's documents, and the API must refuse
+shops it doesn't know.
+"""
+import asyncio
+
+import pytest
+from pymongo import DeleteMany, InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+
+import tenancy
+from storage.scoped import ScopedCollection, ScopedDatabase
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+SHOPS = ("shop-a", "shop-b")
+
+
+def run(scenario):
+    """`scenario(db, as_shop)` on a fresh database; as_shop(shop, coroutine function)"""
+    async def as_shop(shop, call):
+        with tenancy.using(shop):
+            return await call()
+
+    async def main():
+        raw = mongomock_motor.AsyncMongoMockClient()["tenancy"]
+        return await scenario(ScopedDatabase(raw), as_shop)
+
+    return asyncio.run(main())
+
+
+async def seed(db, as_shop):
+    """Same ids in both shops, different names"""
+    for shop in SHOPS:
+        await as_shop(shop, lambda: db.services.insert_many([
+            {"id": "corte", "name": f"Corte {shop}", "price": 50},
+            {"id": "barba", "name": f"Barba {shop}", "price": 30},
+        ]))
+
+
+async def names(db, as_shop, shop):
+    docs = await as_shop(shop, lambda: db.services.find({}, {"_id": 0}).to_list(None))
+    return sorted(d["name"] for d in docs)
+
+
+def test_find_and_count_see_one_shop():
+    async def scenario(db, as_shop):
+        await seed(db, as_shop)
+        return (
+            await names(db, as_shop, "shop-a"),
+            await as_shop("shop-b", lambda: db.services.find_one({"id": "corte"})),
+            await as_shop("shop-b", lambda: db.services.count_documents({})),
+            await as_shop("shop-c", lambda: db.services.count_documents({})),
+        )
+
+    found, one, count, empty = run(scenario)
+    assert found == ["Barba shop-a", "Corte shop-a"]
+    assert (one["name"], one["shop_id"]) == ("Corte shop-b", "shop-b")
+    assert (count, empty) == (2, 0)
+
+
+def test_aggregate_sees_one_shop():
+    async def scenario(db, as_shop):
+        await seed(db, as_shop)
+        pipeline = [{"$group": {"_id": None, "total": {"$sum": "$price"}, "n": {"$sum": 1}}}]
+        return [
+            await as_shop(shop, lambda: db.services.aggregate(pipeline).to_list(None))
+            for shop in SHOPS
+        ]
+
+    for rows in run(scenario):
+        assert [(r["total"], r["n"]) for r in rows] == [(80, 2)]
+
+
+class _Recorder:
+    """Stands in for a Motor collection: keeps the pipelines it is given"""
+
+    name = "appointments"
+
+    def __init__(self):
+        self.pipelines = []
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        self.pipelines.append(pipeline)
+
+
+@pytest.mark.parametrize("union", [
+    {"coll": "appointments_archive", "pipeline": [{"$match": {"status": "completed"}}]},
+    "appointments_archive",
+])
+def test_aggregate_scopes_union_with(union):
+    # mongomock não implementa $unionWith: confere o pipeline enviado
+    recorder = _Recorder()
+    with tenancy.using("shop-a"):
+        ScopedCollection(recorder).aggregate([{"$unionWith": union}, {"$count": "n"}])
+
+    [pipeline] = recorder.pipelines
+    scope = {"$match": {"shop_id": "shop-a"}}
+    assert pipeline[0] == scope
+    inner = pipeline[1]["$unionWith"]
+    assert inner["coll"] == "appointments_archive"
+    assert inner["pipeline"][0] == scope
+    assert pipeline[2] == {"$count": "n"}
+
+
+def test_bulk_write_touches_one_shop():
+    async def scenario(db, as_shop):
+        await seed(db, as_shop)
+        await as_shop("shop-a", lambda: db.services.bulk_write([
+            InsertOne({"id": "sobrancelha", "name": "Sobrancelha", "price": 20}),
+            UpdateOne({"id": "corte"}, {"$set": {"price": 60}}),
+            UpdateOne({"id": "pezinho"}, {"$set": {"name": "Pezinho"}}, upsert=True),
+            ReplaceOne({"id": "barba"}, {"id": "barba", "name": "Barba nova", "price": 35}),
+            DeleteMany({"price": {"$lt": 25}}),
+        ]))
+        docs = {}
+        for shop in SHOPS:
+            found = await as_shop(shop, lambda: db.services.find({}, {"_id": 0}).to_list(None))
+            docs[shop] = {d["id"]: d for d in found}
+        return docs
+
+    docs = run(scenario)
+    assert sorted(docs["shop-a"]) == ["barba", "corte", "pezinho"]
+    assert docs["shop-a"]["corte"]["price"] == 60
+    assert docs["shop-a"]["barba"]["name"] == "Barba nova"
+    assert all(d["shop_id"] == "shop-a" for d in docs["shop-a"].values())
+    # A outra loja, com os mesmos ids, não muda
+    assert docs["shop-b"] == {
+        "corte": {"id": "corte", "name": "Corte shop-b", "price": 50, "shop_id": "shop-b"},
+        "barba": {"id": "barba", "name": "Barba shop-b", "price": 30, "shop_id": "shop-b"},
+    }
+
+
+def test_upserts_create_one_document_per_shop():
+    async def scenario(db, as_shop):
+        for shop in SHOPS:
+            await as_shop(shop, lambda: db.clients.update_one(
+                {"phone": "11999990000"}, {"$inc": {"bookings": 1}}, upsert=True
+            ))
+        await as_shop("shop-a", lambda: db.clients.replace_one(
+            {"phone": "11888880000"}, {"phone": "11888880000", "name": "Bia"}, upsert=True
+        ))
+        return await db.unscoped.clients.find({}, {"_id": 0}).to_list(None)
+
+    docs = run(scenario)
+    assert sorted((d["shop_id"], d["phone"]) for d in docs) == [
+        ("shop-a", "11888880000"), ("shop-a", "11999990000"), ("shop-b", "11999990000")
+    ]
+
+
+def test_find_one_and_update_stays_in_its_shop():
+    async def scenario(db, as_shop):
+        await as_shop("shop-a", lambda: db.waitlist.insert_one({"id": "w1", "status": "waiting"}))
+        # Mesma chave, outra loja: nada encontrado, nada alterado
+        other = await as_shop("shop-b", lambda: db.waitlist.find_one_and_update(
+            {"id": "w1"}, {"$set": {"status": "offered"}}, return_document=ReturnDocument.AFTER
+        ))
+        upserted = await as_shop("shop-b", lambda: db.waitlist.find_one_and_update(
+            {"id": "w1"}, {"$set": {"status": "offered"}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        ))
+        mine = await as_shop("shop-a", lambda: db.waitlist.find_one({"id": "w1"}))
+        return other, upserted, mine
+
+    other, upserted, mine = run(scenario)
+    assert other is None
+    assert (upserted["shop_id"], upserted["status"]) == ("shop-b", "offered")
+    assert (mine["shop_id"], mine["status"]) == ("shop-a", "waiting")
+
+
+def test_api_keeps_shops_apart(api, shop, monkeypatch):
+    other = f"{shop}-2"
+    monkeypatch.setattr(tenancy, "SHOP_IDS", tenancy.SHOP_IDS | {other})
+    service = {"name": "Corte", "description": "", "price": 50, "duration": "30", "image": ""}
+
+    created = api.post("/api/services", json=service).json()
+
+    assert [s["id"] for s in api.get("/api/services").json()] == [created["id"]]
+    assert api.get("/api/services", headers={"X-Shop-Id": other}).json() == []
+    assert api.get(f"/api/services/{created['id']}", headers={"X-Shop-Id": other}).status_code == 404
+
+
+@pytest.mark.parametrize("shop_id, status_code", [
+    ("unknown-shop", 404),
+    ("Not a shop!", 400),
+    ("a" * 64, 400),
+])
+def test_api_rejects_unknown_shops(api, shop_id, status_code):
+    from storage import repository
+
+    response = api.get("/api/services", headers={"X-Shop-Id": shop_id})
+
+    assert response.status_code == status_code
+    # Recusada antes de criar estado para a loja
+    assert repository._storages.get(shop_id.strip().lower()) is None
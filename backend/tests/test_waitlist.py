@@ -0,0 +1,201 @@
+"""
+Waitlist matcher on the memory backend: offers on cancellation, held
+slots expiring or declined moving to the next entry, and Telegram
+callbacks racing each other.
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import telegram_bot
+import telegram_client
+import tenancy
+from models import Appointment, WaitlistEntry
+from routes import waitlist
+from storage import Repository, get_storage
+
+TOMORROW = (date.today() + timedelta(days=1)).isoformat()
+
+
+def run_as(shop: str, telegram, scenario):
+    async def main():
+        telegram_client.set_client(telegram[1])
+        with tenancy.using(shop):
+            return await scenario(Repository(get_storage()))
+    return asyncio.run(main())
+
+
+async def settle():
+    """Wait for the matchers started by cancellations (and the ones they start)"""
+    while waitlist._pending:
+        await asyncio.gather(*list(waitlist._pending))
+
+
+async def seed(repo: Repository, *clients: str) -> dict:
+    """Working hours, one 10:00 appointment tomorrow and `clients` waiting for it, in order"""
+    for day in range(7):
+        await repo.create_working_hours({
+            "id": str(day), "day_of_week": day, "start_time": "09:00",
+            "end_time": "12:00", "interval_minutes": 60, "active": True
+        })
+    await repo.create_service({
+        "id": "corte", "name": "Corte", "description": "", "price": 50.0,
+        "duration": "30", "image": "", "active": True
+    })
+    booked = Appointment(
+        client_name="Ana", client_phone="11999990000", service_id="corte",
+        date=TOMORROW, time="10:00", status="confirmed"
+    ).dict(exclude_none=True)
+    await repo.create_appointment(booked)
+
+    entries = {"appointment": booked["id"]}
+    for index, name in enumerate(clients):
+        entry = WaitlistEntry(
+            client_name=name, client_phone=f"1198888000{index}", telegram_chat_id=100 + index,
+            service_id="corte", date=TOMORROW, slots=["09:00", "10:00", "11:00"],
+            created_at=datetime.utcnow() + timedelta(seconds=index)
+        ).dict()
+        await repo.create_waitlist_entry(entry)
+        entries[name] = entry
+    return entries
+
+
+async def cancel(repo: Repository, appointment_id: str):
+    await repo.update_appointment(appointment_id, {"status": "cancelled"})
+    await settle()
+
+
+async def answer(entry: dict, choice: str, update_id: int = 1):
+    await telegram_bot.handle_update({
+        "update_id": update_id,
+        "callback_query": {
+            "id": f"cb{update_id}",
+            "from": {"id": entry["telegram_chat_id"]},
+            "message": {"chat": {"id": entry["telegram_chat_id"]}},
+            "data": f"wl:{choice}:{entry['id']}"
+        }
+    })
+    await settle()
+
+
+async def state(repo: Repository, entry: dict):
+    """(entry status, status of its held appointment)"""
+    current = [e async for e in repo.iter_waitlist() if e["id"] == entry["id"]][0]
+    hold = current.get("offer_appointment_id")
+    held = await repo.get_appointment(hold) if hold else None
+    return current["status"], held and held["status"]
+
+
+def sent_to(telegram, chat_id: int):
+    return [
+        payload["text"] for method, payload in telegram[0]
+        if method == "sendMessage" and payload["chat_id"] == chat_id
+    ]
+
+
+def test_cancellation_offers_the_slot_first_come_first_served(shop, storage, telegram):
+    async def scenario(repo):
+        entries = await seed(repo, "first", "second")
+        await cancel(repo, entries["appointment"])
+        return [await state(repo, entries[name]) for name in ("first", "second")]
+
+    first, second = run_as(shop, telegram, scenario)
+    assert first == ("offered", "held")
+    assert second == ("waiting", None)
+    assert "Vagou um horário" in sent_to(telegram, 100)[0]
+    assert sent_to(telegram, 101) == []
+
+
+def test_accepting_confirms_the_hold(shop, storage, telegram):
+    async def scenario(repo):
+        entries = await seed(repo, "first")
+        await cancel(repo, entries["appointment"])
+        await answer(entries["first"], "yes")
+        return await state(repo, entries["first"])
+
+    assert run_as(shop, telegram, scenario) == ("booked", "confirmed")
+    assert "confirmado" in sent_to(telegram, 100)[-1]
+
+
+def test_expired_hold_goes_to_the_next_entry(shop, storage, telegram):
+    async def scenario(repo):
+        entries = await seed(repo, "first", "second")
+        await cancel(repo, entries["appointment"])
+        # Oferta vencida: a varredura a expira e libera a reserva
+        await repo.update_waitlist_entry(
+            entries["first"]["id"], {"offer_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+        )
+        expired = await waitlist.expire_offers()
+        await settle()
+        # Resposta depois da expiração
+        await answer(entries["first"], "yes")
+        return expired, [await state(repo, entries[n]) for n in ("first", "second")]
+
+    expired, (first, second) = run_as(shop, telegram, scenario)
+    assert expired == 1
+    assert first == ("expired", "cancelled")
+    assert second == ("offered", "held")
+    assert sent_to(telegram, 100)[-2:] == [
+        "⌛ O horário reservado para você expirou.",
+        "Essa oferta não está mais disponível."
+    ]
+
+
+def test_decline_goes_to_the_next_entry(shop, storage, telegram):
+    async def scenario(repo):
+        entries = await seed(repo, "first", "second")
+        await cancel(repo, entries["appointment"])
+        await answer(entries["first"], "no")
+        return [await state(repo, entries[n]) for n in ("first", "second")]
+
+    first, second = run_as(shop, telegram, scenario)
+    assert first == ("declined", "cancelled")
+    assert second == ("offered", "held")
+
+
+def test_nobody_waiting_leaves_the_slot_free(shop, storage, telegram):
+    async def scenario(repo):
+        entries = await seed(repo)
+        await cancel(repo, entries["appointment"])
+        return await repo.booked_times(TOMORROW)
+
+    assert run_as(shop, telegram, scenario) == []
+
+
+def test_double_accept_books_once(shop, storage, telegram):
+    async def scenario(repo):
+        entries = await seed(repo, "first")
+        await cancel(repo, entries["appointment"])
+        await asyncio.gather(
+            answer(entries["first"], "yes", 1),
+            answer(entries["first"], "yes", 2)
+        )
+        return await state(repo, entries["first"])
+
+    assert run_as(shop, telegram, scenario) == ("booked", "confirmed")
+    messages = sent_to(telegram, 100)[1:]
+    assert sum("confirmado" in m for m in messages) == 1
+    assert messages.count("Essa oferta não está mais disponível.") == 1
+
+
+@pytest.mark.parametrize("order", [("yes", "no"), ("no", "yes")])
+def test_accept_and_decline_race(shop, storage, telegram, order):
+    async def scenario(repo):
+        entries = await seed(repo, "first", "second")
+        await cancel(repo, entries["appointment"])
+        await asyncio.gather(*(
+            answer(entries["first"], choice, index) for index, choice in enumerate(order)
+        ))
+        return [await state(repo, entries[n]) for n in ("first", "second")], \
+            await repo.booked_times(TOMORROW)
+
+    (first, second), booked = run_as(shop, telegram, scenario)
+    # Um dos dois vence, mas sempre de forma consistente
+    assert first in [("booked", "confirmed"), ("declined", "cancelled")]
+    if first[0] == "booked":
+        assert second == ("waiting", None)
+    else:
+        assert second == ("offered", "held")
+    # Um único agendamento ativo no horário
+    assert booked.count("10:00") == 1